@@ -0,0 +1,32 @@
+import argparse
+
+import gymnasium as gym
+
+import gym_lowcostrobot  # noqa
+from gym_lowcostrobot.inverse_kinematics import IKCache
+
+
+def do_build_ik_cache(env_id, path, num_samples, voxel_size, seed):
+    env = gym.make(env_id, observation_mode="state", action_mode="ee")
+    cache = IKCache.from_env(env, num_samples=num_samples, voxel_size=voxel_size, seed=seed)
+    cache.save(path)
+    print(f"Saved {cache.filled.sum()} configurations in {path}")
+    env.close()
+
+    # The cache is then given to the environments
+    env = gym.make(env_id, observation_mode="state", action_mode="ee", ik_cache=path)
+    env.reset()
+    env.step(env.action_space.sample())
+    env.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the inverse kinematics cache of the end effector.")
+    parser.add_argument("--env", type=str, default="LiftCube-v0", help="Environment id")
+    parser.add_argument("--path", type=str, default="ik_cache.npz", help="Path of the cache")
+    parser.add_argument("--num_samples", type=int, default=200_000, help="Number of sampled configurations")
+    parser.add_argument("--voxel_size", type=float, default=0.01, help="Size of the voxels")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the sampling")
+    args = parser.parse_args()
+
+    do_build_ik_cache(args.env, args.path, args.num_samples, args.voxel_size, args.seed)
@@ -27,7 +27,7 @@ def displace_object(data, m, object_id, viewer, square_size=0.2, invert_y=False,
 def do_simple_invk(robot_id="6dof", do_reset=False):
     if robot_id == "6dof":
         path_scene = "gym_lowcostrobot/assets/low_cost_robot_6dof/reach_cube.xml"
-        joint_name = "moving_side"
+        joint_name = "link_6"
         object_id = "cube"
         min_dist = 0.065
         max_dist = 0.35
@@ -42,6 +42,8 @@ def do_simple_invk(robot_id="6dof", do_reset=False):
 
     m.opt.timestep = 1 / 10000
 
+    g_ik = LevenbegMarquardtIK(m, data, tol=min_dist)
+
     with mujoco.viewer.launch_passive(m, data) as viewer:
         # Get the final position of the cube
         # displace_object(data, m, object_id, coef_sample, min_dist_obj, viewer)
@@ -52,8 +54,8 @@ def do_simple_invk(robot_id="6dof", do_reset=False):
         while viewer.is_running():
             step_start = time.time()
 
-            g_ik = LevenbegMarquardtIK(m, data, tol=min_dist)
-            g_ik.calculate(body_id=m.body(joint_name).id, goal=cube_pos, viewer=viewer)
+            info = g_ik.calculate(body_id=m.body(joint_name).id, goal=cube_pos, viewer=viewer)
+            print(f"IK: {info['iterations']} iterations, residual {info['residual']:.4f}")
 
             # Get the final position of the cube
             error = np.linalg.norm(np.subtract(cube_pos, data.body(m.body(joint_name).id).xpos))
@@ -10,35 +10,41 @@ BASE_LINK_NAME = "link_1"
 register(
     id="LiftCube-v0",
     entry_point="gym_lowcostrobot.envs:LiftCubeEnv",
+    vector_entry_point="gym_lowcostrobot.vector:LiftCubeVectorEnv",
     max_episode_steps=500,
 )
 
 register(
     id="PickPlaceCube-v0",
     entry_point="gym_lowcostrobot.envs:PickPlaceCubeEnv",
+    vector_entry_point="gym_lowcostrobot.vector:PickPlaceCubeVectorEnv",
     max_episode_steps=500,
 )
 
 register(
     id="PushCube-v0",
     entry_point="gym_lowcostrobot.envs:PushCubeEnv",
+    vector_entry_point="gym_lowcostrobot.vector:PushCubeVectorEnv",
     max_episode_steps=500,
 )
 
 register(
     id="ReachCube-v0",
     entry_point="gym_lowcostrobot.envs:ReachCubeEnv",
+    vector_entry_point="gym_lowcostrobot.vector:ReachCubeVectorEnv",
     max_episode_steps=500,
 )
 
 register(
     id="StackTwoCubes-v0",
     entry_point="gym_lowcostrobot.envs:StackTwoCubesEnv",
+    vector_entry_point="gym_lowcostrobot.vector:StackTwoCubesVectorEnv",
     max_episode_steps=500,
 )
 
 register(
     id="PushCubeLoop-v0",
     entry_point="gym_lowcostrobot.envs:PushCubeLoopEnv",
+    vector_entry_point="gym_lowcostrobot.vector:PushCubeLoopVectorEnv",
     max_episode_steps=500,
 )
@@ -0,0 +1,180 @@
+import glob
+import os
+
+import h5py
+import numpy as np
+
+# Number of frames copied at once by `consolidate_hdf5`
+COPY_BLOCK_LENGTH = 256
+
+
+def consolidate_hdf5(src_path, dst_path, block_length=COPY_BLOCK_LENGTH):
+    """
+    Rewrite a recorded HDF5 file with contiguous, uncompressed datasets, so that `HDF5Dataset` can memory map them.
+
+    The recorders write chunked (and possibly compressed) datasets, which can only be read through h5py. The datasets
+    are copied by blocks of frames, without loading them entirely in memory.
+
+    :param src_path: str, path of the recorded file
+    :param dst_path: str, path of the consolidated file
+    :param block_length: int, number of frames copied at once
+    """
+    with h5py.File(src_path, "r") as src, h5py.File(dst_path, "w") as dst:
+        names = []
+        src.visititems(lambda name, item: names.append(name) if isinstance(item, h5py.Dataset) else None)
+        for name in names:
+            src_dataset = src[name]
+            dst_dataset = dst.create_dataset(name, shape=src_dataset.shape, dtype=src_dataset.dtype)
+            for start in range(0, len(src_dataset), block_length):
+                dst_dataset[start : start + block_length] = src_dataset[start : start + block_length]
+
+
+class HDF5Dataset:
+    """
+    ## Description
+
+    Reader of the HDF5 files recorded by `RecordHDF5Wrapper`, one or several episodes per file.
+
+    Only the episode index of each file is read at init. The datasets are opened lazily, at the first access in each
+    process, so the reader can be given to the workers of a PyTorch `DataLoader` (it is picklable and does not share
+    file handles between processes). The contiguous, uncompressed datasets (see `consolidate_hdf5`) are memory mapped:
+    the episodes and windows are then numpy views on the file and only the accessed pages are read from the disk. The
+    chunked datasets written while recording are read through h5py, one slice per access.
+
+    Indexing the reader returns the windows of `window_length` consecutive frames of all the episodes, so it can be
+    used as a map-style PyTorch dataset.
+
+    ## Arguments
+
+    - `paths (str or list)`: an HDF5 file, a folder of HDF5 files, or a list of files.
+    - `keys (list)`: the datasets to read, e.g. `["observations/qpos", "action"]`, default is None for all the
+        datasets.
+    - `window_length (int)`: the number of frames of the windows returned by indexing, default is 1.
+    """
+
+    def __init__(self, paths, keys=None, window_length=1):
+        if isinstance(paths, (str, os.PathLike)):
+            paths = sorted(glob.glob(os.path.join(paths, "*.hdf5"))) if os.path.isdir(paths) else [paths]
+        self.paths = [os.fspath(path) for path in paths]
+        if not self.paths:
+            raise ValueError("No HDF5 file to read")
+        self.window_length = window_length
+
+        # Read the episode index of each file, the episodes being (file index, start, end)
+        episodes = []
+        for file_index, path in enumerate(self.paths):
+            with h5py.File(path, "r") as file:
+                if keys is None and file_index == 0:
+                    keys = []
+                    file.visititems(
+                        lambda name, item, keys=keys: (
+                            keys.append(name) if isinstance(item, h5py.Dataset) and name != "episode_index" else None
+                        )
+                    )
+                if "episode_index" in file:
+                    episode_index = file["episode_index"][:]
+                else:
+                    episode_index = np.array([[0, len(file[keys[0]])]])
+            episodes.extend((file_index, start, end) for start, end in episode_index)
+        self.keys = list(keys)
+        self.episodes = np.array(episodes, dtype=np.int64).reshape(-1, 3)
+        self.episode_lengths = self.episodes[:, 2] - self.episodes[:, 1]
+
+        # Windows of each episode, the i-th window of the reader being in the episode `searchsorted(cumulative, i)`
+        num_windows = np.maximum(self.episode_lengths - window_length + 1, 0)
+        self.cumulative_windows = np.cumsum(num_windows)
+
+        self._pid = None
+        self._files = []
+        self._arrays = []
+
+    def __getstate__(self):
+        # The files are opened again by each process
+        state = self.__dict__.copy()
+        state.update(_pid=None, _files=[], _arrays=[])
+        return state
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._files = []
+        self._arrays = []
+        for path in self.paths:
+            file = h5py.File(path, "r")
+            arrays = {}
+            for key in self.keys:
+                dataset = file[key]
+                offset = dataset.id.get_offset()
+                if dataset.chunks is None and dataset.compression is None and offset is not None:
+                    arrays[key] = np.memmap(path, dtype=dataset.dtype, mode="r", offset=offset, shape=dataset.shape)
+                else:
+                    arrays[key] = dataset
+            self._files.append(file)
+            self._arrays.append(arrays)
+
+    @property
+    def num_episodes(self):
+        return len(self.episodes)
+
+    def is_memory_mapped(self, key):
+        """Whether a dataset is memory mapped in all the files."""
+        self._open()
+        return all(isinstance(arrays[key], np.memmap) for arrays in self._arrays)
+
+    def get_window(self, episode, t, length):
+        """
+        Get the frames `t` to `t + length` of an episode.
+
+        :param episode: int, index of the episode
+        :param t: int, index of the first frame in the episode
+        :param length: int, number of frames
+        :return: dict of arrays of shape (length, *shape), read-only views on the file for the memory mapped datasets
+        """
+        self._open()
+        file_index, start, end = self.episodes[episode]
+        if t < 0 or start + t + length > end:
+            raise IndexError(f"Invalid window [{t}, {t + length}) of episode {episode} of length {end - start}")
+        arrays = self._arrays[file_index]
+        return {key: arrays[key][start + t : start + t + length] for key in self.keys}
+
+    def get_episode(self, episode):
+        """
+        Get all the frames of an episode.
+
+        :param episode: int, index of the episode
+        :return: dict of arrays of shape (episode length, *shape)
+        """
+        return self.get_window(episode, 0, self.episode_lengths[episode])
+
+    def __len__(self):
+        return int(self.cumulative_windows[-1]) if len(self.cumulative_windows) else 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Index {index} out of range for {len(self)} windows")
+        episode = int(np.searchsorted(self.cumulative_windows, index, side="right"))
+        t = index - (self.cumulative_windows[episode - 1] if episode > 0 else 0)
+        return self.get_window(episode, int(t), self.window_length)
+
+    def sample(self, batch_size, rng=None):
+        """
+        Sample random windows of `window_length` frames, uniformly over all the windows.
+
+        :param batch_size: int, number of windows
+        :param rng: numpy random generator, default is a new unseeded generator
+        :return: dict of arrays of shape (batch_size, window_length, *shape)
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        indices = rng.integers(0, len(self), size=batch_size)
+        windows = [self[int(index)] for index in indices]
+        return {key: np.stack([window[key] for window in windows]) for key in self.keys}
+
+    def close(self):
+        for file in self._files:
+            file.close()
+        self._pid = None
+        self._files = []
+        self._arrays = []
@@ -0,0 +1,489 @@
+import os
+
+import gymnasium as gym
+import mujoco
+import mujoco.viewer
+import numpy as np
+from gymnasium import Env, spaces
+
+from gym_lowcostrobot import ASSETS_PATH, BASE_LINK_NAME
+from gym_lowcostrobot.inverse_kinematics import BatchedInverseKinematics, IKCache
+from gym_lowcostrobot.model_cache import load_model
+from gym_lowcostrobot.rendering import DEFAULT_IMAGE_HEIGHT, DEFAULT_IMAGE_WIDTH, get_renderer, release_renderer
+
+# Limits of the target joint positions in the "joint" action mode
+JOINT_TARGET_LOW = np.array([-3.14159, -1.5708, -1.48353, -1.91986, -2.96706, -1.74533])
+JOINT_TARGET_HIGH = np.array([3.14159, 1.22173, 1.74533, 1.91986, 2.96706, 0.0523599])
+
+
+class BaseLowCostRobotEnv(Env):
+    """
+    ## Description
+
+    Base class of the low cost robot environments. It loads the scene, builds the action and observation spaces,
+    applies the actions (with inverse kinematics in the "ee" mode), computes the observations and renders the cameras.
+    The tasks implement the sampling of the objects at reset, their own observation keys and the reward.
+
+    All the names are resolved once at init into an index table (body, camera and joint ids, qpos and qvel addresses),
+    and the hot paths only use the views created on the simulation data:
+
+    - `arm_qpos`, `arm_qvel`: the joint positions and velocities of the arm, shape (6,)
+    - `ee_pos`: the position of the end effector body, shape (3,)
+    - `object_qpos[name]`: the free joint position and orientation of an object, shape (7,)
+    - `object_pos[name]`: the position of an object, shape (3,)
+
+    These views stay valid for the lifetime of the environment and always reflect the current state of `data`.
+
+    ## Snapshots
+
+    `get_state` returns the complete state of the environment as a flat array: the physics state given by
+    `mj_getState` (time, qpos, qvel, act, warmstart, controls, ...) followed by the state sampled by the task at reset
+    (e.g. `target_pos`). `set_state` restores it in place, without compiling the model again, so that stepping from a
+    restored state gives the same results as stepping from the original one.
+
+    ## Reward
+
+    The tasks declare their reward as a `RewardSpec` (`reward_spec` class attribute), a sum of terms on named bodies,
+    sites and goals (`get_goals`). The spec is compiled to array indices at init and evaluated in a single vectorized
+    pass, shared with the batched vector environments. A different spec can be given with the `reward_spec` argument
+    to change the task without a new environment class. Tasks with a reward which does not fit in a spec override
+    `compute_reward` instead.
+
+    The spec also declares the success criteria of the task. The success of each step is reported in
+    `info["is_success"]`, and the episode terminates as soon as the task is successful, unless `terminate_on_success`
+    is False, so that solved episodes do not keep simulating and rendering until the time limit.
+
+    ## Rendering
+
+    The cameras are rendered with the renderer shared by all the environments of the scene in the process (see
+    `gym_lowcostrobot.rendering`), created at the first rendering: a single GL context and framebuffer are created
+    whatever the number of cameras and environments, with the OpenGL backend given by `render_backend`.
+
+    The images are rendered at their size (`image_size`), in a single pass per size, so that no pixel is rendered to be
+    resized or cropped afterwards.
+
+    ## Arguments
+
+    See the documentation of the environments.
+    """
+
+    metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 200}
+
+    # Scene file in the assets folder, the end effector body and the bodies with a free joint
+    scene_file = None
+    ee_body_name = "link_6"
+    object_body_names = ["cube"]
+
+    # Weight of the regularization toward the home position in the inverse kinematics
+    nullspace_weight = 0.0
+
+    # Default maximum number of iterations and tolerance of the inverse kinematics when solved to convergence
+    ik_max_iterations = 20
+    ik_tolerance = 1e-3
+
+    # Elements of the physics state saved by `get_state`, everything needed to integrate the simulation exactly
+    state_spec = mujoco.mjtState.mjSTATE_INTEGRATION
+
+    # Reward and success criteria of the task, see `RewardSpec`, and the names of the goals they may refer to
+    reward_spec = None
+    goal_names = ()
+
+    def __init__(
+        self,
+        observation_mode="image",
+        action_mode="joint",
+        render_mode=None,
+        reuse_buffers=False,
+        cameras=None,
+        observation_keys=None,
+        render_every=1,
+        ik_cache=None,
+        ik_iterations=None,
+        ik_tol=None,
+        reward_spec=None,
+        terminate_on_success=None,
+        render_backend=None,
+        image_size=None,
+    ):
+        # Load the MuJoCo model, compiled once and copied for each environment, and the data
+        self.scene_path = os.path.join(ASSETS_PATH, self.scene_file)
+        self.model = load_model(self.scene_path)
+        self.data = mujoco.MjData(self.model)
+
+        # Resolve the ids and addresses once and create the views used by the hot paths
+        self.nb_dof = 6
+        self.build_index_table()
+        self.ik_solver = BatchedInverseKinematics(
+            self.model, [self.data], self.ee_id, self.arm_qpos_adr, self.arm_qvel_adr, nb_dof=self.nb_dof
+        )
+        if isinstance(ik_cache, (str, os.PathLike)):
+            ik_cache = IKCache.load(ik_cache)
+        self.ik_cache = ik_cache
+        # The inverse kinematics of the "ee" action mode take a single damped step, unless solved to convergence
+        if ik_cache is not None or ik_iterations is not None or ik_tol is not None:
+            self.ik_step = 1.0
+            self.ik_iterations = self.ik_max_iterations if ik_iterations is None else ik_iterations
+            self.ik_tol = self.ik_tolerance if ik_tol is None else ik_tol
+        else:
+            self.ik_step = 0.2
+            self.ik_iterations = 1
+            self.ik_tol = None
+        self.physics_state_size = mujoco.mj_stateSize(self.model, self.state_spec)
+
+        # Resolve the reward terms to array indices once
+        if reward_spec is not None:
+            self.reward_spec = reward_spec
+        self.compiled_reward = None
+        if self.reward_spec is not None:
+            self.compiled_reward = self.reward_spec.compile(self.model, self.object_qpos_adr, self.goal_names)
+        if terminate_on_success is None:
+            terminate_on_success = self.reward_spec is not None and self.reward_spec.terminate_on_success
+        self.terminate_on_success = terminate_on_success
+
+        # Set the action space
+        self.action_mode = action_mode
+        action_shape = {"joint": 6, "ee": 4}[action_mode]
+        self.action_space = spaces.Box(low=-1.0, high=1.0, shape=(action_shape,), dtype=np.float32)
+
+        # Set the observations space
+        self.observation_mode = observation_mode
+        if cameras is None:
+            cameras = ["camera_front", "camera_top"]
+        self.image_sizes = self.get_image_sizes(cameras, image_size)
+        observation_subspaces = {
+            "arm_qpos": spaces.Box(low=-np.pi, high=np.pi, shape=(6,)),
+            "arm_qvel": spaces.Box(low=-10.0, high=10.0, shape=(6,)),
+            **self.get_goal_observation_subspaces(),
+        }
+        if self.observation_mode in ["image", "both"]:
+            for camera in cameras:
+                observation_subspaces[camera.replace("camera_", "image_", 1)] = spaces.Box(
+                    0, 255, shape=self.image_sizes[camera] + (3,), dtype=np.uint8
+                )
+        if self.observation_mode in ["state", "both"]:
+            observation_subspaces.update(self.get_task_observation_subspaces())
+        if observation_keys is not None:
+            unknown_keys = set(observation_keys) - set(observation_subspaces)
+            if unknown_keys:
+                raise ValueError(
+                    f"Invalid observation keys {sorted(unknown_keys)}, must be in {list(observation_subspaces)}"
+                )
+            observation_subspaces = {key: observation_subspaces[key] for key in observation_keys}
+        self.observation_space = gym.spaces.Dict(observation_subspaces)
+
+        # Only render the cameras whose image is observed
+        self.camera_keys = {}
+        self.camera_ids = []
+        for camera in cameras:
+            camera_id = self.model.camera(camera).id  # raises a KeyError if the camera does not exist
+            key = camera.replace("camera_", "image_", 1)
+            if key in self.observation_space.spaces:
+                self.camera_keys[camera] = key
+                self.camera_ids.append((camera_id, key))
+        # The cameras with the same image size are rendered together
+        self.camera_groups = {}
+        for camera, key in self.camera_keys.items():
+            self.camera_groups.setdefault(self.image_sizes[camera], []).append((self.model.camera(camera).id, key))
+        # The cameras of all the environments of the scene share a renderer, created at the first rendering
+        self.render_backend = render_backend
+        self.renderer = None
+        self.render_every = render_every
+        self.image_step = 0
+
+        # Set the observation buffers, filled in place at each step if requested
+        self.reuse_buffers = reuse_buffers
+        self.observation_buffers = self.allocate_observation() if reuse_buffers else None
+
+        # Set the render utilities
+        assert render_mode is None or render_mode in self.metadata["render_modes"]
+        self.render_mode = render_mode
+        if self.render_mode == "human":
+            self.viewer = mujoco.viewer.launch_passive(self.model, self.data)
+            self.viewer.cam.azimuth = -75
+            self.viewer.cam.distance = 1
+        elif self.render_mode == "rgb_array":
+            self.rgb_array_camera_id = self.model.camera("camera_vizu").id
+
+        self.control_decimation = 4  # number of simulation steps per control step
+
+    def get_image_sizes(self, cameras, image_size):
+        """
+        Resolve the size of the image of each camera.
+
+        :param cameras: list of the camera names
+        :param image_size: tuple (height, width) for all the cameras, or dict of (height, width) by camera name, the
+            other cameras having the default size, or None for the default size (240, 320)
+        :return: dict of (height, width) by camera name
+        """
+        default_size = (DEFAULT_IMAGE_HEIGHT, DEFAULT_IMAGE_WIDTH)
+        if isinstance(image_size, dict):
+            unknown_cameras = set(image_size) - set(cameras)
+            if unknown_cameras:
+                raise ValueError(f"Invalid image size of cameras {sorted(unknown_cameras)}, must be in {cameras}")
+            image_sizes = {camera: tuple(image_size.get(camera, default_size)) for camera in cameras}
+        else:
+            image_sizes = {camera: tuple(image_size or default_size) for camera in cameras}
+
+        # The images are rendered in the offscreen framebuffer of the model
+        max_size = (self.model.vis.global_.offheight, self.model.vis.global_.offwidth)
+        for camera, (height, width) in image_sizes.items():
+            if not (0 < height <= max_size[0] and 0 < width <= max_size[1]):
+                raise ValueError(
+                    f"Invalid image size {(height, width)} of camera '{camera}', must be at most {max_size}"
+                )
+        return image_sizes
+
+    def build_index_table(self):
+        """Resolve the body and joint names into ids and qpos/qvel addresses, and create the views on the data."""
+        self.ee_id = self.model.body(self.ee_body_name).id
+
+        # The arm joints are consecutive, starting at the joint of the base link
+        arm_joint_id = self.model.body(BASE_LINK_NAME).jntadr[0]
+        self.arm_qpos_adr = self.model.jnt_qposadr[arm_joint_id]
+        self.arm_qvel_adr = self.model.jnt_dofadr[arm_joint_id]
+
+        # Each object has a free joint, with 7 values in qpos and 6 in qvel
+        self.object_qpos_adr = {}
+        self.object_qvel_adr = {}
+        for name in self.object_body_names:
+            joint_id = self.model.body(name).jntadr[0]
+            self.object_qpos_adr[name] = self.model.jnt_qposadr[joint_id]
+            self.object_qvel_adr[name] = self.model.jnt_dofadr[joint_id]
+
+        self.create_views()
+
+    def create_views(self):
+        """Create the views on the simulation data, see the class documentation."""
+        self.arm_qpos = self.data.qpos[self.arm_qpos_adr : self.arm_qpos_adr + self.nb_dof]
+        self.arm_qvel = self.data.qvel[self.arm_qvel_adr : self.arm_qvel_adr + self.nb_dof]
+        self.ee_pos = self.data.xpos[self.ee_id]
+        self.object_qpos = {name: self.data.qpos[adr : adr + 7] for name, adr in self.object_qpos_adr.items()}
+        self.object_pos = {name: qpos[:3] for name, qpos in self.object_qpos.items()}
+
+    def get_goal_observation_subspaces(self):
+        """Observation subspaces of the task observed in every observation mode."""
+        return {}
+
+    def get_task_observation_subspaces(self):
+        """Observation subspaces of the task observed in the "state" and "both" observation modes."""
+        return {}
+
+    def fill_task_observation(self, observation):
+        """Fill the task keys of the observation, only the keys present in `observation` must be computed."""
+
+    def reset_task(self):
+        """Sample the objects and goals of the task, the robot being at its initial position."""
+
+    def get_goals(self):
+        """Goals of the task the reward spec refers to, e.g. the target position, as a dict of arrays by name."""
+        return {}
+
+    def sample_target_pos(self, rng, cube_pos):
+        """
+        Sample the target position of the tasks with a target region, between `target_low` and `target_high`, and out
+        of the reach of the `target_region_id` geom (plus a 1 cm margin) from the cube along x and y, so that the task
+        is not solved at reset.
+
+        :param rng: np.random.Generator
+        :param cube_pos: array of shape (3,), the position of the cube
+        :return: array of shape (3,)
+        """
+        min_distance = self.model.geom_rbound[self.target_region_id] + 0.01
+        while True:
+            target_pos = rng.uniform(self.target_low, self.target_high)
+            if np.linalg.norm(target_pos[:2] - cube_pos[:2]) > min_distance:
+                return target_pos
+
+    def evaluate_reward(self):
+        """
+        Compute the reward of the current state and whether the task is successful.
+
+        :return: the reward (float) and the success (bool)
+        """
+        if self.compiled_reward is None:
+            return self.compute_reward(), False
+        rewards, successes = self.compiled_reward(
+            self.data.qpos[None], self.data.xpos[None], self.data.site_xpos[None], self.get_goals()
+        )
+        return float(rewards[0]), bool(successes[0])
+
+    def compute_reward(self):
+        """Compute the reward of the current state, from the reward spec of the task by default."""
+        if self.compiled_reward is None:
+            raise NotImplementedError
+        return self.evaluate_reward()[0]
+
+    def get_task_state(self):
+        """State of the task which is not part of the simulation, e.g. the target position, as a flat array."""
+        return np.zeros(0)
+
+    def set_task_state(self, task_state):
+        """Restore the state of the task returned by `get_task_state`."""
+
+    def get_state(self):
+        """
+        Get a snapshot of the environment, see the class documentation.
+
+        :return: numpy array of shape (physics_state_size + task state size,)
+        """
+        physics_state = np.empty(self.physics_state_size)
+        mujoco.mj_getState(self.model, self.data, physics_state, self.state_spec)
+        return np.concatenate([physics_state, self.get_task_state()])
+
+    def set_state(self, state):
+        """
+        Restore a snapshot returned by `get_state`.
+
+        :param state: numpy array returned by `get_state`
+        """
+        state = np.asarray(state, dtype=np.float64)
+        expected_size = self.physics_state_size + len(self.get_task_state())
+        if state.shape != (expected_size,):
+            raise ValueError(f"Invalid state shape {state.shape}, must be ({expected_size},)")
+        mujoco.mj_setState(self.model, self.data, state[: self.physics_state_size], self.state_spec)
+        self.set_task_state(state[self.physics_state_size :])
+
+        # Update the derived quantities (e.g. body positions) and render the images of the next observation
+        mujoco.mj_forward(self.model, self.data)
+        self.image_step = 0
+
+    def inverse_kinematics(
+        self, ee_target_pos, step=0.2, regularization=1e-6, home_position=None, num_iterations=1, tol=None
+    ):
+        """
+        Computes the inverse kinematics for a robotic arm to reach the target end effector position.
+
+        :param ee_target_pos: numpy array of target end effector position [x, y, z]
+        :param step: float, step size for the iteration
+        :param regularization: float, regularization factor for the pseudoinverse computation
+        :param home_position: numpy array of home joint positions to regularize towards, used if `nullspace_weight`
+            is not zero
+        :param num_iterations: int, maximum number of iterations
+        :param tol: float, tolerance on the distance to the target, default is None to run all the iterations
+        :return: numpy array of target joint positions
+        """
+        target_qpos = self.ik_solver.solve(
+            ee_target_pos[None],
+            step=step,
+            regularization=regularization,
+            home_position=home_position,
+            nullspace_weight=self.nullspace_weight,
+            num_iterations=num_iterations,
+            tol=tol,
+            ik_cache=self.ik_cache,
+        )
+        return target_qpos[0].copy()
+
+    def apply_action(self, action):
+        """
+        Step the simulation forward based on the action
+
+        Action shape
+        - EE mode: [dx, dy, dz, gripper]
+        - Joint mode: [q1, q2, q3, q4, q5, q6, gripper]
+        """
+        if self.action_mode == "ee":
+            ee_action, gripper_action = action[:3], action[-1]
+
+            # Use inverse kinematics to get the joint action wrt the end effector current position and displacement
+            target_qpos = self.inverse_kinematics(
+                ee_target_pos=self.ee_pos + ee_action,
+                step=self.ik_step,
+                num_iterations=self.ik_iterations,
+                tol=self.ik_tol,
+            )
+            target_qpos[-1:] = gripper_action
+        elif self.action_mode == "joint":
+            target_qpos = np.clip(action, JOINT_TARGET_LOW, JOINT_TARGET_HIGH)
+        else:
+            raise ValueError("Invalid action mode, must be 'ee' or 'joint'")
+
+        # Set the target position
+        self.data.ctrl[:] = target_qpos
+
+        # Step the simulation forward
+        for _ in range(self.control_decimation):
+            mujoco.mj_step(self.model, self.data)
+            if self.render_mode == "human":
+                self.viewer.sync()
+
+    def get_renderer(self):
+        """Get the renderer shared by the environments of the scene, see `gym_lowcostrobot.rendering`."""
+        if self.renderer is None:
+            self.renderer = get_renderer(self.model, key=self.scene_path, backend=self.render_backend)
+        return self.renderer
+
+    def allocate_observation(self):
+        """Allocate the arrays of an observation, to be filled by `get_observation`."""
+        return {key: np.empty(space.shape, dtype=space.dtype) for key, space in self.observation_space.items()}
+
+    def get_observation(self):
+        observation = self.observation_buffers if self.reuse_buffers else self.allocate_observation()
+        if "arm_qpos" in observation:
+            observation["arm_qpos"][:] = self.arm_qpos
+        if "arm_qvel" in observation:
+            observation["arm_qvel"][:] = self.arm_qvel
+        self.fill_task_observation(observation)
+        self.render_cameras(observation)
+        return observation
+
+    def render_cameras(self, observation):
+        """Render the observed cameras into the observation, or repeat the last images between two renderings."""
+        if not self.camera_ids:
+            return
+        if self.image_step % self.render_every == 0:
+            # The cameras are rendered at the size of their image, in a single pass per size, directly into the
+            # observation
+            for (height, width), cameras in self.camera_groups.items():
+                camera_ids = [camera_id for camera_id, _ in cameras]
+                images = [observation[key] for _, key in cameras]
+                self.get_renderer().render_batch(
+                    self.model, [self.data], camera_ids, height=height, width=width, out=[images]
+                )
+            self.last_images = {key: observation[key] for _, key in self.camera_ids}
+        else:
+            for key, image in self.last_images.items():
+                if observation[key] is not image:
+                    observation[key][:] = image
+        self.image_step += 1
+
+    def reset(self, seed=None, options=None):
+        # We need the following line to seed self.np_random
+        super().reset(seed=seed, options=options)
+        self.image_step = 0
+
+        # Reset the simulation and the robot to the initial position, then sample the task
+        mujoco.mj_resetData(self.model, self.data)
+        self.arm_qpos[:] = 0.0
+        self.reset_task()
+
+        # Step the simulation
+        mujoco.mj_forward(self.model, self.data)
+
+        return self.get_observation(), {}
+
+    def step(self, action):
+        # Perform the action and step the simulation
+        self.apply_action(action)
+
+        # Get the new observation
+        observation = self.get_observation()
+
+        # Compute the reward, and terminate when the task is successful if requested
+        reward, success = self.evaluate_reward()
+        terminated = success and self.terminate_on_success
+        return observation, reward, terminated, False, {"is_success": success}
+
+    def render(self):
+        if self.render_mode == "human":
+            self.viewer.sync()
+        elif self.render_mode == "rgb_array":
+            return self.get_renderer().render(self.model, self.data, self.rgb_array_camera_id, height=640, width=640)
+
+    def close(self):
+        if self.render_mode == "human":
+            self.viewer.close()
+        # The shared renderer is freed once all the environments of the scene using it are closed
+        if self.renderer is not None:
+            release_renderer(self.renderer)
+            self.renderer = None
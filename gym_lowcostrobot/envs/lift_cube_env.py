@@ -1,15 +1,11 @@
-import os
-
-import gymnasium as gym
-import mujoco
-import mujoco.viewer
 import numpy as np
-from gymnasium import Env, spaces
+from gymnasium import spaces
 
-from gym_lowcostrobot import ASSETS_PATH, BASE_LINK_NAME
+from gym_lowcostrobot.envs.base_env import BaseLowCostRobotEnv
+from gym_lowcostrobot.rewards import Distance, Height, RewardSpec
 
 
-class LiftCubeEnv(Env):
+class LiftCubeEnv(BaseLowCostRobotEnv):
     """
     ## Description
 
@@ -45,8 +41,8 @@ class LiftCubeEnv(Env):
 
     - `"arm_qpos"`: the joint angles of the robot arm in radians, shape (6,)
     - `"arm_qvel"`: the joint velocities of the robot arm in radians per second, shape (6,)
-    - `"image_front"`: the front image of the camera of size (240, 320, 3)
-    - `"image_top"`: the top image of the camera of size (240, 320, 3)
+    - `"image_front"`: the front image of the camera of size (240, 320, 3) by default, see `image_size`
+    - `"image_top"`: the top image of the camera of size (240, 320, 3) by default, see `image_size`
     - `"cube_pos"`: the position of the cube, as (x, y, z)
 
     Three observation modes are available: "image" (default), "state", and "both".
@@ -61,8 +57,10 @@ class LiftCubeEnv(Env):
 
     ## Reward
 
-    The reward is the sum of two terms: the height of the cube above the threshold and the negative distance between the
-    end effector and the cube.
+    The reward is the sum of two terms: the height of the cube above the threshold and the negative distance between
+    the end effector and the cube.
+
+    The task is successful when the cube is lifted 10 cm above the ground.
 
     ## Arguments
 
@@ -70,209 +68,63 @@ class LiftCubeEnv(Env):
         section "Observation space".
     - `action_mode (str)`: the action mode, can be "joint" or "ee", default is "joint", see section "Action space".
     - `render_mode (str)`: the render mode, can be "human" or "rgb_array", default is None.
+    - `reuse_buffers (bool)`: if True, the observation arrays are allocated once and filled in place at each step, the
+        images being rendered directly into them. The observation returned by `reset` and `step` is then overwritten by
+        the next call to `reset` or `step`, copy it to keep it. Default is False.
+    - `cameras (list)`: the cameras rendered in the "image" and "both" observation modes, default is
+        ["camera_front", "camera_top"]. The image of the camera `"camera_<name>"` is observed as `"image_<name>"`.
+    - `observation_keys (list)`: the observation keys to compute, default is None for all the keys of the observation
+        mode. The keys which are not selected are not computed, and the cameras whose image is not selected are not
+        rendered.
+    - `render_every (int)`: render the camera images every `render_every` steps and repeat the last images in between,
+        default is 1.
+    - `ik_cache (IKCache or str)`: cache of inverse kinematics solutions, or path of a saved cache, default is None.
+        If given, the inverse kinematics of the "ee" action mode is solved to convergence, warm started from the cached
+        solution of the target when it is closer than the current joint positions.
+    - `ik_iterations (int)`: the maximum number of iterations of the inverse kinematics of the "ee" action mode,
+        default is None for a single damped step toward the target, or 20 when solved to convergence. If given, or if
+        `ik_tol` or `ik_cache` is given, the inverse kinematics is solved to convergence with full steps, until the end
+        effector is within `ik_tol` of the target or `ik_iterations` iterations are done.
+    - `ik_tol (float)`: the distance to the target below which the inverse kinematics of the "ee" action mode stops
+        iterating, default is None for 1e-3 when solved to convergence, see `ik_iterations`.
+    - `reward_spec (RewardSpec)`: the reward and success criteria, default is None for the reward of the task, see
+        section "Reward".
+    - `terminate_on_success (bool)`: whether the episode terminates when the task is successful, default is None for
+        True, the success criteria of the reward spec, see section "Reward".
+    - `render_backend (str)`: the OpenGL backend rendering the cameras, "egl", "osmesa" or "glfw", default is None for
+        the `MUJOCO_GL` environment variable if set, else EGL (falling back to OSMesa) on headless machines. The
+        cameras of all the environments of a process share a single GL context and renderer per scene, see
+        `gym_lowcostrobot.rendering`.
+    - `image_size (tuple or dict)`: the (height, width) of the camera images, or a dict of (height, width) by camera
+        name for per-camera sizes, the other cameras keeping the default size (240, 320). The images are rendered at
+        this size directly, at most the offscreen buffer size of the scene (640, 640).
     """
 
-    metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 200}
-
-    def __init__(self, observation_mode="image", action_mode="joint", render_mode=None):
-        # Load the MuJoCo model and data
-        self.model = mujoco.MjModel.from_xml_path(os.path.join(ASSETS_PATH, "lift_cube.xml"), {})
-        self.data = mujoco.MjData(self.model)
-
-        # Set the action space
-        self.action_mode = action_mode
-        action_shape = {"joint": 6, "ee": 4}[action_mode]
-        self.action_space = spaces.Box(low=-1.0, high=1.0, shape=(action_shape,), dtype=np.float32)
-
-        self.nb_dof = 6
+    scene_file = "lift_cube.xml"
+    # Height of the cube above the threshold plus the negative distance between the end effector and the cube
+    reward_spec = RewardSpec(
+        [Height("cube", threshold=0.5), Distance("link_6", "cube")],
+        success=[Height("cube", threshold=0.1)],
+        terminate_on_success=True,
+    )
 
-        # Set the observations space
-        self.observation_mode = observation_mode
-        observation_subspaces = {
-            "arm_qpos": spaces.Box(low=-np.pi, high=np.pi, shape=(6,)),
-            "arm_qvel": spaces.Box(low=-10.0, high=10.0, shape=(6,)),
-        }
-        if self.observation_mode in ["image", "both"]:
-            observation_subspaces["image_front"] = spaces.Box(0, 255, shape=(240, 320, 3), dtype=np.uint8)
-            observation_subspaces["image_top"] = spaces.Box(0, 255, shape=(240, 320, 3), dtype=np.uint8)
-            self.renderer = mujoco.Renderer(self.model)
-        if self.observation_mode in ["state", "both"]:
-            observation_subspaces["cube_pos"] = spaces.Box(low=-10.0, high=10.0, shape=(3,))
-        self.observation_space = gym.spaces.Dict(observation_subspaces)
-
-        # Set the render utilities
-        assert render_mode is None or render_mode in self.metadata["render_modes"]
-        self.render_mode = render_mode
-        if self.render_mode == "human":
-            self.viewer = mujoco.viewer.launch_passive(self.model, self.data)
-            self.viewer.cam.azimuth = -75
-            self.viewer.cam.distance = 1
-        elif self.render_mode == "rgb_array":
-            self.rgb_array_renderer = mujoco.Renderer(self.model, height=640, width=640)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
 
         # Set additional utils
         self.threshold_height = 0.5
         self.cube_low = np.array([-0.15, 0.10, 0.015])
         self.cube_high = np.array([0.15, 0.25, 0.015])
 
-        # get dof addresses
-        self.cube_dof_id = self.model.body("cube").dofadr[0]
-        self.arm_dof_id = self.model.body(BASE_LINK_NAME).dofadr[0]
-        self.arm_dof_vel_id = self.arm_dof_id
-        # if the arm is not at address 0 then the cube will have 7 states in qpos and 6 in qvel
-        if self.arm_dof_id != 0:
-            self.arm_dof_id = self.arm_dof_vel_id + 1
-
-        self.control_decimation = 4 # number of simulation steps per control step
-
-
-    def inverse_kinematics(self, ee_target_pos, step=0.2, joint_name="link_6", nb_dof=6, regularization=1e-6):
-        """
-        Computes the inverse kinematics for a robotic arm to reach the target end effector position.
-
-        :param ee_target_pos: numpy array of target end effector position [x, y, z]
-        :param step: float, step size for the iteration
-        :param joint_name: str, name of the end effector joint
-        :param nb_dof: int, number of degrees of freedom
-        :param regularization: float, regularization factor for the pseudoinverse computation
-        :return: numpy array of target joint positions
-        """
-        try:
-            # Get the joint ID from the name
-            joint_id = self.model.body(joint_name).id
-        except KeyError:
-            raise ValueError(f"Body name '{joint_name}' not found in the model.")
-
-        # Get the current end effector position
-        # ee_pos = self.d.geom_xpos[joint_id]
-        ee_id = self.model.body(joint_name).id
-        ee_pos = self.data.geom_xpos[ee_id]
-
-        # Compute the Jacobian
-        jac = np.zeros((3, self.model.nv))
-        mujoco.mj_jacBodyCom(self.model, self.data, jac, None, joint_id)
-
-        # Compute the difference between target and current end effector positions
-        delta_pos = ee_target_pos - ee_pos
-
-        # Compute the pseudoinverse of the Jacobian with regularization
-        jac_reg = jac[:, :nb_dof].T @ jac[:, :nb_dof] + regularization * np.eye(nb_dof)
-        jac_pinv = np.linalg.inv(jac_reg) @ jac[:, :nb_dof].T
-
-        # Compute target joint velocities
-        qdot = jac_pinv @ delta_pos
-
-        # Normalize joint velocities to avoid excessive movements
-        qdot_norm = np.linalg.norm(qdot)
-        if qdot_norm > 1.0:
-            qdot /= qdot_norm
-
-        # Read the current joint positions
-        qpos = self.data.qpos[self.arm_dof_id:self.arm_dof_id+nb_dof]
+    def get_task_observation_subspaces(self):
+        return {"cube_pos": spaces.Box(low=-10.0, high=10.0, shape=(3,))}
 
-        # Compute the new joint positions
-        q_target_pos = qpos + qdot * step
+    def fill_task_observation(self, observation):
+        if "cube_pos" in observation:
+            observation["cube_pos"][:] = self.object_pos["cube"]
 
-        return q_target_pos
-
-    def apply_action(self, action):
-        """
-        Step the simulation forward based on the action
-
-        Action shape
-        - EE mode: [dx, dy, dz, gripper]
-        - Joint mode: [q1, q2, q3, q4, q5, q6, gripper]
-        """
-        if self.action_mode == "ee":
-            # raise NotImplementedError("EE mode not implemented yet")
-            ee_action, gripper_action = action[:3], action[-1]
-
-            # Update the robot position based on the action
-            ee_id = self.model.body("link_6").id
-            ee_target_pos = self.data.xpos[ee_id] + ee_action
-
-            # Use inverse kinematics to get the joint action wrt the end effector current position and displacement
-            target_qpos = self.inverse_kinematics(ee_target_pos=ee_target_pos)
-            target_qpos[-1:] = gripper_action
-        elif self.action_mode == "joint":
-            target_low = np.array([-3.14159, -1.5708, -1.48353, -1.91986, -2.96706, -1.74533])
-            target_high = np.array([3.14159, 1.22173, 1.74533, 1.91986, 2.96706, 0.0523599])
-            target_qpos = np.array(action).clip(target_low, target_high)
-        else:
-            raise ValueError("Invalid action mode, must be 'ee' or 'joint'")
-
-        # Set the target position
-        self.data.ctrl = target_qpos
-
-        # Step the simulation forward
-        for _ in range(self.control_decimation):
-            mujoco.mj_step(self.model, self.data)
-            if self.render_mode == "human":
-                self.viewer.sync()
-
-    def get_observation(self):
-        # qpos is [x, y, z, qw, qx, qy, qz, q1, q2, q3, q4, q5, q6, gripper]
-        # qvel is [vx, vy, vz, wx, wy, wz, dq1, dq2, dq3, dq4, dq5, dq6, dgripper]
-        observation = {
-            "arm_qpos": self.data.qpos[self.arm_dof_id:self.arm_dof_id+self.nb_dof].astype(np.float32),
-            "arm_qvel": self.data.qvel[self.arm_dof_vel_id:self.arm_dof_vel_id+self.nb_dof].astype(np.float32),
-        }
-        if self.observation_mode in ["image", "both"]:
-            self.renderer.update_scene(self.data, camera="camera_front")
-            observation["image_front"] = self.renderer.render()
-            self.renderer.update_scene(self.data, camera="camera_top")
-            observation["image_top"] = self.renderer.render()
-        if self.observation_mode in ["state", "both"]:
-            observation["cube_pos"] = self.data.qpos[self.cube_dof_id:self.cube_dof_id+3].astype(np.float32)
-        return observation
-
-    def reset(self, seed=None, options=None):
-        # We need the following line to seed self.np_random
-        super().reset(seed=seed, options=options)
-
-        # Reset the robot to the initial position and sample the cube position
+    def reset_task(self):
+        # Sample the cube position
         cube_pos = self.np_random.uniform(self.cube_low, self.cube_high)
         cube_rot = np.array([1.0, 0.0, 0.0, 0.0])
-        robot_qpos = np.array([0.0, 0.0, 0.0, 0.0, 0.0, 0.0])
-        self.data.qpos[self.arm_dof_id:self.arm_dof_id+self.nb_dof] = robot_qpos
-        self.data.qpos[self.cube_dof_id:self.cube_dof_id+7] = np.concatenate([cube_pos, cube_rot])
-
-        # Step the simulation
-        mujoco.mj_forward(self.model, self.data)
-
-        return self.get_observation(), {}
-
-    def step(self, action):
-        # Perform the action and step the simulation
-        self.apply_action(action)
-
-        # Get the new observation
-        observation = self.get_observation()
-
-        # Get the position of the cube and the distance between the end effector and the cube
-        cube_pos = self.data.qpos[self.cube_dof_id:self.cube_dof_id+3]
-        cube_z = cube_pos[2]
-        ee_id = self.model.body("link_6").id
-        ee_pos = self.data.geom_xpos[ee_id]
-        ee_to_cube = np.linalg.norm(ee_pos - cube_pos)
-
-        # Compute the reward
-        reward_height = cube_z - self.threshold_height
-        reward_distance = -ee_to_cube
-        reward = reward_height + reward_distance
-        return observation, reward, False, False, {}
-
-    def render(self):
-        if self.render_mode == "human":
-            self.viewer.sync()
-        elif self.render_mode == "rgb_array":
-            self.rgb_array_renderer.update_scene(self.data, camera="camera_vizu")
-            return self.rgb_array_renderer.render()
-
-    def close(self):
-        if self.render_mode == "human":
-            self.viewer.close()
-        if self.observation_mode in ["image", "both"]:
-            self.renderer.close()
-        if self.render_mode == "rgb_array":
-            self.rgb_array_renderer.close()
+        self.object_qpos["cube"][:] = np.concatenate([cube_pos, cube_rot])
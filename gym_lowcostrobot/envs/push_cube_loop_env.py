@@ -1,15 +1,59 @@
-import os
-
-import gymnasium as gym
 import mujoco
-import mujoco.viewer
 import numpy as np
-from gymnasium import Env, spaces
+from gymnasium import spaces
+
+from gym_lowcostrobot.envs.base_env import BaseLowCostRobotEnv
+
+
+def compute_cube_overlap(cube_pos, goal_center, goal_half_size, cube_half_size):
+    """
+    Fraction of the area of the cubes inside their goal regions, in the horizontal plane.
+
+    :param cube_pos: array of shape (N, 3) or (N, 2), positions of the cubes
+    :param goal_center: array of shape (N, 3) or (N, 2), centers of the goal regions
+    :param goal_half_size: array of shape (2,), half size of the goal regions along x and y
+    :param cube_half_size: float, half size of the cubes
+    :return: array of shape (N,), overlap in [0, 1]
+    """
+    cube_xy = np.asarray(cube_pos)[..., :2]
+    goal_xy = np.asarray(goal_center)[..., :2]
+    goal_half_size = np.asarray(goal_half_size)[:2]
+    low = np.maximum(cube_xy - cube_half_size, goal_xy - goal_half_size)
+    high = np.minimum(cube_xy + cube_half_size, goal_xy + goal_half_size)
+    overlap_area = np.prod(np.maximum(high - low, 0.0), axis=-1)
+    return overlap_area / (4 * cube_half_size**2)
 
-from gym_lowcostrobot import ASSETS_PATH, BASE_LINK_NAME
 
+def compute_push_cube_loop_reward(cube_pos, current_goal, goal_centers, goal_half_size, cube_half_size):
+    """
+    Rewards and successes of `PushCubeLoopEnv` for N worlds at once.
+
+    A world succeeds when more than 95% of its cube is in its current goal region, and gets a reward of 5. Otherwise,
+    the reward is `overlap - 1` when the cube partially overlaps the goal region, and decreases from -1 to -2 with the
+    distance to the near edge of the goal region along y when it does not.
+
+    :param cube_pos: array of shape (N, 3), positions of the cubes
+    :param current_goal: int array of shape (N,), index of the current goal region of each world
+    :param goal_centers: array of shape (2, 3), centers of the two goal regions
+    :param goal_half_size: array of shape (2,), half size of the goal regions along x and y
+    :param cube_half_size: float, half size of the cubes
+    :return: the rewards, float array of shape (N,), and the successes, bool array of shape (N,)
+    """
+    cube_pos = np.asarray(cube_pos)
+    goal_center = np.asarray(goal_centers)[current_goal]
+    overlap = compute_cube_overlap(cube_pos, goal_center, goal_half_size, cube_half_size)
+    success = overlap > 0.95
+
+    # Distance to the edge of the goal region on the y axis only, the max distance within the box being 0.16
+    goal_region_edge = goal_center[:, 1] - goal_half_size[1]
+    distance_to_edge = np.abs(cube_pos[:, 1] - goal_region_edge)
+    distance_reward = np.clip(-distance_to_edge / 0.16 - 1, -2.0, -1.0)
+
+    reward = np.where(success, 5.0, np.where(overlap > 0.0, overlap - 1, distance_reward))
+    return reward, success
 
-class PushCubeLoopEnv(Env):
+
+class PushCubeLoopEnv(BaseLowCostRobotEnv):
     """
     ## Description
 
@@ -46,8 +90,8 @@ class PushCubeLoopEnv(Env):
 
     - `"arm_qpos"`: the joint angles of the robot arm in radians, shape (6,)
     - `"arm_qvel"`: the joint velocities of the robot arm in radians per second, shape (6,)
-    - `"image_front"`: the front image of the camera of size (240, 320, 3)
-    - `"image_top"`: the top image of the camera of size (240, 320, 3)
+    - `"image_front"`: the front image of the camera of size (240, 320, 3) by default, see `image_size`
+    - `"image_top"`: the top image of the camera of size (240, 320, 3) by default, see `image_size`
     - `"cube_pos"`: the position of the cube, as (x, y, z)
 
     Three observation modes are available: "image" (default), "state", and "both".
@@ -70,196 +114,80 @@ class PushCubeLoopEnv(Env):
         section "Observation space".
     - `action_mode (str)`: the action mode, can be "joint" or "ee", default is "joint", see section "Action space".
     - `render_mode (str)`: the render mode, can be "human" or "rgb_array", default is None.
+    - `reuse_buffers (bool)`: if True, the observation arrays are allocated once and filled in place at each step, the
+        images being rendered directly into them. The observation returned by `reset` and `step` is then overwritten by
+        the next call to `reset` or `step`, copy it to keep it. Default is False.
+    - `cameras (list)`: the cameras rendered in the "image" and "both" observation modes, default is
+        ["camera_front", "camera_top"]. The image of the camera `"camera_<name>"` is observed as `"image_<name>"`.
+    - `observation_keys (list)`: the observation keys to compute, default is None for all the keys of the observation
+        mode. The keys which are not selected are not computed, and the cameras whose image is not selected are not
+        rendered.
+    - `render_every (int)`: render the camera images every `render_every` steps and repeat the last images in between,
+        default is 1.
+    - `ik_cache (IKCache or str)`: cache of inverse kinematics solutions, or path of a saved cache, default is None.
+        If given, the inverse kinematics of the "ee" action mode is solved to convergence, warm started from the cached
+        solution of the target when it is closer than the current joint positions.
+    - `ik_iterations (int)`: the maximum number of iterations of the inverse kinematics of the "ee" action mode,
+        default is None for a single damped step toward the target, or 20 when solved to convergence. If given, or if
+        `ik_tol` or `ik_cache` is given, the inverse kinematics is solved to convergence with full steps, until the end
+        effector is within `ik_tol` of the target or `ik_iterations` iterations are done.
+    - `ik_tol (float)`: the distance to the target below which the inverse kinematics of the "ee" action mode stops
+        iterating, default is None for 1e-3 when solved to convergence, see `ik_iterations`.
+    - `render_backend (str)`: the OpenGL backend rendering the cameras, "egl", "osmesa" or "glfw", default is None for
+        the `MUJOCO_GL` environment variable if set, else EGL (falling back to OSMesa) on headless machines. The
+        cameras of all the environments of a process share a single GL context and renderer per scene, see
+        `gym_lowcostrobot.rendering`.
+    - `image_size (tuple or dict)`: the (height, width) of the camera images, or a dict of (height, width) by camera
+        name for per-camera sizes, the other cameras keeping the default size (240, 320). The images are rendered at
+        this size directly, at most the offscreen buffer size of the scene (640, 640).
     """
 
-    metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 200}
-
-    def __init__(self, observation_mode="image", action_mode="joint", render_mode=None):
-        # Load the MuJoCo model and data
-        self.model = mujoco.MjModel.from_xml_path(os.path.join(ASSETS_PATH, "push_cube_loop.xml"), {})
-        self.data = mujoco.MjData(self.model)
-
-        # Set the action space
-        self.action_mode = action_mode
-        action_shape = {"joint": 6, "ee": 4}[action_mode]
-        self.action_space = spaces.Box(low=-1.0, high=1.0, shape=(action_shape,), dtype=np.float32)
-
-        # Set the observations space
-        self.observation_mode = observation_mode
-        observation_subspaces = {
-            "arm_qpos": spaces.Box(low=-np.pi, high=np.pi, shape=(6,)),
-            "arm_qvel": spaces.Box(low=-10.0, high=10.0, shape=(6,)),
-        }
-        if self.observation_mode in ["image", "both"]:
-            observation_subspaces["image_front"] = spaces.Box(0, 255, shape=(240, 320, 3), dtype=np.uint8)
-            observation_subspaces["image_top"] = spaces.Box(0, 255, shape=(240, 320, 3), dtype=np.uint8)
-            self.renderer = mujoco.Renderer(self.model)
-        if self.observation_mode in ["state", "both"]:
-            observation_subspaces["cube_pos"] = spaces.Box(low=-10.0, high=10.0, shape=(3,))
-        self.observation_space = gym.spaces.Dict(observation_subspaces)
-
-        # Set the render utilities
-        assert render_mode is None or render_mode in self.metadata["render_modes"]
-        self.render_mode = render_mode
-        if self.render_mode == "human":
-            self.viewer = mujoco.viewer.launch_passive(self.model, self.data)
-            self.viewer.cam.azimuth = -75
-            self.viewer.cam.distance = 1
-        elif self.render_mode == "rgb_array":
-            self.rgb_array_renderer = mujoco.Renderer(self.model, height=640, width=640)
+    scene_file = "push_cube_loop.xml"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
 
         # Set additional utils
         self.threshold_height = 0.5
-        self.nb_dof = 6
-
-        # get dof addresses
-        self.cube_dof_id = self.model.body("cube").dofadr[0]
-        self.arm_dof_id = self.model.body(BASE_LINK_NAME).dofadr[0]
-        self.arm_dof_vel_id = self.arm_dof_id
-        # if the arm is not at address 0 then the cube will have 7 states in qpos and 6 in qvel
-        if self.arm_dof_id != 0:
-            self.arm_dof_id = self.arm_dof_vel_id + 1
-
         self.cube_low = np.array([-0.15, 0.10, 0.015])
         self.cube_high = np.array([0.15, 0.25, 0.015])
-        
+
         self.cube_size = 0.015
-        self.cube_position = np.array([0.0,0.0,0.0])
+        self.cube_position = np.array([0.0, 0.0, 0.0])
 
         goal_region_1_id = mujoco.mj_name2id(self.model, mujoco.mjtObj.mjOBJ_GEOM, "goal_region_1")
         goal_region_2_id = mujoco.mj_name2id(self.model, mujoco.mjtObj.mjOBJ_GEOM, "goal_region_2")
 
-        self.goal_region_1_center = self.model.geom_pos[goal_region_1_id]
-        self.goal_region_2_center = self.model.geom_pos[goal_region_2_id]
+        self.goal_region_1_center = self.model.geom_pos[goal_region_1_id].copy()
+        self.goal_region_2_center = self.model.geom_pos[goal_region_2_id].copy()
 
-        self.goal_region_high = self.model.geom_size[goal_region_1_id] 
-        self.goal_region_high[:2] -= 0.008 # offset sampling region to keep cube within
-        self.goal_region_low = self.goal_region_high * np.array([-1., -1., 1.])
-        self.current_goal = 0 # 0 for first goal region , and 1 for second goal region
-        self.control_decimation = 4 # number of simulation steps per control step
+        self.goal_region_high = self.model.geom_size[goal_region_1_id].copy()
+        self.goal_region_high[:2] -= 0.008  # offset sampling region to keep cube within
+        self.goal_region_low = self.goal_region_high * np.array([-1.0, -1.0, 1.0])
+        self.current_goal = 0  # 0 for first goal region , and 1 for second goal region
 
         self._step = 0
-        # indicators for the reward
-
-
-    def inverse_kinematics(self, ee_target_pos, step=0.2, joint_name="moving_side", nb_dof=6, regularization=1e-6):
-        """
-        Computes the inverse kinematics for a robotic arm to reach the target end effector position.
-
-        :param ee_target_pos: numpy array of target end effector position [x, y, z]
-        :param step: float, step size for the iteration
-        :param joint_name: str, name of the end effector joint
-        :param nb_dof: int, number of degrees of freedom
-        :param regularization: float, regularization factor for the pseudoinverse computation
-        :return: numpy array of target joint positions
-        """
-        try:
-            # Get the joint ID from the name
-            joint_id = self.model.body(joint_name).id
-        except KeyError:
-            raise ValueError(f"Body name '{joint_name}' not found in the model.")
-
-        # Get the current end effector position
-        # ee_pos = self.d.geom_xpos[joint_id]
-        ee_id = self.model.body(joint_name).id
-        ee_pos = self.data.geom_xpos[ee_id]
-
-        # Compute the Jacobian
-        jac = np.zeros((3, self.model.nv))
-        mujoco.mj_jacBodyCom(self.model, self.data, jac, None, joint_id)
-
-        # Compute the difference between target and current end effector positions
-        delta_pos = ee_target_pos - ee_pos
-
-        # Compute the pseudoinverse of the Jacobian with regularization
-        jac_reg = jac[:, :nb_dof].T @ jac[:, :nb_dof] + regularization * np.eye(nb_dof)
-        jac_pinv = np.linalg.inv(jac_reg) @ jac[:, :nb_dof].T
-
-        # Compute target joint velocities
-        qdot = jac_pinv @ delta_pos
-
-        # Normalize joint velocities to avoid excessive movements
-        qdot_norm = np.linalg.norm(qdot)
-        if qdot_norm > 1.0:
-            qdot /= qdot_norm
-  
-        # Read the current joint positions
-        qpos = self.data.qpos[self.arm_dof_id:self.arm_dof_id+nb_dof]
-
-        # Compute the new joint positions
-        q_target_pos = qpos + qdot * step
-
-        return q_target_pos
-
-    def apply_action(self, action):
-        """
-        Step the simulation forward based on the action
-
-        Action shape
-        - EE mode: [dx, dy, dz, gripper]
-        - Joint mode: [q1, q2, q3, q4, q5, q6, gripper]
-        """
-        if self.action_mode == "ee":
-            # raise NotImplementedError("EE mode not implemented yet")
-            ee_action, gripper_action = action[:3], action[-1]
-
-            # Update the robot position based on the action
-            ee_id = self.model.body("moving_side").id
-            ee_target_pos = self.data.xpos[ee_id] + ee_action
-
-            # Use inverse kinematics to get the joint action wrt the end effector current position and displacement
-            target_qpos = self.inverse_kinematics(ee_target_pos=ee_target_pos)
-            target_qpos[-1:] = gripper_action
-        elif self.action_mode == "joint":
-            target_low = np.array([-3.14159, -1.5708, -1.48353, -1.91986, -2.96706, -1.74533])
-            target_high = np.array([3.14159, 1.22173, 1.74533, 1.91986, 2.96706, 0.0523599])
-            target_qpos = np.array(action).clip(target_low, target_high)
-        else:
-            raise ValueError("Invalid action mode, must be 'ee' or 'joint'")
-
-        # Set the target position
-        self.data.ctrl = target_qpos
-
-        # Step the simulation forward
-        for _ in range(self.control_decimation):
-            mujoco.mj_step(self.model, self.data)
-            if self.render_mode == "human":
-                self.viewer.sync()
-
-    def get_observation(self):
-        # qpos is [x, y, z, qw, qx, qy, qz, q1, q2, q3, q4, q5, q6, gripper]
-        # qvel is [vx, vy, vz, wx, wy, wz, dq1, dq2, dq3, dq4, dq5, dq6, dgripper]
-        observation = {
-            "arm_qpos": self.data.qpos[self.arm_dof_id:self.arm_dof_id+self.nb_dof].astype(np.float32),
-            "arm_qvel": self.data.qvel[self.arm_dof_vel_id:self.arm_dof_vel_id+self.nb_dof].astype(np.float32),
-        }
-        if self.observation_mode in ["image", "both"]:
-            self.renderer.update_scene(self.data, camera="camera_front")
-            observation["image_front"] = self.renderer.render()
-            self.renderer.update_scene(self.data, camera="camera_top")
-            observation["image_top"] = self.renderer.render()
-        if self.observation_mode in ["state", "both"]:
-            observation["cube_pos"] = self.data.qpos[self.cube_dof_id:self.cube_dof_id+3].astype(np.float32)
-        return observation
 
-    def reset(self, seed=None, options=None):
-        # We need the following line to seed self.np_random
-        super().reset(seed=seed, options=options)
+    def get_task_observation_subspaces(self):
+        return {"cube_pos": spaces.Box(low=-10.0, high=10.0, shape=(3,))}
 
-        # Reset the robot to the initial position and sample the cube position
-        cube_pos = self.np_random.uniform(self.goal_region_low, self.goal_region_high) 
-        cube_pos[:2] += (1 - self.current_goal) * self.goal_region_1_center[:2] \
-                      + self.current_goal * self.goal_region_2_center[:2]
+    def fill_task_observation(self, observation):
+        if "cube_pos" in observation:
+            observation["cube_pos"][:] = self.object_pos["cube"]
+
+    def reset_task(self):
+        # Sample the cube position in the current goal region
+        cube_pos = self.np_random.uniform(self.goal_region_low, self.goal_region_high)
+        goal_center = self.goal_region_1_center if self.current_goal == 0 else self.goal_region_2_center
+        cube_pos[:2] += goal_center[:2]
 
         cube_rot = np.array([1.0, 0.0, 0.0, 0.0])
-        robot_qpos = np.array([0.0, 0.0, 0.0, 0.0, 0.0, 0.0])
-        self.data.qpos[self.arm_dof_id:self.arm_dof_id+self.nb_dof] = robot_qpos
-        self.data.qpos[self.cube_dof_id:self.cube_dof_id+7]=np.concatenate([cube_pos, cube_rot])
-        
-        # Step the simulation
-        mujoco.mj_forward(self.model, self.data)
+        self.object_qpos["cube"][:] = np.concatenate([cube_pos, cube_rot])
 
-        return self.get_observation(), {'timestamp': 0.0}
+    def reset(self, seed=None, options=None):
+        observation, info = super().reset(seed=seed, options=options)
+        info["timestamp"] = 0.0
+        return observation, info
 
     def step(self, action):
         # Perform the action and step the simulation
@@ -268,74 +196,33 @@ class PushCubeLoopEnv(Env):
         # Get the new observation
         observation = self.get_observation()
 
+        # Compute the reward, the episodes never terminate. "success" is kept as an alias of "is_success"
         reward, success = self.get_reward()
         self._step += 1
-        info = {'timestamp': self.data.time, 'success': success}#self.model.opt.timestep * self._step}
-
+        info = {"is_success": success, "success": success, "timestamp": self.data.time}
         return observation, reward, False, False, info
 
-    def render(self):
-        if self.render_mode == "human":
-            self.viewer.sync()
-        elif self.render_mode == "rgb_array":
-            self.rgb_array_renderer.update_scene(self.data, camera="camera_vizu")
-            return self.rgb_array_renderer.render()
-
-    def close(self):
-        if self.render_mode == "human":
-            self.viewer.close()
-        if self.observation_mode in ["image", "both"]:
-            self.renderer.close()
-        if self.render_mode == "rgb_array":
-            self.rgb_array_renderer.close()
+    def get_task_state(self):
+        return np.array([self.current_goal, self._step], dtype=np.float64)
 
-    def get_reward(self):
-        # Get the position of the cube and the distance between the end effector and the cube
-        self.cube_position = self.data.qpos[self.cube_dof_id:self.cube_dof_id+3]
-        overlap = self.get_cube_overlap()
-        # if the intersection is above 95% consider the episode a success and switch goals:
-        success = 0
-        if overlap > 0.95:
-            success = 1
-            reward = +5
-            self.current_goal = 1 - self.current_goal
-
-        elif overlap > 0.0:
-            reward = overlap - 1
+    def set_task_state(self, task_state):
+        self.current_goal, self._step = int(task_state[0]), int(task_state[1])
 
-        elif overlap == 0.0:
-            # calculate distance to edge on y axis only
-            goal_region_edge = self.goal_region_low[1] \
-                               + (1 - self.current_goal) * self.goal_region_1_center[1] \
-                               + self.current_goal * self.goal_region_2_center[1]
-            
-            distance_to_edge = np.sqrt((self.cube_position[1] - goal_region_edge)**2)
-            # max distance to edge within the box is 0.16
-            reward = min(max((-distance_to_edge / 0.16) - 1, -2), -1)
-        return reward, success
+    def compute_reward(self):
+        return self.get_reward()[0]
 
+    def get_reward(self):
+        # Get the position of the cube, and switch goals when more than 95% of the cube is in the goal region
+        self.cube_position = self.object_pos["cube"]
+        goal_centers = np.stack([self.goal_region_1_center, self.goal_region_2_center])
+        current_goal = np.array([self.current_goal])
+        reward, success = compute_push_cube_loop_reward(
+            self.cube_position[None], current_goal, goal_centers, self.goal_region_high, self.cube_size
+        )
+        if success[0]:
+            self.current_goal = 1 - self.current_goal
+        return float(reward[0]), bool(success[0])
 
     def get_cube_overlap(self):
-        # Unpack the parameters
-        x_cube, y_cube = self.cube_position[:2]
-        w_cube = l_cube = self.cube_size
-        
         goal_center = self.goal_region_1_center if self.current_goal == 0 else self.goal_region_2_center
-        x_goal, y_goal = goal_center[:2] 
-        w_goal, l_goal = self.goal_region_high[:2]
-        
-        # Calculate the overlap along the x-axis
-        x_overlap = max(0, min(x_cube + w_cube, x_goal + w_goal) - max(x_cube - w_cube, x_goal - w_goal))
-    
-        # Calculate the overlap along the y-axis
-        y_overlap = max(0, min(y_cube + l_cube, y_goal + l_goal) - max(y_cube - l_cube, y_goal - l_goal))
-    
-        # Calculate the area of the overlap region
-        overlap_area = x_overlap * y_overlap
-    
-        # Calculate the area of the cube
-        cube_area = w_cube * l_cube * 4
-    
-        # return the percentage overlap relative to the cube area
-        return overlap_area / cube_area
-
+        return float(compute_cube_overlap(self.cube_position, goal_center, self.goal_region_high, self.cube_size))
@@ -8,6 +8,8 @@ import mujoco.viewer
 from lerobot.common.robot_devices.motors.dynamixel import DynamixelMotorsBus
 from lerobot.common.robot_devices.robots.koch import KochRobot
 
+from gym_lowcostrobot.model_cache import load_model
+
 
 ## Define the simulated robot
 
@@ -46,7 +48,7 @@ class SimDynamixelMotorsBus:
     ):
         
         self.path_scene = path_scene
-        self.model = mujoco.MjModel.from_xml_path(path_scene)
+        self.model = load_model(path_scene)
         self.data  = mujoco.MjData(self.model)
         self.is_connected = False
         self.motors = motors
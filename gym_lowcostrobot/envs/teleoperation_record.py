@@ -7,26 +7,24 @@ import mujoco
 import mujoco.viewer
 
 import argparse
-import copy
 import os
 import pathlib
 import time
 
 import numpy as np
-import torch
 from datasets import Dataset, Features, Sequence, Value
 
-from lerobot.common.datasets.compute_stats import compute_stats
-from lerobot.common.datasets.lerobot_dataset import CODEBASE_VERSION, DATA_DIR, LeRobotDataset
-from lerobot.common.datasets.push_dataset_to_hub.utils import concatenate_episodes, save_images_concurrently
-from lerobot.common.datasets.utils import (
-    hf_transform_to_torch,
-)
-from lerobot.common.datasets.video_utils import VideoFrame, encode_video_frames
-from lerobot.scripts.push_dataset_to_hub import push_meta_data_to_hub, push_videos_to_hub, save_meta_data
+from lerobot.common.datasets.lerobot_dataset import CODEBASE_VERSION
+from lerobot.common.datasets.video_utils import VideoFrame
+from lerobot.scripts.push_dataset_to_hub import push_meta_data_to_hub, push_videos_to_hub
 from lerobot.common.robot_devices.motors.dynamixel import DynamixelMotorsBus
 from lerobot.common.robot_devices.robots.koch import KochRobot
 
+from gym_lowcostrobot.lerobot_writer import LeRobotDatasetWriter
+from gym_lowcostrobot.model_cache import load_model
+from gym_lowcostrobot.rendering import get_renderer
+from gym_lowcostrobot.video import VideoRecorder, get_measured_fps, wait_for_frame
+
 
 
 ### SimCamera classes
@@ -64,10 +62,17 @@ class SimCamera:
         self.width = width
         self.height = height
 
+        # The images are rendered at their size directly, in the offscreen buffer of the model
+        max_size = (self.model.vis.global_.offheight, self.model.vis.global_.offwidth)
+        if not (0 < self.height <= max_size[0] and 0 < self.width <= max_size[1]):
+            raise ValueError(f"Invalid image size {(self.height, self.width)}, must be at most {max_size}")
+
         self.logs = {}
         self.logs["delta_timestamp_s"] = 1.0 / self.fps
         
-        self.renderer = mujoco.Renderer(self.model, height=self.height, width=self.width)
+        # All the cameras of the model share a renderer
+        self.renderer = get_renderer(self.model)
+        self.camera_id = mujoco.mj_name2id(self.model, mujoco.mjtObj.mjOBJ_CAMERA, self.id_camera)
 
     def connect(self):
         self.is_connected = True
@@ -80,8 +85,9 @@ class SimCamera:
             self.disconnect()
 
     def async_read(self):
-            self.renderer.update_scene(self.data, camera=self.id_camera)
-            return self.renderer.render()
+            image = self.renderer.render(self.model, self.data, self.camera_id, height=self.height, width=self.width)
+            self.logs["render_time_s"] = self.renderer.last_time
+            return image
 
 
 ### SimDynamixelMotorsBus class
@@ -101,7 +107,7 @@ class SimDynamixelMotorsBus:
     ):
         
         self.path_scene = path_scene
-        self.model = mujoco.MjModel.from_xml_path(path_scene)
+        self.model = load_model(path_scene)
         self.data  = mujoco.MjData(self.model)
         self.is_connected = False
         self.motors = motors
@@ -370,8 +376,6 @@ if __name__ == "__main__":
 
 
     parser.add_argument("--num-frames", type=int, default=20)
-    parser.add_argument("--num-workers", type=int, default=8)
-    parser.add_argument("--keep-last", action="store_true")
     parser.add_argument("--repo-id", type=str, default="jnm38")
     parser.add_argument("--push-to-hub", action="store_true")
     parser.add_argument("--fps", type=int, default=30, help="Frames per second of the recording.")
@@ -381,6 +385,14 @@ if __name__ == "__main__":
         default=0.1,
         help="Tolerance in fps for the recording before dropping episodes.",
     )
+    parser.add_argument(
+        "--image-size",
+        type=int,
+        nargs=2,
+        default=(480, 640),
+        metavar=("HEIGHT", "WIDTH"),
+        help="Size at which the cameras are rendered and recorded.",
+    )
     parser.add_argument(
         "--revision", type=str, default=CODEBASE_VERSION, help="Codebase version used to generate the dataset."
     )
@@ -392,6 +404,7 @@ if __name__ == "__main__":
     revision = args.revision
     fps = args.fps
     fps_tolerance = args.fps_tolerance
+    image_height, image_width = args.image_size
 
     ## test the leader motors reading 
     if args.test_leader:
@@ -428,38 +441,30 @@ if __name__ == "__main__":
     
     ## create cameras which are instantiated to the mujoco environment in the simulated follower robot class
     cameras = {
-        "image_top":   SimCamera(id_camera="camera_top",   model=follower.model, data=follower.data, camera_index=0, fps=30, width=640, height=480),
-        "image_front": SimCamera(id_camera="camera_front", model=follower.model, data=follower.data, camera_index=1, fps=30, width=640, height=480),
+        "image_top":   SimCamera(id_camera="camera_top",   model=follower.model, data=follower.data, camera_index=0, fps=fps, width=image_width, height=image_height),
+        "image_front": SimCamera(id_camera="camera_front", model=follower.model, data=follower.data, camera_index=1, fps=fps, width=image_width, height=image_height),
     }
 
     ## define the path to store the data
     DATA_DIR = pathlib.Path("data_traces")
     out_data = DATA_DIR / repo_id
 
-    # During data collection, frames are stored as png images in `images_dir`
-    images_dir = out_data / "images"
-
-    # After data collection, png images of each episode are encoded into a mp4 file stored in `videos_dir`
+    # During data collection, the frames of each episode are encoded into a mp4 file stored in `videos_dir`, and the
+    # other data is written to a parquet file in `data_dir` when the episode ends
     videos_dir = out_data / "videos"
     meta_data_dir = out_data / "meta_data"
 
-    # Create image and video directories
-    if not os.path.exists(images_dir):
-        os.makedirs(images_dir, exist_ok=True)
+    # Create video directory
     if not os.path.exists(videos_dir):
         os.makedirs(videos_dir, exist_ok=True)
-
-
-    ## Define the episode data index and dictionaries to store the data
-    ep_dicts = []
-    episode_data_index = {"from": [], "to": []}
-    ep_fps = []
-    id_from = 0
-    id_to = 0
+    video_keys = ["image_top", "image_front"]
+    video_recorder = VideoRecorder(videos_dir, video_keys, fps)
+    writer = LeRobotDatasetWriter(out_data, fps, video_keys=video_keys)
 
 
     ## start the mujoco environment and start the teleoperation
-    ep_idx = 0
+    ## a dataset already in `out_data` is resumed, the new episodes being appended to it
+    ep_idx = writer.num_episodes
     with mujoco.viewer.launch_passive(follower.model, follower.data, key_callback=key_callback) as viewer:    
 
         robot = KochRobot(leader_arms   = {"main": leader},
@@ -474,131 +479,55 @@ if __name__ == "__main__":
             if args.mujoco_replace_cube:
                 mujoco_replace_cube(follower.model, follower.data)
 
-            # Instantiate the episode data storage
-            obs_replay = {}
-            obs_replay["observation"] = []
-            obs_replay["action"] = []
-            obs_replay["image_top"] = []
-            obs_replay["image_front"] = []
+            video_recorder.start_episode(ep_idx)
             timestamps = []
-            start_time = time.time()
+            start_time = time.perf_counter()
 
             print(f"Start episode {ep_idx} ...")
             while stop_episode == False and stop_record == False:
 
+                ## the teleoperation is paced to `fps`, the frame rate of the videos, and the measured timestamps are recorded
+                timestamps.append(wait_for_frame(start_time, len(timestamps), fps))
                 obs_dict, action_dict = robot.teleop_step(record_data=True)
-                obs_replay["observation"].append(copy.deepcopy(obs_dict["observation.state"]))
-                obs_replay["action"].append(copy.deepcopy(action_dict["action"]))
-                obs_replay["image_top"].append(copy.deepcopy(obs_dict["observation.images.image_top"].numpy()))
-                obs_replay["image_front"].append(copy.deepcopy(obs_dict["observation.images.image_front"].numpy()))
-                timestamps.append(time.time() - start_time)
+                images = {key: obs_dict[f"observation.images.{key}"].numpy() for key in video_keys}
+                video_recorder.add_frame(images)
+                writer.add_frame({"observation.state": obs_dict["observation.state"].numpy(), "action": action_dict["action"].numpy()}, timestamp=timestamps[-1], images=images)
 
             stop_episode = False
-
-            ## Tolerance workaround ...
-            num_frames = len(timestamps)
-            timestamps = np.linspace(0, timestamps[-1], num_frames)
-
-            # os.system(f'spd-say "saving episode"')
-            ep_dict = {}
-
-            # store the images of the episode in .png and create the video
-            for img_key in ["image_top", "image_front"]:
-                save_images_concurrently(
-                    obs_replay[img_key],
-                    images_dir / f"{img_key}_episode_{ep_idx:06d}",
-                    args.num_workers,
-                )
-                fname = f"{img_key}_episode_{ep_idx:06d}.mp4"
-
-                # store the reference to the video frame
-                ep_dict[f"observation.{img_key}"] = [{"path": f"videos/{fname}", "timestamp": tstp} for tstp in timestamps]
-
-            # store the state, action, episode index, frame index, timestamp and next done
-            state     = torch.tensor(np.array(obs_replay["observation"]))
-            action    = torch.tensor(np.array(obs_replay["action"]))
-            next_done = torch.zeros(num_frames, dtype=torch.bool)
-            next_done[-1] = True
-
-            ep_dict["observation.state"] = state
-            ep_dict["action"] = action
-            ep_dict["episode_index"] = torch.tensor([ep_idx] * num_frames, dtype=torch.int64)
-            ep_dict["frame_index"]   = torch.arange(0, num_frames, 1)
-            ep_dict["timestamp"]     = torch.tensor(timestamps)
-            ep_dict["next.done"]     = next_done
-            ep_fps.append(num_frames / timestamps[-1])
-            print(f"Episode {ep_idx} done, fps: {ep_fps[-1]:.2f}")
-
-            ## store the episode data index
-            episode_data_index["from"].append(id_from)
-            episode_data_index["to"].append(id_from + num_frames if args.keep_last else id_from + num_frames - 1)
-
-            ## update the episode data index
-            id_to = id_from + num_frames if args.keep_last else id_from + num_frames - 1
-            id_from = id_to
-
-            ## store the episode data in the overall data list
-            ep_dicts.append(ep_dict)
+            video_recorder.end_episode()
+
+            ## the episodes too slow for the videos are dropped, the next episode overwriting their videos
+            measured_fps = get_measured_fps(timestamps)
+            if abs(measured_fps - fps) > fps_tolerance:
+                print(f"Episode {ep_idx} dropped, fps: {measured_fps:.2f}")
+                writer.discard_episode()
+                continue
+
+            ## the episode is written to disk and the statistics are updated
+            writer.save_episode()
+            print(f"Episode {ep_idx} done, fps: {measured_fps:.2f}")
             ep_idx += 1
 
     ## end the teleoperation
     robot.disconnect()
-
-    ## encode the images to videos for all the episodes
-    for idx in range(ep_idx):
-        for img_key in ["image_top", "image_front"]:
-            encode_video_frames(
-                images_dir / f"{img_key}_episode_{idx:06d}",
-                videos_dir / f"{img_key}_episode_{idx:06d}.mp4",
-                ep_fps[idx],
-            )
-
-    ## concatenate the episodes and store the data
-    data_dict = concatenate_episodes(ep_dicts)  # Since our fps varies we are sometimes off tolerance for the last frame
+    writer.close()
 
     ## store the data in the dataset format in a features dictionary
-    features = {}
-    keys = [key for key in data_dict if "observation.image_" in key]
-    for key in keys:
-        features[key.replace("observation.image_", "observation.images.")] = VideoFrame()
-        data_dict[key.replace("observation.image_", "observation.images.")] = data_dict[key]
-        del data_dict[key]
-
-    features["observation.state"] = Sequence(length=data_dict["observation.state"].shape[1], feature=Value(dtype="float32", id=None))
-    features["action"] = Sequence(length=data_dict["action"].shape[1], feature=Value(dtype="float32", id=None))
+    features = {f"observation.images.{key}": VideoFrame() for key in video_keys}
+    features["observation.state"] = Sequence(length=len(follower.motor_names), feature=Value(dtype="float32", id=None))
+    features["action"] = Sequence(length=len(follower.motor_names), feature=Value(dtype="float32", id=None))
     features["episode_index"] = Value(dtype="int64", id=None)
     features["frame_index"]   = Value(dtype="int64", id=None)
+    features["index"]         = Value(dtype="int64", id=None)
     features["timestamp"]     = Value(dtype="float32", id=None)
     features["next.done"]     = Value(dtype="bool", id=None)
-    features["index"]         = Value(dtype="int64", id=None)
 
-    ## store the data in the dataset format    
-    hf_dataset = Dataset.from_dict(data_dict, features=Features(features))
-    hf_dataset.set_transform(hf_transform_to_torch)
+    ## load the episodes from the parquet files, without holding them in memory
+    hf_dataset = Dataset.from_parquet(writer.episode_paths, features=Features(features))
 
-    ## store the meta data
-    info = {
-        #"fps": sum(ep_fps) / len(ep_fps),  # to have a good tolerance in data processing for the slowest video
-        "fps": 24,  # to have a good tolerance in data processing for the slowest video
-        "video": ep_idx,
-    }
-    
-    ## store the data in the LeRobotDataset format
-    lerobot_dataset = LeRobotDataset.from_preloaded(
-        repo_id=repo_id,
-        hf_dataset=hf_dataset,
-        episode_data_index=episode_data_index,
-        info=info,
-        videos_dir=videos_dir,
-    )
-
-    ## compute the stats and save the meta data
-    stats = compute_stats(lerobot_dataset, num_workers=args.num_workers)
-    save_meta_data(info, stats, episode_data_index, meta_data_dir)
-    
+    ## the meta data, with the statistics (including the per-channel statistics of the images), was written to `meta_data_dir` by the writer while recording
 
     ## save the data in the dataset format in disk
-    hf_dataset = hf_dataset.with_format(None)  # to remove transforms that cant be saved
     hf_dataset.save_to_disk(str(out_data / "train"))
 
 
@@ -1,6 +1,8 @@
 """Wrapper for recording videos."""
 
 import os
+import queue
+import threading
 
 import gymnasium as gym
 import h5py
@@ -14,11 +16,109 @@ observations/images/front
 observations/images/top
 observations/qpos
 observations/qvel
+action
+reward
+terminated
+truncated
+timestamp
+state/cube_pos
+state/target_pos
+episode_index
 """
 
 
+# Size of the chunks of the datasets in streaming mode, in bytes
+CHUNK_NBYTES = 2**20
+
+# Number of frames preallocated when the length of the episodes is unknown, in buffered mode
+DEFAULT_CAPACITY = 1024
+
+# Types of the columns recorded besides the observations, the privileged state ("state/...") being float64
+COLUMN_DTYPES = {
+    "action": np.float32,
+    "reward": np.float64,
+    "terminated": np.bool_,
+    "truncated": np.bool_,
+    "timestamp": np.float64,
+}
+
+
+def get_dataset_name(key):
+    """Name of the dataset of an observation key, e.g. "image_front" is saved in "observations/images/front"."""
+    if key.startswith("image_"):
+        return "observations/images/" + key[len("image_") :]
+    return "observations/" + {"arm_qpos": "qpos", "arm_qvel": "qvel"}.get(key, key)
+
+
+def get_column_dtype(name, value):
+    """Type of a recorded column, the observations keeping the type of their values."""
+    if name.startswith("state/"):
+        return np.dtype(np.float64)
+    return np.dtype(COLUMN_DTYPES.get(name, np.asarray(value).dtype))
+
+
+def get_compression_kwargs(compression, compression_opts=None):
+    """
+    Get the keyword arguments of `h5py.File.create_dataset` for a compression filter.
+
+    :param compression: str, "gzip", "lzf", "blosc" or None for no compression
+    :param compression_opts: compression level of "gzip" (0-9) or "blosc" (0-9)
+    :return: dict of keyword arguments
+    """
+    if compression is None:
+        return {}
+    if compression in ["gzip", "lzf"]:
+        return {"compression": compression, "compression_opts": compression_opts}
+    if compression == "blosc":
+        try:
+            import hdf5plugin
+        except ImportError as e:
+            raise ImportError(
+                "The blosc compression requires hdf5plugin, install it with `pip install hdf5plugin`"
+            ) from e
+        clevel = 5 if compression_opts is None else compression_opts
+        return dict(hdf5plugin.Blosc(cname="lz4", clevel=clevel, shuffle=hdf5plugin.Blosc.SHUFFLE))
+    raise ValueError(f"Invalid compression {compression}, must be 'gzip', 'lzf', 'blosc' or None")
+
+
 class HDF5_Recorder:
-    def __init__(self):
+    """
+    Records the observations and actions of an episode in an HDF5 file, with the rewards, the terminated and truncated
+    flags, the timestamps and the privileged state when they are given.
+
+    The frames are copied into fixed-width typed columns (see `COLUMN_DTYPES`), allocated at the first frame. The keys
+    of the first frame (observations, recorded extras and state) are the schema of the file: the following frames must
+    have the same keys, else `capture_frame` raises a ValueError, so that no row is left uninitialized on disk.
+
+    In streaming mode, the datasets are created as resizable chunked datasets at the first frame and the columns hold
+    one chunk, appended to the datasets each time it is full, so the memory used does not depend on the length of the
+    episode and closing the file only writes the last partial chunk. Otherwise, the columns are preallocated for
+    `length` frames (grown if the episode is longer) and written when closing.
+
+    In multi-episode mode (streaming only), starting a new episode in the file being recorded appends it to the same
+    datasets. The `(start, end)` frame offsets of the episodes are saved in the `episode_index` dataset, which is also
+    written for single episode files.
+
+    :param streaming: bool, whether to append the frames to the file as they arrive, default is True
+    :param compression: str, compression of the datasets, "gzip", "lzf", "blosc" or None, default is None
+    :param compression_opts: compression level, see `get_compression_kwargs`
+    :param chunk_length: int, number of frames per chunk, default is None to use chunks of about 1 MB
+    :param multi_episode: bool, whether to record several episodes in the same file, default is False
+    :param length: int, expected number of frames per episode, used to preallocate the columns in buffered mode,
+        default is None
+    """
+
+    def __init__(
+        self,
+        streaming=True,
+        compression=None,
+        compression_opts=None,
+        chunk_length=None,
+        multi_episode=False,
+        length=None,
+    ):
+        if multi_episode and not streaming:
+            raise ValueError("Recording several episodes in the same file requires the streaming mode")
         self.step_id = 0
         self.terminated = False
         self.truncated = False
@@ -26,42 +126,247 @@ class HDF5_Recorder:
         self.episode_id = 0
         self.hdf5_file = None
 
-        self.lst_observations = []
-        self.lst_actions = []
+        self.streaming = streaming
+        self.compression_kwargs = get_compression_kwargs(compression, compression_opts)
+        self.chunk_length = chunk_length
+        self.multi_episode = multi_episode
+        self.length = length
+        self.file = None
+        self.datasets = {}
+        self.episode_index = None
+
+        # Typed columns of the frames not written yet
+        self.columns = None
+        self.columns_length = 0
+
+        # Frames in the current file, and first frame of the current episode
+        self.num_frames = 0
+        self.episode_start = 0
 
     def start_hdf5_recorder(self, hdf5_file):
         """Starts HDF5 recorder using :class:`HDF5_Recorder`."""
-        self.close()
+        if self.multi_episode and hdf5_file == self.hdf5_file:
+            self.end_episode()
+        else:
+            self.close()
         self.hdf5_file = hdf5_file
         self.recorded_frames = 1
         self.recording = True
         self.episode_id += 1
 
-    def capture_frame(self, observations, action):
-        """Captures frame to video."""
+    def _allocate_columns(self, frame, capacity):
+        self.columns = {
+            name: np.empty((capacity,) + np.shape(value), get_column_dtype(name, value))
+            for name, value in frame.items()
+        }
+        self.columns_length = 0
+
+    def _create_datasets(self):
+        """Open the file and create one resizable dataset per column."""
+        self.file = h5py.File(self.hdf5_file, "w")
+        for name, column in self.columns.items():
+            frame_shape = column.shape[1:]
+            chunk_length = self.chunk_length or max(1, CHUNK_NBYTES // max(column[0].nbytes, 1))
+            self.datasets[name] = self.file.create_dataset(
+                name,
+                shape=(0,) + frame_shape,
+                maxshape=(None,) + frame_shape,
+                dtype=column.dtype,
+                chunks=(chunk_length,) + frame_shape,
+                **self.compression_kwargs,
+            )
+        self.episode_index = self.file.create_dataset(
+            "episode_index", shape=(0, 2), maxshape=(None, 2), dtype=np.int64, chunks=(1024, 2)
+        )
+
+    def _flush(self):
+        """Append the frames of the columns to the datasets."""
+        if self.columns_length == 0:
+            return
+        for name, dataset in self.datasets.items():
+            length = dataset.shape[0]
+            dataset.resize(length + self.columns_length, axis=0)
+            dataset[length:] = self.columns[name][: self.columns_length]
+        self.columns_length = 0
+
+    def end_episode(self):
+        """Ends the episode being recorded by saving its offsets in the episode index."""
+        if self.file is None or self.num_frames == self.episode_start:
+            return
+        index = self.episode_index.shape[0]
+        self.episode_index.resize(index + 1, axis=0)
+        self.episode_index[index] = (self.episode_start, self.num_frames)
+        self.episode_start = self.num_frames
+
+    def capture_frame(self, observations, action, reward=None, terminated=None, truncated=None, info=None, state=None):
+        """
+        Captures frame to video.
+
+        :param observations: dict of observations
+        :param action: action
+        :param reward: reward, recorded if not None
+        :param terminated: terminated flag, recorded if not None
+        :param truncated: truncated flag, recorded if not None
+        :param info: info dict, its "timestamp" is recorded if any
+        :param state: dict of privileged state of the simulation (e.g. "cube_pos"), recorded in "state/"
+        """
         assert self.hdf5_file is not None
-        self.lst_observations.append(observations)
-        self.lst_actions.append(action)
-        self.recorded_frames += 1
+        frame = {get_dataset_name(key): value for key, value in observations.items()}
+        frame["action"] = action
+        extras = {"reward": reward, "terminated": terminated, "truncated": truncated}
+        extras["timestamp"] = None if info is None else info.get("timestamp")
+        frame.update({name: value for name, value in extras.items() if value is not None})
+        frame.update({f"state/{key}": value for key, value in (state or {}).items()})
 
-    # numpy.stack([item["image_front"] for item in self.lst_observations])
+        if self.columns is None or (
+            self.file is None and self.columns_length == 0 and self.columns.keys() != frame.keys()
+        ):
+            # One chunk in streaming mode, else the whole episode
+            if self.streaming:
+                chunk_lengths = [
+                    self.chunk_length or max(1, CHUNK_NBYTES // max(np.asarray(value).nbytes, 1))
+                    for value in frame.values()
+                ]
+                self._allocate_columns(frame, min(chunk_lengths))
+            else:
+                self._allocate_columns(frame, self.length or DEFAULT_CAPACITY)
+        elif self.columns.keys() != frame.keys():
+            missing_keys = sorted(self.columns.keys() - frame.keys())
+            extra_keys = sorted(frame.keys() - self.columns.keys())
+            raise ValueError(
+                f"Invalid frame keys, missing {missing_keys} and unexpected {extra_keys}: all the frames of a file "
+                f"must have the keys of its first frame {sorted(self.columns)}"
+            )
+        if self.streaming and self.file is None:
+            self._create_datasets()
+
+        capacity = len(next(iter(self.columns.values())))
+        if self.columns_length == capacity and not self.streaming:
+            # The episode is longer than expected, double the capacity
+            self.columns = {
+                name: np.concatenate([column, np.empty_like(column)]) for name, column in self.columns.items()
+            }
+        for name, value in frame.items():
+            self.columns[name][self.columns_length] = value
+        self.columns_length += 1
+        self.num_frames += 1
+        if self.streaming and self.columns_length == capacity:
+            self._flush()
+        self.recorded_frames += 1
 
     def close(self):
         """Closes the hdf5 file."""
-        if self.hdf5_file is not None:
+        if self.file is not None:
+            self.end_episode()
+            self._flush()
+            self.file.close()
+        elif self.hdf5_file is not None and self.columns_length > 0:
             with h5py.File(self.hdf5_file, "w") as file:
-                file.create_dataset(
-                    "observations/images/front", data=np.stack([item["image_front"] for item in self.lst_observations])
-                )
-                file.create_dataset(
-                    "observations/images/top", data=np.stack([item["image_top"] for item in self.lst_observations])
-                )
-                file.create_dataset("observations/qpos", data=np.stack([item["arm_qpos"] for item in self.lst_observations]))
-                file.create_dataset("observations/qvel", data=np.stack([item["arm_qvel"] for item in self.lst_observations]))
-                file.create_dataset("action", data=self.lst_actions)
+                for name, column in self.columns.items():
+                    file.create_dataset(name, data=column[: self.columns_length], **self.compression_kwargs)
+                file.create_dataset("episode_index", data=np.array([[0, self.columns_length]], dtype=np.int64))
+        self.file = None
+        self.datasets = {}
+        self.episode_index = None
+        self.num_frames = 0
+        self.episode_start = 0
+        self.columns_length = 0
+        if self.streaming:
+            # The next file may have other columns, the buffered columns are kept to be reused by the next episode
+            self.columns = None
+        self.recorded_frames = 1
+
+    def join(self):
+        """Wait until all the frames are written, nothing to do since they are written synchronously."""
+
+
+class ThreadedHDF5Recorder:
+    """
+    Records episodes like :class:`HDF5_Recorder`, whose methods it exposes, but does the HDF5 I/O and compression in a
+    dedicated writer thread. The frames are copied and put in a bounded queue drained by the writer thread, so the
+    environment loop only waits for the disk when the queue is full, and only with the "block" policy.
+
+    MuJoCo releases the GIL while stepping and rendering, so the simulation runs in parallel with the writes.
+
+    :param recorder: the :class:`HDF5_Recorder` used by the writer thread
+    :param queue_size: int, maximum number of pending frames, default is 64
+    :param on_full: str, what to do with a frame when the queue is full, "block" to wait for the writer thread or
+        "drop" to discard the frame, default is "block"
+    """
+
+    def __init__(self, recorder, queue_size=64, on_full="block"):
+        if on_full not in ["block", "drop"]:
+            raise ValueError(f"Invalid policy {on_full}, must be 'block' or 'drop'")
+        self.recorder = recorder
+        self.on_full = on_full
+        self.recorded_frames = 0
+        self.dropped_frames = 0
+        self.hdf5_file = None
+        self.error = None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, name="hdf5_writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            command, args = self.queue.get()
+            try:
+                if self.error is None and command != "stop":
+                    getattr(self.recorder, command)(*args)
+            except Exception as e:
+                # Raised in the environment loop by the next call, the following commands are ignored
+                self.error = e
+            finally:
+                self.queue.task_done()
+            if command == "stop":
+                break
+
+    def _check_error(self):
+        if self.error is not None:
+            raise RuntimeError("The HDF5 writer thread failed") from self.error
+
+    def start_hdf5_recorder(self, hdf5_file):
+        """Starts HDF5 recorder, see :meth:`HDF5_Recorder.start_hdf5_recorder`."""
+        self._check_error()
+        self.hdf5_file = hdf5_file
         self.recorded_frames = 1
-        self.lst_observations = []
-        self.lst_actions = []
+        self.queue.put(("start_hdf5_recorder", (hdf5_file,)))
+
+    def end_episode(self):
+        """Ends the episode being recorded, see :meth:`HDF5_Recorder.end_episode`."""
+        self._check_error()
+        self.queue.put(("end_episode", ()))
+
+    def capture_frame(self, observations, action, reward=None, terminated=None, truncated=None, info=None, state=None):
+        """Copies the frame and puts it in the queue of the writer thread."""
+        assert self.hdf5_file is not None
+        self._check_error()
+        # The environment may fill the same observation buffers at each step
+        observations = {key: np.array(value) for key, value in observations.items()}
+        timestamp_info = None if info is None or "timestamp" not in info else {"timestamp": info["timestamp"]}
+        state = None if state is None else {key: np.array(value) for key, value in state.items()}
+        frame = (observations, np.array(action), reward, terminated, truncated, timestamp_info, state)
+        if self.on_full == "block":
+            self.queue.put(("capture_frame", frame))
+        else:
+            try:
+                self.queue.put_nowait(("capture_frame", frame))
+            except queue.Full:
+                self.dropped_frames += 1
+        self.recorded_frames += 1
+
+    def close(self):
+        """Closes the hdf5 file once the pending frames are written, without waiting for it."""
+        self._check_error()
+        self.recorded_frames = 1
+        self.queue.put(("close", ()))
+
+    def join(self):
+        """Wait until all the frames are written and stop the writer thread."""
+        if self.thread.is_alive():
+            self.queue.put(("stop", ()))
+            self.thread.join()
+        self._check_error()
 
 
 class RecordHDF5Wrapper(gym.Wrapper):
@@ -72,11 +377,48 @@ class RecordHDF5Wrapper(gym.Wrapper):
         length: int = 0,
         name_prefix: str = "hdf5_record",
         disable_logger: bool = False,
+        streaming: bool = True,
+        compression: str = None,
+        compression_opts: int = None,
+        background_writer: bool = False,
+        queue_size: int = 64,
+        on_full: str = "block",
+        episodes_per_file: int = 1,
+        record_state: bool = True,
     ):
+        """
+        Records the episodes of an environment in HDF5 files.
+
+        :param env: the environment
+        :param hdf5_folder: folder of the HDF5 files
+        :param length: maximum number of recorded steps per episode, 0 to record whole episodes
+        :param name_prefix: prefix of the file names
+        :param streaming: whether to append the frames to the files as they arrive, see :class:`HDF5_Recorder`
+        :param compression: compression of the datasets, "gzip", "lzf", "blosc" or None
+        :param compression_opts: compression level, see `get_compression_kwargs`
+        :param background_writer: whether to write the files in a dedicated thread, see :class:`ThreadedHDF5Recorder`
+        :param queue_size: maximum number of frames pending in the background writer
+        :param on_full: "block" or "drop", what to do with a frame when the queue of the background writer is full
+        :param episodes_per_file: number of episodes per file, 1 writes `{name_prefix}-episode-{id}.hdf5` files, N > 1
+            writes shards `{name_prefix}-shard-{id}.hdf5` of N episodes and 0 writes all the episodes in
+            `{name_prefix}.hdf5`, the episodes being located by the `episode_index` dataset
+        :param record_state: whether to record the privileged state of the simulation (object and target positions)
+        """
         gym.Wrapper.__init__(self, env)
 
         self.hdf5_folder = os.path.abspath(hdf5_folder)
-        self.hdf5_recorder = HDF5_Recorder()
+        self.episodes_per_file = episodes_per_file
+        self.record_state = record_state
+        self.hdf5_recorder = HDF5_Recorder(
+            streaming=streaming,
+            compression=compression,
+            compression_opts=compression_opts,
+            multi_episode=episodes_per_file != 1,
+            length=length or None,
+        )
+        if background_writer:
+            # Write the files in a dedicated thread, see `ThreadedHDF5Recorder`
+            self.hdf5_recorder = ThreadedHDF5Recorder(self.hdf5_recorder, queue_size=queue_size, on_full=on_full)
 
         # Create output folder if needed
         if os.path.isdir(self.hdf5_folder):
@@ -90,6 +432,7 @@ class RecordHDF5Wrapper(gym.Wrapper):
         self.length = length
         self.terminated = False
         self.episode_id = 0
+        self.recording = False
         self.env = env
 
         try:
@@ -101,14 +444,35 @@ class RecordHDF5Wrapper(gym.Wrapper):
         """Reset the environment using kwargs and then starts recording if video enabled."""
         observations, _ = self.env.reset(**kwargs)
         self.terminated = False
-        self.start_hdf5_recorder()
+        # The recorder has already been restarted if the previous episode ended within `step`
+        if not self.recording or self.hdf5_recorder.recorded_frames > 1:
+            self.start_hdf5_recorder()
         return observations
 
+    def get_hdf5_file_name(self):
+        """Name of the file of the current episode, see `episodes_per_file`."""
+        if self.episodes_per_file == 1:
+            return f"{self.name_prefix}-episode-{self.episode_id}.hdf5"
+        if self.episodes_per_file == 0:
+            return f"{self.name_prefix}.hdf5"
+        return f"{self.name_prefix}-shard-{self.episode_id // self.episodes_per_file}.hdf5"
+
+    def get_privileged_state(self):
+        """Positions of the objects and of the target of the task, not always part of the observation."""
+        env = self.env.unwrapped
+        if not self.record_state or not hasattr(env, "object_pos"):
+            return None
+        state = {f"{name}_pos": pos for name, pos in env.object_pos.items()}
+        if hasattr(env, "target_pos"):
+            state["target_pos"] = env.target_pos
+        return state
+
     def start_hdf5_recorder(self):
         """Starts video recorder using :class:`video_recorder.VideoRecorder`."""
-        self.close_hdf5_recorder()
+        if self.episodes_per_file == 1:
+            self.close_hdf5_recorder()
 
-        video_name = f"{self.name_prefix}-episode-{self.episode_id}.hdf5"
+        video_name = self.get_hdf5_file_name()
         self.hdf5_recorder.start_hdf5_recorder(hdf5_file=os.path.join(self.hdf5_folder, video_name))
         self.recording = True
         self.episode_id += 1
@@ -122,11 +486,24 @@ class RecordHDF5Wrapper(gym.Wrapper):
         if self.recording:
             assert self.hdf5_recorder is not None
 
-            self.hdf5_recorder.capture_frame(observations, action)
+            self.hdf5_recorder.capture_frame(
+                observations,
+                action,
+                reward=rewards,
+                terminated=terminateds,
+                truncated=truncateds,
+                info=infos,
+                state=self.get_privileged_state(),
+            )
 
             if self.length > 0:
                 if self.hdf5_recorder.recorded_frames > self.length:
-                    self.close_hdf5_recorder()
+                    # Stop recording until the next episode
+                    if self.episodes_per_file == 1:
+                        self.close_hdf5_recorder()
+                    else:
+                        self.hdf5_recorder.end_episode()
+                    self.recording = False
             else:
                 if not self.is_vector_env:
                     if terminateds or truncateds:
@@ -149,3 +526,4 @@ class RecordHDF5Wrapper(gym.Wrapper):
         """Closes the wrapper then the video recorder."""
         super().close()
         self.close_hdf5_recorder()
+        self.hdf5_recorder.join()
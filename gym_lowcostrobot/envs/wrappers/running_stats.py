@@ -0,0 +1,51 @@
+"""Wrapper computing the statistics of the observations and actions."""
+
+import gymnasium as gym
+import numpy as np
+
+from gym_lowcostrobot.stats import DictRunningStats
+
+
+class RunningStatsWrapper(gym.Wrapper):
+    """
+    ## Description
+
+    Computes the running statistics of the observations and actions of an environment, e.g. to normalize them for
+    training, without a second pass over the recorded data.
+
+    The statistics are updated with each observation returned by `reset` and `step`, and with each action, see
+    `DictRunningStats`: the images get per-channel statistics in [0, 1]. The statistics of parallel environments are
+    combined with `stats.merge`.
+
+    ## Arguments
+
+    - `env (gym.Env)`: the environment, with dict observations.
+    - `keys (list)`: the observation keys to compute statistics of, default is None for all the numeric keys.
+    - `record_action (bool)`: whether to compute the statistics of the actions, in the "action" key, default is True.
+    """
+
+    def __init__(self, env, keys=None, record_action=True):
+        super().__init__(env)
+        if keys is not None and record_action:
+            keys = list(keys) + ["action"]
+        self.stats = DictRunningStats(keys)
+        self.record_action = record_action
+
+    def reset(self, **kwargs):
+        observation, info = self.env.reset(**kwargs)
+        self.stats.update_frame(observation)
+        return observation, info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        frame = dict(observation)
+        if self.record_action:
+            frame["action"] = np.asarray(action)
+        self.stats.update_frame(frame)
+        return observation, reward, terminated, truncated, info
+
+    def get_stats(self):
+        """
+        :return: dict of the statistics of each key, see `RunningStats.to_dict`
+        """
+        return self.stats.to_dict()
@@ -0,0 +1,291 @@
+import mujoco
+import numpy as np
+
+
+class BatchedInverseKinematics:
+    """
+    Damped least squares inverse kinematics of the end effector position, solved for several worlds at once.
+
+    All the buffers (Jacobians, normal matrices, joint positions) are allocated once for the `N` worlds, and each
+    iteration solves the `N` regularized normal equations `(J^T J + λI) dq = J^T e` with a single batched
+    `np.linalg.solve`, instead of inverting the matrices one by one.
+
+    The first iteration uses the kinematics of the worlds as they are, which is what the environments do in the "ee"
+    action mode. The following iterations, if any, evaluate the kinematics of the new joint positions on scratch data,
+    so the worlds are never modified. With a tolerance, the worlds whose end effector is close enough to the target
+    stop iterating, and the solve ends when all of them have converged.
+
+    With an `IKCache`, each world starts from the cached joint positions of its target when they place the end effector
+    closer to the target than the current ones, and the converged solutions are added to the cache.
+
+    :param model: mujoco model shared by all the worlds
+    :param datas: list of mujoco data, one per world
+    :param body_id: int, id of the end effector body
+    :param qpos_adr: int, address of the first arm joint in qpos, the arm joints being consecutive
+    :param dof_adr: int, address of the first arm joint in qvel
+    :param nb_dof: int, number of degrees of freedom of the arm
+    """
+
+    def __init__(self, model, datas, body_id, qpos_adr, dof_adr, nb_dof=6):
+        self.model = model
+        self.datas = datas
+        self.body_id = body_id
+        self.nb_dof = nb_dof
+        self.qpos_slice = slice(qpos_adr, qpos_adr + nb_dof)
+        self.dof_slice = slice(dof_adr, dof_adr + nb_dof)
+
+        num_worlds = len(datas)
+        self.jacp = np.zeros((num_worlds, 3, model.nv))
+        self.ee_pos = np.zeros((num_worlds, 3))
+        self.qpos = np.zeros((num_worlds, nb_dof))
+        self.normal_matrix = np.zeros((num_worlds, nb_dof, nb_dof))
+        self.eye = np.eye(nb_dof)
+        self.scratch_datas = None
+
+    def _update_jacobians(self, datas):
+        for index, data in enumerate(datas):
+            mujoco.mj_jacBody(self.model, data, self.jacp[index], None, self.body_id)
+            self.ee_pos[index] = data.xpos[self.body_id]
+
+    def _update_scratch_kinematics(self):
+        if self.scratch_datas is None:
+            self.scratch_datas = [mujoco.MjData(self.model) for _ in self.datas]
+        for index, (data, scratch_data) in enumerate(zip(self.datas, self.scratch_datas)):
+            scratch_data.qpos[:] = data.qpos
+            scratch_data.qpos[self.qpos_slice] = self.qpos[index]
+            mujoco.mj_kinematics(self.model, scratch_data)
+            mujoco.mj_comPos(self.model, scratch_data)
+        self._update_jacobians(self.scratch_datas)
+
+    def solve(
+        self,
+        ee_target_pos,
+        step=0.2,
+        regularization=1e-6,
+        home_position=None,
+        nullspace_weight=0.0,
+        num_iterations=1,
+        tol=None,
+        ik_cache=None,
+    ):
+        """
+        Compute the joint positions moving the end effectors of the worlds toward their targets.
+
+        :param ee_target_pos: numpy array of target end effector positions of shape (N, 3)
+        :param step: float, step size of each iteration
+        :param regularization: float, regularization factor of the normal equations
+        :param home_position: numpy array of home joint positions to regularize towards, of shape (nb_dof,) or
+            (N, nb_dof), default is zero
+        :param nullspace_weight: float, weight of the regularization toward the home position
+        :param num_iterations: int, maximum number of iterations
+        :param tol: float, distance to the target below which a world has converged, default is None to always run
+            `num_iterations` iterations
+        :param ik_cache: `IKCache` used to warm start the worlds, default is None
+        :return: numpy array of target joint positions of shape (N, nb_dof), overwritten by the next call
+        """
+        ee_target_pos = np.asarray(ee_target_pos).reshape(len(self.datas), 3)
+        for index, data in enumerate(self.datas):
+            self.qpos[index] = data.qpos[self.qpos_slice]
+        self._update_jacobians(self.datas)
+        if ik_cache is not None:
+            ik_cache.warm_start(ee_target_pos, self.qpos, self.ee_pos)
+            self._update_scratch_kinematics()
+
+        self.converged = np.zeros(len(self.datas), dtype=bool)
+        for iteration in range(num_iterations):
+            if iteration > 0:
+                self._update_scratch_kinematics()
+            delta_pos = ee_target_pos - self.ee_pos
+            if tol is not None:
+                # The converged worlds keep their joint positions
+                self.converged |= np.linalg.norm(delta_pos, axis=1) < tol
+                if self.converged.all():
+                    break
+            jac = self.jacp[:, :, self.dof_slice]
+            jac_t = jac.transpose(0, 2, 1)
+
+            # Solve the regularized normal equations of all the worlds at once
+            np.matmul(jac_t, jac, out=self.normal_matrix)
+            self.normal_matrix += regularization * self.eye
+            qdot = np.linalg.solve(self.normal_matrix, (jac_t @ delta_pos[:, :, None]))[:, :, 0]
+
+            # Add nullspace regularization to keep joint positions close to the home position
+            if nullspace_weight:
+                home = 0.0 if home_position is None else home_position
+                qdot += nullspace_weight * (home - self.qpos)
+
+            # Normalize joint velocities to avoid excessive movements
+            qdot_norm = np.linalg.norm(qdot, axis=1, keepdims=True)
+            qdot /= np.maximum(qdot_norm, 1.0)
+            qdot[self.converged] = 0.0
+
+            self.qpos += qdot * step
+        else:
+            if tol is not None:
+                # The step of the last iteration is applied after its check, check the final joint positions too
+                self._update_scratch_kinematics()
+                self.converged |= np.linalg.norm(ee_target_pos - self.ee_pos, axis=1) < tol
+
+        if ik_cache is not None and ik_cache.learn:
+            ik_cache.insert(ee_target_pos[self.converged], self.qpos[self.converged])
+        return self.qpos
+
+
+class IKCache:
+    """
+    Voxel grid over the reachable workspace of the end effector, mapping end effector positions to joint positions.
+
+    Each voxel stores at most one configuration, the one whose end effector is the closest to the voxel center. The
+    cache is built offline by sampling random joint positions within the joint ranges (`build`), can be saved and
+    loaded with `save` and `load`, and can learn online from the converged solutions of `BatchedInverseKinematics`.
+    Lookups are vectorized over the targets.
+
+    :param low: numpy array of the lower corner of the grid, shape (3,)
+    :param shape: tuple of the number of voxels along each axis
+    :param voxel_size: float, size of the voxels
+    :param nb_dof: int, number of degrees of freedom of the arm
+    :param learn: bool, whether `BatchedInverseKinematics` adds its converged solutions to the cache
+    """
+
+    def __init__(self, low, shape, voxel_size=0.01, nb_dof=6, learn=True):
+        self.low = np.asarray(low, dtype=np.float64)
+        self.shape = tuple(int(size) for size in shape)
+        self.voxel_size = voxel_size
+        self.learn = learn
+        self.qpos = np.zeros(self.shape + (nb_dof,))
+        self.ee_pos = np.zeros(self.shape + (3,))
+        self.filled = np.zeros(self.shape, dtype=bool)
+
+    @classmethod
+    def build(
+        cls, model, body_id, qpos_adr, nb_dof=6, num_samples=100_000, voxel_size=0.01, margin=0.05, seed=None
+    ):
+        """
+        Build a cache by sampling random joint positions of the arm and computing the end effector positions.
+
+        :param model: mujoco model
+        :param body_id: int, id of the end effector body
+        :param qpos_adr: int, address of the first arm joint in qpos, the arm joints being consecutive
+        :param nb_dof: int, number of degrees of freedom of the arm
+        :param num_samples: int, number of sampled configurations
+        :param voxel_size: float, size of the voxels
+        :param margin: float, margin added around the sampled workspace, for the solutions learned online
+        :param seed: int, seed of the sampling
+        :return: the cache
+        """
+        # Sample the joint positions within the ranges of the joints, [-pi, pi] for the unlimited ones
+        joint_ids = [np.flatnonzero(model.jnt_qposadr == qpos_adr + i)[0] for i in range(nb_dof)]
+        limited = model.jnt_limited[joint_ids].astype(bool)
+        low = np.where(limited, model.jnt_range[joint_ids, 0], -np.pi)
+        high = np.where(limited, model.jnt_range[joint_ids, 1], np.pi)
+        qpos = np.random.default_rng(seed).uniform(low, high, size=(num_samples, nb_dof))
+
+        data = mujoco.MjData(model)
+        ee_pos = np.empty((num_samples, 3))
+        for index in range(num_samples):
+            data.qpos[qpos_adr : qpos_adr + nb_dof] = qpos[index]
+            mujoco.mj_kinematics(model, data)
+            ee_pos[index] = data.xpos[body_id]
+
+        grid_low = ee_pos.min(axis=0) - margin
+        shape = np.ceil((ee_pos.max(axis=0) + margin - grid_low) / voxel_size).astype(int)
+        cache = cls(grid_low, shape, voxel_size=voxel_size, nb_dof=nb_dof)
+        cache.insert(ee_pos, qpos)
+        return cache
+
+    @classmethod
+    def from_env(cls, env, **kwargs):
+        """Build a cache for the end effector and the arm of an environment, see `build`."""
+        env = env.unwrapped
+        return cls.build(env.model, env.ee_id, env.arm_qpos_adr, nb_dof=env.nb_dof, **kwargs)
+
+    def _voxel_indices(self, positions):
+        """Indices of the voxels containing the positions, and the mask of the positions inside the grid."""
+        indices = np.floor((positions - self.low) / self.voxel_size).astype(np.int64)
+        inside = np.all((indices >= 0) & (indices < self.shape), axis=1)
+        return indices, inside
+
+    def insert(self, ee_pos, qpos):
+        """
+        Add configurations to the cache, keeping in each voxel the one closest to the voxel center.
+
+        :param ee_pos: numpy array of end effector positions of shape (M, 3)
+        :param qpos: numpy array of the corresponding joint positions of shape (M, nb_dof)
+        """
+        ee_pos = np.asarray(ee_pos).reshape(-1, 3)
+        qpos = np.asarray(qpos).reshape(len(ee_pos), self.qpos.shape[-1])
+        indices, inside = self._voxel_indices(ee_pos)
+        ee_pos, qpos, indices = ee_pos[inside], qpos[inside], indices[inside]
+        if not len(ee_pos):
+            return
+
+        # Compare the new configurations with the stored ones, the closest to the center is written last and wins
+        voxels = tuple(indices.T)
+        centers = self.low + (indices + 0.5) * self.voxel_size
+        stored = self.filled[voxels]
+        candidates_pos = np.concatenate([ee_pos, self.ee_pos[voxels][stored]])
+        candidates_qpos = np.concatenate([qpos, self.qpos[voxels][stored]])
+        candidates_indices = np.concatenate([indices, indices[stored]])
+        distances = np.linalg.norm(candidates_pos - np.concatenate([centers, centers[stored]]), axis=1)
+        order = np.argsort(-distances, kind="stable")
+        voxels = tuple(candidates_indices[order].T)
+        self.ee_pos[voxels] = candidates_pos[order]
+        self.qpos[voxels] = candidates_qpos[order]
+        self.filled[voxels] = True
+
+    def lookup(self, ee_target_pos):
+        """
+        Look up the configurations of the voxels containing the targets.
+
+        :param ee_target_pos: numpy array of target end effector positions of shape (N, 3)
+        :return: tuple of the joint positions (N, nb_dof), the end effector positions (N, 3) and the mask of the
+            targets found in the cache (N,)
+        """
+        indices, inside = self._voxel_indices(np.asarray(ee_target_pos).reshape(-1, 3))
+        indices[~inside] = 0
+        voxels = tuple(indices.T)
+        found = inside & self.filled[voxels]
+        return self.qpos[voxels], self.ee_pos[voxels], found
+
+    def warm_start(self, ee_target_pos, qpos, ee_pos):
+        """
+        Replace in place the joint positions by the cached ones, when these place the end effector closer to the
+        target.
+
+        :param ee_target_pos: numpy array of target end effector positions of shape (N, 3)
+        :param qpos: numpy array of current joint positions of shape (N, nb_dof), modified in place
+        :param ee_pos: numpy array of current end effector positions of shape (N, 3)
+        :return: numpy array, mask of the warm started worlds
+        """
+        cached_qpos, cached_ee_pos, found = self.lookup(ee_target_pos)
+        closer = np.linalg.norm(cached_ee_pos - ee_target_pos, axis=1) < np.linalg.norm(ee_pos - ee_target_pos, axis=1)
+        use_cache = found & closer
+        qpos[use_cache] = cached_qpos[use_cache]
+        return use_cache
+
+    def save(self, path):
+        """Save the cache to a `.npz` file."""
+        np.savez_compressed(
+            path,
+            low=self.low,
+            voxel_size=self.voxel_size,
+            qpos=self.qpos,
+            ee_pos=self.ee_pos,
+            filled=self.filled,
+        )
+
+    @classmethod
+    def load(cls, path, learn=True):
+        """Load a cache saved with `save`."""
+        with np.load(path) as arrays:
+            cache = cls(
+                arrays["low"],
+                arrays["filled"].shape,
+                voxel_size=float(arrays["voxel_size"]),
+                nb_dof=arrays["qpos"].shape[-1],
+                learn=learn,
+            )
+            cache.qpos[:] = arrays["qpos"]
+            cache.ee_pos[:] = arrays["ee_pos"]
+            cache.filled[:] = arrays["filled"]
+        return cache
@@ -0,0 +1,211 @@
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from gym_lowcostrobot.stats import DictRunningStats
+from gym_lowcostrobot.video import get_video_file_name
+
+
+def _to_arrow(values):
+    """Convert an array of shape (N, *shape) to an arrow array of nested fixed size lists."""
+    array = pa.array(values.reshape(-1))
+    for size in reversed(values.shape[1:]):
+        array = pa.FixedSizeListArray.from_arrays(array, size)
+    return array
+
+
+def _write_json(path, data):
+    # Write to a temporary file first, so that a crash never leaves a partial file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class LeRobotDatasetWriter:
+    """
+    ## Description
+
+    Writes a LeRobot dataset incrementally, during the recording.
+
+    The frames of the current episode are kept in memory until `save_episode` is called. The episode is then written to
+    its own Parquet file, `data/episode_{index:06d}.parquet`, and forgotten, and the metadata files are updated:
+
+    - `meta_data/info.json`: the frame rate, whether there are videos, and the number of episodes and frames.
+    - `meta_data/episode_data_index.json`: the `from` (included) and `to` (excluded) global frame indices of the
+        episodes.
+    - `meta_data/stats.json`: the mean, std, min and max of the numeric keys and of the images, updated online with
+        `DictRunningStats`. The images are not stored, they are only given to `add_frame` for their per-channel
+        statistics, of shape (C, 1, 1) as in the LeRobot datasets.
+
+    - `meta_data/running_stats.npz`: the accumulators of the statistics, to resume the recording.
+
+    So the memory used does not grow with the number of episodes, and a crash only loses the episode being recorded.
+    A writer created on the root of an existing dataset resumes it, the next episodes being appended to it.
+    The Parquet files can be loaded as a Hugging Face dataset with
+    `datasets.Dataset.from_parquet(writer.episode_paths)`.
+
+    Besides the keys given to `add_frame`, each frame gets the `episode_index`, `frame_index`, `index` (global frame
+    index), `timestamp` and `next.done` columns, and a `observation.images.{key}` column per video key, referencing
+    the frame in `videos/{key}_episode_{index:06d}.mp4` (see `VideoRecorder`).
+
+    ## Arguments
+
+    - `root (str)`: the directory of the dataset.
+    - `fps (float)`: the frame rate of the recording, giving the default timestamps `frame_index / fps`.
+    - `video_keys (list)`: the keys of the cameras recorded as videos, e.g. `["image_top", "image_front"]`, default is
+        no video.
+    """
+
+    def __init__(self, root, fps, video_keys=()):
+        self.root = os.fspath(root)
+        self.fps = fps
+        self.video_keys = list(video_keys)
+        self.data_dir = os.path.join(self.root, "data")
+        self.meta_data_dir = os.path.join(self.root, "meta_data")
+        os.makedirs(self.data_dir, exist_ok=True)
+        os.makedirs(self.meta_data_dir, exist_ok=True)
+
+        self.episode_paths = []
+        self.episode_data_index = {"from": [], "to": []}
+        self.stats = DictRunningStats()
+        # Statistics of the images of the current episode, merged when it is saved
+        self.episode_image_stats = DictRunningStats()
+        self.total_frames = 0
+        self.episode_buffer = None
+        self.timestamps = []
+        self._resume()
+
+    def _resume(self):
+        """Load the metadata of the episodes already saved in `root`, if any."""
+        info_path = os.path.join(self.meta_data_dir, "info.json")
+        if not os.path.exists(info_path):
+            if any(name.endswith(".parquet") for name in os.listdir(self.data_dir)):
+                raise ValueError(f"{self.data_dir} holds episodes but no {info_path}, can not resume the dataset")
+            return
+        with open(info_path) as f:
+            info = json.load(f)
+        if info["fps"] != self.fps:
+            raise ValueError(f"Invalid fps {self.fps}, the dataset in {self.root} is recorded at {info['fps']} fps")
+        with open(os.path.join(self.meta_data_dir, "episode_data_index.json")) as f:
+            self.episode_data_index = json.load(f)
+        self.episode_paths = [
+            os.path.join(self.data_dir, f"episode_{episode_index:06d}.parquet")
+            for episode_index in range(info["total_episodes"])
+        ]
+        self.total_frames = info["total_frames"]
+        self.stats = DictRunningStats.load(os.path.join(self.meta_data_dir, "running_stats.npz"))
+
+    @property
+    def num_episodes(self):
+        return len(self.episode_paths)
+
+    @property
+    def info(self):
+        return {
+            "fps": self.fps,
+            "video": int(bool(self.video_keys)),
+            "total_episodes": self.num_episodes,
+            "total_frames": self.total_frames,
+        }
+
+    def add_frame(self, frame, timestamp=None, images=None):
+        """
+        Add a frame to the current episode.
+
+        :param frame: dict of the values of the frame, e.g. "observation.state" and "action", the values are copied
+        :param timestamp: float, time of the frame in the episode, default is `frame_index / fps`
+        :param images: dict of the images of the video keys, e.g. `{"image_top": image}`, only used for the statistics
+        """
+        if images is not None:
+            self.episode_image_stats.update_frame(
+                {f"observation.images.{key}": image for key, image in images.items() if key in self.video_keys}
+            )
+        if self.episode_buffer is None:
+            self.episode_buffer = {key: [] for key in frame}
+        elif frame.keys() != self.episode_buffer.keys():
+            raise ValueError(f"Invalid frame keys {list(frame)}, expected {list(self.episode_buffer)}")
+        for key, value in frame.items():
+            self.episode_buffer[key].append(np.array(value))
+        if timestamp is None:
+            timestamp = len(self.timestamps) / self.fps
+        self.timestamps.append(timestamp)
+
+    def discard_episode(self):
+        """Forget the frames of the current episode."""
+        self.episode_buffer = None
+        self.timestamps = []
+        self.episode_image_stats = DictRunningStats()
+
+    def save_episode(self):
+        """
+        Write the current episode to its Parquet file and update the metadata.
+
+        :return: int, index of the episode
+        """
+        if not self.timestamps:
+            raise ValueError("No frame to save, add frames with `add_frame` first")
+        episode_index = self.num_episodes
+        num_frames = len(self.timestamps)
+        frame_index = np.arange(num_frames)
+        timestamps = np.array(self.timestamps, dtype=np.float32)
+
+        columns = {key: np.stack(values) for key, values in self.episode_buffer.items()}
+        self.stats.update(columns)
+        self.stats.merge(self.episode_image_stats)
+        columns["episode_index"] = np.full(num_frames, episode_index, dtype=np.int64)
+        columns["frame_index"] = frame_index
+        columns["index"] = self.total_frames + frame_index
+        columns["timestamp"] = timestamps
+        columns["next.done"] = frame_index == num_frames - 1
+
+        arrays = {key: _to_arrow(values) for key, values in columns.items()}
+        for key in self.video_keys:
+            path = f"videos/{get_video_file_name(key, episode_index)}"
+            arrays[f"observation.images.{key}"] = pa.array(
+                [{"path": path, "timestamp": float(timestamp)} for timestamp in timestamps]
+            )
+
+        path = os.path.join(self.data_dir, f"episode_{episode_index:06d}.parquet")
+        pq.write_table(pa.table(arrays), path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+        self.episode_paths.append(path)
+        self.episode_data_index["from"].append(self.total_frames)
+        self.episode_data_index["to"].append(self.total_frames + num_frames)
+        self.total_frames += num_frames
+        self.discard_episode()
+        self.write_meta_data()
+        return episode_index
+
+    def get_stats(self):
+        """
+        :return: dict of the statistics of the numeric keys and images, see `RunningStats.to_dict`
+        """
+        stats = self.stats.to_dict()
+        for key, key_stats in stats.items():
+            if key.startswith("observation.images."):
+                stats[key] = {name: value.reshape(-1, 1, 1) for name, value in key_stats.items()}
+        return stats
+
+    def write_meta_data(self):
+        """Write the info, episode data index and statistics of the saved episodes."""
+        stats = {
+            key: {name: np.asarray(value).tolist() for name, value in key_stats.items()}
+            for key, key_stats in self.get_stats().items()
+        }
+        _write_json(os.path.join(self.meta_data_dir, "info.json"), self.info)
+        _write_json(os.path.join(self.meta_data_dir, "episode_data_index.json"), self.episode_data_index)
+        _write_json(os.path.join(self.meta_data_dir, "stats.json"), stats)
+        path = os.path.join(self.meta_data_dir, "running_stats.npz")
+        with open(path + ".tmp", "wb") as f:
+            self.stats.save(f)
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        """Save the current episode, if any."""
+        if self.timestamps:
+            self.save_episode()
@@ -0,0 +1,159 @@
+import copy
+import hashlib
+import os
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+
+import mujoco
+
+# Directory of the compiled models, set it to an empty string to disable the cache on disk
+CACHE_DIR_ENV_VAR = "GYM_LOWCOSTROBOT_CACHE_DIR"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "gym_lowcostrobot")
+
+# Attributes of the asset elements referencing a file, and the compiler directory they are relative to
+_ASSET_FILE_ATTRIBUTES = {
+    "mesh": ("meshdir", ["file"]),
+    "skin": ("meshdir", ["file"]),
+    "hfield": ("meshdir", ["file"]),
+    "texture": ("texturedir", ["file", "fileright", "fileleft", "fileup", "filedown", "filefront", "fileback"]),
+}
+
+# Compiled models of the process, by scene path, with the signature of the files they were compiled from
+_models = {}
+_lock = threading.Lock()
+
+
+def get_cache_dir():
+    """
+    Get the directory where the compiled models are saved.
+
+    :return: str, the directory, or None if the cache on disk is disabled
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV_VAR, DEFAULT_CACHE_DIR)
+    return cache_dir or None
+
+
+def scene_dependencies(path):
+    """
+    List the files a scene is compiled from: the scene file, the included files and the referenced assets.
+
+    :param path: str, path of the scene file
+    :return: list of absolute paths
+    """
+    path = os.path.abspath(path)
+    model_dir = os.path.dirname(path)
+    xml_files = []
+    assets = []
+    compiler = {}
+
+    def parse(xml_path):
+        xml_files.append(xml_path)
+        for element in ET.parse(xml_path).getroot().iter():
+            if element.tag == "include":
+                # Included files are relative to the directory of the main scene file
+                parse(os.path.join(model_dir, element.get("file")))
+            elif element.tag == "compiler":
+                compiler.update(element.attrib)
+            elif element.tag in _ASSET_FILE_ATTRIBUTES:
+                directory, attributes = _ASSET_FILE_ATTRIBUTES[element.tag]
+                files = [element.get(attribute) for attribute in attributes if element.get(attribute)]
+                assets.extend((directory, file) for file in files)
+
+    parse(path)
+
+    # The asset directories are only known once all the compiler elements have been read
+    dependencies = list(xml_files)
+    for directory, file in assets:
+        asset_dir = compiler.get(directory, compiler.get("assetdir", ""))
+        dependencies.append(os.path.normpath(os.path.join(model_dir, asset_dir, file)))
+    return list(dict.fromkeys(dependencies))
+
+
+def _signature(dependencies):
+    """Cheap signature of the dependencies, used to detect changes without hashing the files."""
+    signature = []
+    for file in dependencies:
+        stat = os.stat(file)
+        signature.append((file, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def _hash_dependencies(path, dependencies):
+    """Hash the content of the dependencies together with the MuJoCo version, which defines the MJB format."""
+    digest = hashlib.sha256(mujoco.__version__.encode())
+    model_dir = os.path.dirname(os.path.abspath(path))
+    for file in dependencies:
+        digest.update(os.path.relpath(file, model_dir).encode())
+        with open(file, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def _load_or_compile(path, dependencies, cache_dir):
+    if cache_dir is None:
+        return mujoco.MjModel.from_xml_path(path)
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    mjb_path = os.path.join(cache_dir, f"{name}-{_hash_dependencies(path, dependencies)[:16]}.mjb")
+    if os.path.isfile(mjb_path):
+        try:
+            return mujoco.MjModel.from_binary_path(mjb_path)
+        except ValueError:
+            pass  # corrupted file, compile the scene again and overwrite it
+
+    model = mujoco.MjModel.from_xml_path(path)
+    try:
+        # Write to a temporary file first, so that concurrent processes never read a partial file
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".mjb", dir=cache_dir)
+        os.close(fd)
+        mujoco.mj_saveModel(model, tmp_path, None)
+        os.replace(tmp_path, mjb_path)
+    except OSError:
+        pass  # the cache on disk is an optimization, e.g. the directory may be read-only
+    return model
+
+
+def load_model(path, cache_dir=None):
+    """
+    Load a scene, compiling it at most once per process and once per machine.
+
+    The first call for a scene in a process loads the compiled binary model (MJB) from the cache directory, or compiles
+    the scene and saves it there. The MJB file is keyed by the hash of the scene, included and asset files and of the
+    MuJoCo version, so editing any of them triggers a new compilation. The following calls only check the size and
+    modification time of these files.
+
+    Each call returns a new copy of the model, which can be modified (e.g. `geom_pos` of a target) without affecting
+    the other environments.
+
+    :param path: str, path of the scene file
+    :param cache_dir: str, directory of the compiled models, default is given by `get_cache_dir`
+    :return: mujoco.MjModel
+    """
+    path = os.path.abspath(path)
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+
+    with _lock:
+        cached = _models.get(path)
+        if cached is not None:
+            dependencies, signature, model = cached
+            try:
+                if _signature(dependencies) != signature:
+                    cached = None
+            except OSError:
+                cached = None
+        if cached is None:
+            dependencies = scene_dependencies(path)
+            signature = _signature(dependencies)
+            model = _load_or_compile(path, dependencies, cache_dir)
+            _models[path] = (dependencies, signature, model)
+
+    return copy.copy(model)
+
+
+def clear_cache():
+    """Clear the compiled models of the process, the files on disk are kept."""
+    with _lock:
+        _models.clear()
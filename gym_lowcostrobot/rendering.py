@@ -0,0 +1,424 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+
+import mujoco
+import numpy as np
+
+# OpenGL backends of MuJoCo, "egl" and "osmesa" render without a display
+BACKENDS = ("egl", "osmesa", "glfw")
+
+# Values of MUJOCO_GL letting MuJoCo choose the backend
+_DEFAULT_MUJOCO_GL = ("", "enable", "enabled", "on", "true", "1")
+
+# Default size of the camera images
+DEFAULT_IMAGE_HEIGHT = 240
+DEFAULT_IMAGE_WIDTH = 320
+
+# Luma weights of the RGB channels (ITU-R BT.601) for the grayscale conversion
+GRAYSCALE_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def is_headless():
+    """Whether the process runs without a display, e.g. on a compute node."""
+    return sys.platform.startswith("linux") and not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY")
+
+
+def select_backend(backend=None):
+    """
+    Select the OpenGL backend used to render the cameras.
+
+    :param backend: str, "egl", "osmesa" or "glfw", default is None for the `MUJOCO_GL` environment variable if set,
+        else "egl" on headless machines and "glfw" otherwise
+    :return: str, the backend
+    """
+    if backend is None:
+        backend = os.environ.get("MUJOCO_GL", "").lower().strip()
+        if backend in _DEFAULT_MUJOCO_GL:
+            backend = "egl" if is_headless() else "glfw"
+    if backend not in BACKENDS:
+        raise ValueError(f"Invalid render backend '{backend}', must be in {BACKENDS}")
+    return backend
+
+
+def reduce_image(image, downsample=1, grayscale=False, out=None):
+    """
+    Downsample an image by averaging blocks of `downsample` x `downsample` pixels, and convert it to grayscale.
+
+    :param image: uint8 array of shape (H, W, 3)
+    :param downsample: int, the downsampling factor, default is 1
+    :param grayscale: bool, whether to convert the image to grayscale, default is False
+    :param out: uint8 array of shape (H // downsample, W // downsample, 1 if grayscale else 3), default is None to
+        allocate a new array
+    :return: the reduced image, `out` if given
+    """
+    height, width = image.shape[0] // downsample, image.shape[1] // downsample
+    if out is None:
+        out = np.empty((height, width, 1 if grayscale else 3), dtype=np.uint8)
+    if downsample == 1 and not grayscale:
+        out[:] = image
+        return out
+    pixels = image[: height * downsample, : width * downsample].reshape(height, downsample, width, downsample, 3)
+    pixels = pixels.mean(axis=(1, 3), dtype=np.float32)
+    if grayscale:
+        pixels = pixels @ GRAYSCALE_WEIGHTS[:, None]
+    np.rint(pixels, out=pixels)
+    out[:] = pixels
+    return out
+
+
+def _get_gl_context_class(backend):
+    if backend == "egl":
+        from mujoco.egl import GLContext
+    elif backend == "osmesa":
+        from mujoco.osmesa import GLContext
+    else:
+        from mujoco.glfw import GLContext
+    return GLContext
+
+
+def _release_current_context(backend):
+    """Release the GL context current on the calling thread, as done by the `free` method of the MuJoCo contexts."""
+    if backend == "egl":
+        from mujoco import egl
+
+        egl.EGL.eglMakeCurrent(egl.EGL_DISPLAY, egl.EGL.EGL_NO_SURFACE, egl.EGL.EGL_NO_SURFACE, egl.EGL.EGL_NO_CONTEXT)
+    elif backend == "osmesa":
+        from OpenGL import GL, osmesa
+
+        osmesa.OSMesaMakeCurrent(None, None, GL.GL_FLOAT, 0, 0)
+    else:
+        import glfw
+
+        glfw.make_context_current(None)
+
+
+class SharedGLContext:
+    """
+    ## Description
+
+    The GL context of the process, shared by the renderers of all the models and used from any thread.
+
+    An EGL or OSMesa context can only be current on one thread at a time, so the context is only made current on the
+    thread holding its lock, see `current`, and released before the lock is, for the next thread to take it.
+
+    ## Arguments
+
+    - `backend (str)`: the OpenGL backend of the context, see `select_backend`.
+    - `gl_context`: the MuJoCo GL context of the backend.
+    """
+
+    def __init__(self, backend, gl_context):
+        self.backend = backend
+        self.gl_context = gl_context
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def current(self):
+        """Hold the lock of the context, with the context current on the calling thread."""
+        with self.lock:
+            self.gl_context.make_current()
+            try:
+                yield
+            finally:
+                _release_current_context(self.backend)
+
+    def free(self):
+        # The context is current on no thread outside of `current`
+        with self.lock:
+            self.gl_context.free()
+
+
+class SharedRenderer:
+    """
+    ## Description
+
+    Renders the cameras of all the environments of a model, with a single `MjrContext` (the uploaded meshes and
+    textures, and the offscreen framebuffer) and a single scene.
+
+    Unlike `mujoco.Renderer`, the renderer does not own a GL context nor a data: each call to `render` updates the
+    scene from the model and data of the caller, then renders it in the GL context of the process. The model of the
+    caller may be a copy of the model the renderer was created with, e.g. with other geom positions, as long as their
+    meshes and textures are the same. Do not create it directly, use `get_renderer`.
+
+    The time spent in `render` is recorded, see `get_timings`.
+
+    ## Arguments
+
+    - `model (mujoco.MjModel)`: the model, giving the assets and the size of the offscreen framebuffer.
+    - `gl_context (SharedGLContext)`: the GL context of the process, current while rendering.
+    """
+
+    def __init__(self, model, gl_context):
+        self.model = model
+        self.gl_context = gl_context
+        self.max_width = model.vis.global_.offwidth
+        self.max_height = model.vis.global_.offheight
+
+        self.scene = mujoco.MjvScene(model, maxgeom=10000)
+        self.scene_option = mujoco.MjvOption()
+        self.camera = mujoco.MjvCamera()
+        with self.gl_context.current():
+            self.mjr_context = mujoco.MjrContext(model, mujoco.mjtFontScale.mjFONTSCALE_150.value)
+            mujoco.mjr_setBuffer(mujoco.mjtFramebuffer.mjFB_OFFSCREEN.value, self.mjr_context)
+
+        # Pixels read from the framebuffer, upside down, by image size
+        self.buffers = {}
+
+        self.num_frames = 0
+        self.total_time = 0.0
+        self.last_time = 0.0
+
+    def _set_camera(self, model, camera):
+        self.camera.fixedcamid = camera
+        if camera == -1:
+            self.camera.type = mujoco.mjtCamera.mjCAMERA_FREE
+            mujoco.mjv_defaultFreeCamera(model, self.camera)
+        else:
+            self.camera.type = mujoco.mjtCamera.mjCAMERA_FIXED
+
+    def render(self, model, data, camera, height=DEFAULT_IMAGE_HEIGHT, width=DEFAULT_IMAGE_WIDTH, out=None):
+        """
+        Render a camera.
+
+        :param model: mujoco.MjModel, the model of the caller, a copy of `self.model`
+        :param data: mujoco.MjData
+        :param camera: int, id of the camera, or -1 for the free camera
+        :param height: int, height of the image, ignored if `out` is given
+        :param width: int, width of the image, ignored if `out` is given
+        :param out: uint8 array of shape (height, width, 3) to render into, default is None to allocate a new array
+        :return: uint8 array of shape (height, width, 3), `out` if given
+        """
+        if out is None:
+            out = np.empty((height, width, 3), dtype=np.uint8)
+        self.render_batch(model, [data], [camera], height=out.shape[0], width=out.shape[1], out=[[out]])
+        return out
+
+    def render_batch(
+        self,
+        model,
+        datas,
+        cameras,
+        height=DEFAULT_IMAGE_HEIGHT,
+        width=DEFAULT_IMAGE_WIDTH,
+        out=None,
+        downsample=1,
+        grayscale=False,
+        prepare_world=None,
+    ):
+        """
+        Render several cameras of several worlds of the same model.
+
+        All the images are rendered with the same scene and framebuffer, in a single pass holding the GL context, and
+        are downsampled and converted while they are read, directly into `out`.
+
+        :param model: mujoco.MjModel, the model of the caller, a copy of `self.model`
+        :param datas: list of N mujoco.MjData
+        :param cameras: list of C camera ids
+        :param height: int, height of the rendered images
+        :param width: int, width of the rendered images
+        :param out: uint8 array of shape (N, C, height // downsample, width // downsample, channels), or nested lists
+            of arrays such that `out[n][c]` is the image of the camera c of the world n, default is None to allocate a
+            new array
+        :param downsample: int, factor by which the images are downsampled, averaging blocks of pixels, default is 1
+        :param grayscale: bool, whether to convert the images to grayscale, with 1 channel instead of 3, default is
+            False
+        :param prepare_world: callable, called with the index of each world before rendering it, e.g. to move the
+            visual geoms of its goal, default is None
+        :return: the images, `out` if given
+        """
+        start = time.perf_counter()
+        if width > self.max_width or height > self.max_height:
+            raise ValueError(
+                f"Image size {width}x{height} larger than the offscreen framebuffer {self.max_width}x{self.max_height}"
+                ", increase `offwidth` and `offheight` in the visual element of the model"
+            )
+        if out is None:
+            shape = (height // downsample, width // downsample, 1 if grayscale else 3)
+            out = np.empty((len(datas), len(cameras)) + shape, dtype=np.uint8)
+
+        rect = mujoco.MjrRect(0, 0, width, height)
+        with self.gl_context.current():
+            # The GL context is shared with the renderers of the other models, bind the framebuffer of this one
+            mujoco.mjr_setBuffer(mujoco.mjtFramebuffer.mjFB_OFFSCREEN.value, self.mjr_context)
+            if (height, width) not in self.buffers:
+                self.buffers[(height, width)] = np.empty((height, width, 3), dtype=np.uint8)
+            buffer = self.buffers[(height, width)]
+            for world, data in enumerate(datas):
+                if prepare_world is not None:
+                    prepare_world(world)
+                for index, camera in enumerate(cameras):
+                    self._set_camera(model, camera)
+                    # `mjv_updateScene` builds the geoms and the headlight before updating the camera, i.e. from the
+                    # previously rendered camera, so update the camera first for the images not to depend on it
+                    mujoco.mjv_updateCamera(model, data, self.camera, self.scene)
+                    mujoco.mjv_updateScene(
+                        model, data, self.scene_option, None, self.camera, mujoco.mjtCatBit.mjCAT_ALL.value, self.scene
+                    )
+                    mujoco.mjr_render(rect, self.scene, self.mjr_context)
+                    mujoco.mjr_readPixels(buffer, None, rect, self.mjr_context)
+                    # OpenGL images start with the bottom row
+                    reduce_image(buffer[::-1], downsample, grayscale, out=out[world][index])
+
+        self.last_time = time.perf_counter() - start
+        self.total_time += self.last_time
+        self.num_frames += len(datas) * len(cameras)
+        return out
+
+    def get_timings(self):
+        """
+        :return: dict of the number of frames rendered, and the total, mean and last render time in seconds
+        """
+        return {
+            "num_frames": self.num_frames,
+            "total_time": self.total_time,
+            "mean_time": self.total_time / max(self.num_frames, 1),
+            "last_time": self.last_time,
+        }
+
+    def close(self):
+        if self.mjr_context is not None:
+            with self.gl_context.current():
+                self.mjr_context.free()
+            self.mjr_context = None
+
+
+class RendererPool:
+    """
+    ## Description
+
+    The GL context and the renderers of a process.
+
+    Creating a GL context and the framebuffers of a `mujoco.Renderer` is slow and uses a lot of memory, in particular
+    with OSMesa. The pool creates a single GL context per process, with the backend given by `select_backend`, and a
+    single `SharedRenderer` per model, shared by all the cameras and environments of the model.
+
+    The renderers are counted: each call to `get_renderer` must be matched by a call to `release_renderer`, e.g. when
+    an environment is closed. A renderer is freed when it is released by all its users, and the GL context when all
+    the renderers are.
+
+    The pool is reset in child processes, as a GL context can not be used after a fork.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.backend = None
+        self.gl_context = None
+        self.renderers = {}
+        # Number of users of each renderer
+        self.ref_counts = {}
+
+    def _create_gl_context(self, backend, width, height):
+        # Without an explicit choice, fall back to OSMesa, which only needs the CPU, if EGL is not available
+        fallback = backend is None and os.environ.get("MUJOCO_GL", "").lower().strip() in _DEFAULT_MUJOCO_GL
+        backend = select_backend(backend)
+        try:
+            return backend, _get_gl_context_class(backend)(width, height)
+        except Exception:
+            if backend != "egl" or not fallback:
+                raise
+            return "osmesa", _get_gl_context_class("osmesa")(width, height)
+
+    def get_renderer(self, model, key=None, backend=None):
+        """
+        Get the renderer of a model, created at the first call.
+
+        :param model: mujoco.MjModel
+        :param key: hashable, key of the renderer, e.g. the path of the scene so that the copies of a model share the
+            same renderer, default is None for the model itself
+        :param backend: str, the OpenGL backend, see `select_backend`. It can only be given before the GL context of
+            the process is created, or be the backend of this context.
+        :return: SharedRenderer
+        """
+        with self.lock:
+            if self.pid != os.getpid():
+                self._reset()
+            if self.gl_context is None:
+                self.backend, gl_context = self._create_gl_context(
+                    backend, model.vis.global_.offwidth, model.vis.global_.offheight
+                )
+                self.gl_context = SharedGLContext(self.backend, gl_context)
+            elif backend is not None and select_backend(backend) != self.backend:
+                raise ValueError(
+                    f"Invalid render backend '{backend}', the GL context of the process uses '{self.backend}'"
+                )
+            key = id(model) if key is None else key
+            if key not in self.renderers:
+                self.renderers[key] = SharedRenderer(model, self.gl_context)
+                self.ref_counts[key] = 0
+            self.ref_counts[key] += 1
+            return self.renderers[key]
+
+    def release_renderer(self, renderer):
+        """
+        Release a renderer given by `get_renderer`, freed with the GL context if it has no other user.
+
+        :param renderer: SharedRenderer
+        """
+        with self.lock:
+            if self.pid != os.getpid():
+                # The renderers of the parent process can not be used, nor freed, after a fork
+                self._reset()
+                return
+            key = next((key for key, value in self.renderers.items() if value is renderer), None)
+            if key is None:
+                return
+            self.ref_counts[key] -= 1
+            if self.ref_counts[key] > 0:
+                return
+            del self.renderers[key], self.ref_counts[key]
+            renderer.close()
+            if not self.renderers:
+                self.gl_context.free()
+                self._reset()
+
+    def get_timings(self):
+        """
+        :return: dict of the timings of each renderer, see `SharedRenderer.get_timings`, by key
+        """
+        return {key: renderer.get_timings() for key, renderer in self.renderers.items()}
+
+    def close(self):
+        """Free the renderers and the GL context."""
+        with self.lock:
+            if self.pid == os.getpid():
+                for renderer in self.renderers.values():
+                    renderer.close()
+                if self.gl_context is not None:
+                    self.gl_context.free()
+            self._reset()
+
+
+# Renderers of the process
+_pool = RendererPool()
+
+
+def get_renderer(model, key=None, backend=None):
+    """Get the shared renderer of a model, see `RendererPool.get_renderer`."""
+    return _pool.get_renderer(model, key=key, backend=backend)
+
+
+def release_renderer(renderer):
+    """Release a shared renderer, see `RendererPool.release_renderer`."""
+    _pool.release_renderer(renderer)
+
+
+def get_render_backend():
+    """:return: str, the OpenGL backend of the process, or None if nothing has been rendered yet"""
+    return _pool.backend
+
+
+def get_render_timings():
+    """Render timings of the shared renderers, see `RendererPool.get_timings`."""
+    return _pool.get_timings()
+
+
+def close_renderers():
+    """Free the shared renderers and the GL context of the process."""
+    _pool.close()
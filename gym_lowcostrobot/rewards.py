@@ -0,0 +1,290 @@
+import mujoco
+import numpy as np
+
+# Geoms whose cross-section along x and y is a disk of radius `size[0]`
+ROUND_GEOM_TYPES = (mujoco.mjtGeom.mjGEOM_SPHERE, mujoco.mjtGeom.mjGEOM_CYLINDER, mujoco.mjtGeom.mjGEOM_CAPSULE)
+
+
+class Distance:
+    """
+    Reward term `weight * ||pos(a) - (pos(b) + offset)||`, or success criterion `||pos(a) - (pos(b) + offset)|| <
+    tolerance` when used in the `success` criteria of a `RewardSpec`.
+
+    :param a: str, name of the first point, see `RewardSpec`
+    :param b: str, name of the second point
+    :param weight: float, weight of the term, default is -1 to reward getting closer
+    :param offset: array of shape (3,), offset added to the second point, default is zero
+    :param tolerance: float, distance below which the criterion is met, default is 0.01
+    """
+
+    def __init__(self, a, b, weight=-1.0, offset=(0.0, 0.0, 0.0), tolerance=0.01):
+        self.a = a
+        self.b = b
+        self.weight = weight
+        self.offset = np.asarray(offset, dtype=np.float64)
+        self.tolerance = tolerance
+
+
+class Height:
+    """
+    Reward term `weight * (pos(a)[2] - threshold)`, or success criterion `pos(a)[2] > threshold` when used in the
+    `success` criteria of a `RewardSpec`.
+
+    :param a: str, name of the point, see `RewardSpec`
+    :param threshold: float, reference height, default is 0
+    :param weight: float, weight of the term, default is 1
+    """
+
+    def __init__(self, a, threshold=0.0, weight=1.0):
+        self.a = a
+        self.threshold = threshold
+        self.weight = weight
+
+
+class InRegion:
+    """
+    Success criterion `|pos(a)[:2] - pos(center)[:2]| <= half_size` along x and y, e.g. the cube being in a target
+    region.
+
+    :param a: str, name of the point, see `RewardSpec`
+    :param center: str, name of the center of the region
+    :param half_size: array of shape (2,), half size of the rectangular region along x and y, or str, name of a geom
+        giving the region, e.g. "target_region". The region of a sphere, cylinder or capsule geom is the disk of its
+        radius, `||pos(a)[:2] - pos(center)[:2]|| <= radius`, and the region of another geom is its bounding box
+        along x and y, in the frame of the geom, i.e. rotated as the geom around z. The geom is expected to be fixed,
+        its orientation being read once from the initial configuration of the model.
+    """
+
+    def __init__(self, a, center, half_size):
+        self.a = a
+        self.center = center
+        self.half_size = half_size if isinstance(half_size, str) else np.asarray(half_size, dtype=np.float64)[:2]
+
+
+def get_geom_half_size(model, name):
+    """
+    Half size of the bounding box of a geom along x and y, in the geom frame.
+
+    :param model: mujoco.MjModel
+    :param name: str, name of the geom
+    :return: array of shape (2,)
+    """
+    geom = model.geom(name)  # raises a KeyError if the geom does not exist
+    size = geom.size
+    if is_round_geom(model, name):
+        # The first size is the radius
+        return np.array([size[0], size[0]])
+    return size[:2].copy()
+
+
+def get_geom_rotation(model, name):
+    """
+    Rotation of a geom in the initial configuration of the model, restricted to x and y.
+
+    :param model: mujoco.MjModel
+    :param name: str, name of the geom
+    :return: array of shape (2, 2), whose columns are the x and y axes of the geom in the world frame
+    """
+    geom_id = model.geom(name).id
+    data = mujoco.MjData(model)
+    mujoco.mj_kinematics(model, data)
+    return data.geom_xmat[geom_id].reshape(3, 3)[:2, :2].copy()
+
+
+def is_round_geom(model, name):
+    """Whether the cross-section of a geom along x and y is a disk, see `ROUND_GEOM_TYPES`."""
+    return int(model.geom(name).type[0]) in ROUND_GEOM_TYPES
+
+
+class RewardSpec:
+    """
+    ## Description
+
+    Declarative reward and success criteria of a task.
+
+    The reward is the sum of the `terms` (`Distance` and `Height`), and the task is successful when all the `success`
+    criteria (`Distance`, `Height` and `InRegion`) are met. The terms refer to points by name, resolved once by
+    `compile`:
+
+    - the goals of the environment, e.g. "target" for the target position of `PushCubeEnv`,
+    - the bodies with a free joint, whose position is read in `qpos`, e.g. "cube",
+    - the other bodies, whose position is read in `xpos`, e.g. "link_6" for the end effector,
+    - the sites, whose position is read in `site_xpos`.
+
+    The compiled spec evaluates the rewards and successes of N worlds in a single vectorized pass, so the same spec is
+    used by the single and the batched vector environments.
+
+    ## Arguments
+
+    - `terms (list)`: the reward terms.
+    - `success (list)`: the success criteria, default is no criterion, the task being never successful.
+    - `terminate_on_success (bool)`: whether the episode terminates when the task is successful, default is False.
+    """
+
+    def __init__(self, terms, success=(), terminate_on_success=False):
+        for term in terms:
+            if not isinstance(term, (Distance, Height)):
+                raise ValueError(f"Invalid reward term {term}, must be a Distance or a Height")
+        self.terms = list(terms)
+        self.success = list(success)
+        self.terminate_on_success = terminate_on_success
+
+    def compile(self, model, object_qpos_adr=None, goal_names=()):
+        """
+        Resolve the names of the points to their indices in the simulation arrays.
+
+        :param model: mujoco.MjModel
+        :param object_qpos_adr: dict of the qpos addresses of the bodies with a free joint, by name
+        :param goal_names: list of the names of the goals given to the compiled spec
+        :return: CompiledRewardSpec
+        """
+        return CompiledRewardSpec(self, model, object_qpos_adr or {}, goal_names)
+
+
+class CompiledRewardSpec:
+    """
+    A `RewardSpec` whose points are resolved to array indices, see `RewardSpec.compile`.
+
+    Calling it with the stacked simulation arrays of N worlds returns the rewards and the successes of the worlds.
+    """
+
+    def __init__(self, spec, model, object_qpos_adr, goal_names):
+        self.spec = spec
+        self.terminate_on_success = spec.terminate_on_success
+
+        # Index of each point in the gathered positions, and where to read it from
+        self.point_index = {}
+        qpos_points, qpos_adr = [], []
+        body_points, body_ids = [], []
+        site_points, site_ids = [], []
+        self.goal_points = []
+
+        def resolve(name):
+            if name in self.point_index:
+                return self.point_index[name]
+            index = len(self.point_index)
+            self.point_index[name] = index
+            if name in goal_names:
+                self.goal_points.append((index, name))
+            elif name in object_qpos_adr:
+                qpos_points.append(index)
+                qpos_adr.append(object_qpos_adr[name])
+            elif mujoco.mj_name2id(model, mujoco.mjtObj.mjOBJ_BODY, name) >= 0:
+                body_points.append(index)
+                body_ids.append(mujoco.mj_name2id(model, mujoco.mjtObj.mjOBJ_BODY, name))
+            elif mujoco.mj_name2id(model, mujoco.mjtObj.mjOBJ_SITE, name) >= 0:
+                site_points.append(index)
+                site_ids.append(mujoco.mj_name2id(model, mujoco.mjtObj.mjOBJ_SITE, name))
+            else:
+                raise ValueError(f"Unknown point '{name}', must be a goal, a body or a site")
+            return index
+
+        # Reward terms
+        distances = [term for term in spec.terms if isinstance(term, Distance)]
+        heights = [term for term in spec.terms if isinstance(term, Height)]
+        self.distance_a = np.array([resolve(term.a) for term in distances], dtype=np.int64)
+        self.distance_b = np.array([resolve(term.b) for term in distances], dtype=np.int64)
+        self.distance_offset = np.array([term.offset for term in distances]).reshape(-1, 3)
+        self.distance_weight = np.array([term.weight for term in distances], dtype=np.float64)
+        self.height_a = np.array([resolve(term.a) for term in heights], dtype=np.int64)
+        self.height_threshold = np.array([term.threshold for term in heights], dtype=np.float64)
+        self.height_weight = np.array([term.weight for term in heights], dtype=np.float64)
+
+        # Success criteria
+        distances = [criterion for criterion in spec.success if isinstance(criterion, Distance)]
+        heights = [criterion for criterion in spec.success if isinstance(criterion, Height)]
+        regions = [criterion for criterion in spec.success if isinstance(criterion, InRegion)]
+        if len(distances) + len(heights) + len(regions) != len(spec.success):
+            raise ValueError("Invalid success criterion, must be a Distance, a Height or an InRegion")
+        self.success_distance_a = np.array([resolve(criterion.a) for criterion in distances], dtype=np.int64)
+        self.success_distance_b = np.array([resolve(criterion.b) for criterion in distances], dtype=np.int64)
+        self.success_distance_offset = np.array([criterion.offset for criterion in distances]).reshape(-1, 3)
+        self.success_tolerance = np.array([criterion.tolerance for criterion in distances], dtype=np.float64)
+        self.success_height_a = np.array([resolve(criterion.a) for criterion in heights], dtype=np.int64)
+        self.success_height_threshold = np.array([criterion.threshold for criterion in heights], dtype=np.float64)
+        self.success_region_a = np.array([resolve(criterion.a) for criterion in regions], dtype=np.int64)
+        self.success_region_center = np.array([resolve(criterion.center) for criterion in regions], dtype=np.int64)
+        self.success_region_half_size = np.array(
+            [
+                get_geom_half_size(model, criterion.half_size)
+                if isinstance(criterion.half_size, str)
+                else criterion.half_size
+                for criterion in regions
+            ]
+        ).reshape(-1, 2)
+        # Offsets to the centers are rotated into the frame of the geoms of the regions
+        self.success_region_rotation = np.array(
+            [
+                get_geom_rotation(model, criterion.half_size) if isinstance(criterion.half_size, str) else np.eye(2)
+                for criterion in regions
+            ]
+        ).reshape(-1, 2, 2)
+        # The regions of round geoms are disks, checked on the distance to the center instead of along x and y
+        self.success_region_round = np.array(
+            [
+                isinstance(criterion.half_size, str) and is_round_geom(model, criterion.half_size)
+                for criterion in regions
+            ],
+            dtype=bool,
+        )
+        self.has_success = len(spec.success) > 0
+
+        self.num_points = len(self.point_index)
+        self.qpos_points = np.array(qpos_points, dtype=np.int64)
+        self.qpos_index = np.array(qpos_adr, dtype=np.int64).reshape(-1, 1) + np.arange(3)
+        self.body_points = np.array(body_points, dtype=np.int64)
+        self.body_ids = np.array(body_ids, dtype=np.int64)
+        self.site_points = np.array(site_points, dtype=np.int64)
+        self.site_ids = np.array(site_ids, dtype=np.int64)
+        self.goal_names = list(goal_names)
+
+    def gather_points(self, qpos, xpos, site_xpos=None, goals=None):
+        """
+        Gather the positions of the points of the spec.
+
+        :param qpos: array of shape (N, nq)
+        :param xpos: array of shape (N, nbody, 3)
+        :param site_xpos: array of shape (N, nsite, 3), only needed if the spec uses sites
+        :param goals: dict of arrays of shape (N, 3) or (3,), by goal name
+        :return: array of shape (N, num_points, 3)
+        """
+        points = np.empty((len(qpos), self.num_points, 3))
+        if len(self.qpos_points):
+            points[:, self.qpos_points] = qpos[:, self.qpos_index]
+        if len(self.body_points):
+            points[:, self.body_points] = xpos[:, self.body_ids]
+        if len(self.site_points):
+            points[:, self.site_points] = site_xpos[:, self.site_ids]
+        for index, name in self.goal_points:
+            points[:, index] = goals[name]
+        return points
+
+    def __call__(self, qpos, xpos, site_xpos=None, goals=None):
+        """
+        Evaluate the rewards and successes of N worlds, see `gather_points` for the arguments.
+
+        :return: the rewards, float array of shape (N,), and the successes, bool array of shape (N,)
+        """
+        points = self.gather_points(qpos, xpos, site_xpos, goals)
+
+        distances = np.linalg.norm(
+            points[:, self.distance_a] - (points[:, self.distance_b] + self.distance_offset), axis=-1
+        )
+        heights = points[:, self.height_a, 2] - self.height_threshold
+        rewards = distances @ self.distance_weight + heights @ self.height_weight
+
+        successes = np.full(len(points), self.has_success)
+        if self.has_success:
+            distances = np.linalg.norm(
+                points[:, self.success_distance_a]
+                - (points[:, self.success_distance_b] + self.success_distance_offset),
+                axis=-1,
+            )
+            successes &= np.all(distances < self.success_tolerance, axis=-1)
+            successes &= np.all(points[:, self.success_height_a, 2] > self.success_height_threshold, axis=-1)
+            region_offsets = points[:, self.success_region_a, :2] - points[:, self.success_region_center, :2]
+            region_offsets = np.einsum("nri,rij->nrj", region_offsets, self.success_region_rotation)
+            in_box = np.all(np.abs(region_offsets) <= self.success_region_half_size, axis=-1)
+            in_disk = np.linalg.norm(region_offsets, axis=-1) <= self.success_region_half_size[:, 0]
+            successes &= np.all(np.where(self.success_region_round, in_disk, in_box), axis=-1)
+        return rewards, successes
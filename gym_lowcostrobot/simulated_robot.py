@@ -1,59 +1,116 @@
 import mujoco
 import numpy as np
 
+from gym_lowcostrobot import BASE_LINK_NAME
+
 
 ## https://alefram.github.io/posts/Basic-inverse-kinematics-in-Mujoco
 # Levenberg-Marquardt method
 class LevenbegMarquardtIK:
-    def __init__(self, model, data, tol=0.04, step_size=0.5):
+    """
+    Levenberg-Marquardt inverse kinematics of a body position, for the joints of the arm.
+
+    The solver runs headless on its own scratch data: the kinematics of the candidate joint positions are computed on a
+    copy of the live data, which is never modified by `solve`. It iterates until the residual is below `tol` or the
+    `max_iter` budget is spent, clamping the joints to their range after each iteration. Unless an initial guess is
+    given, each call starts from the previous solution (warm start), or from the current joint positions the first
+    time.
+
+    :param model: mujoco model
+    :param data: mujoco data of the live simulation
+    :param tol: float, tolerance on the distance between the body and the goal
+    :param step_size: float, step size of each iteration
+    :param max_iter: int, maximum number of iterations
+    :param damping: float, damping factor of the normal equations
+    :param nb_dof: int, number of degrees of freedom of the arm, starting at the joint of the base link
+    :param warm_start: bool, whether to start from the previous solution
+    """
+
+    def __init__(self, model, data, tol=0.04, step_size=0.5, max_iter=100, damping=0.15, nb_dof=6, warm_start=True):
         self.model = model
         self.data = data
         self.jacp = np.zeros((3, model.nv))  # translation jacobian
         self.jacr = np.zeros((3, model.nv))  # rotational jacobian
         self.step_size = step_size
         self.tol = tol
+        self.max_iter = max_iter
         self.alpha = 0.5
-        self.damping = 0.15
+        self.damping = damping
+        self.warm_start = warm_start
+        self.scratch_data = mujoco.MjData(model)
+        self.last_solution = None
+
+        # The arm joints are consecutive, starting at the joint of the base link
+        arm_joint_id = model.body(BASE_LINK_NAME).jntadr[0]
+        self.arm_joint_ids = np.arange(arm_joint_id, arm_joint_id + nb_dof)
+        self.qpos_slice = slice(model.jnt_qposadr[arm_joint_id], model.jnt_qposadr[arm_joint_id] + nb_dof)
+        self.dof_slice = slice(model.jnt_dofadr[arm_joint_id], model.jnt_dofadr[arm_joint_id] + nb_dof)
+        limited = model.jnt_limited[self.arm_joint_ids].astype(bool)
+        self.q_low = np.where(limited, model.jnt_range[self.arm_joint_ids, 0], -np.inf)
+        self.q_high = np.where(limited, model.jnt_range[self.arm_joint_ids, 1], np.inf)
+        self.eye = np.eye(nb_dof)
 
     def check_joint_limits(self, q):
-        """Check if the joints is under or above its limits"""
-        for i in range(len(q)):
-            q[i] = max(self.model.jnt_range[i][0], min(q[i], self.model.jnt_range[i][1]))
+        """Clamp the joint positions of the arm to their range, in place"""
+        np.clip(q, self.q_low, self.q_high, out=q)
 
-    # Levenberg-Marquardt pseudocode implementation
-    def calculate(self, goal, body_id, viewer):
-        """Calculate the desire joints angles for goal"""
-        current_pose = self.data.body(body_id).xpos
-        error = np.subtract(goal, current_pose)
+    def _body_error(self, goal, body_id, q):
+        """Compute the kinematics of the joint positions on the scratch data and return the error to the goal"""
+        self.scratch_data.qpos[self.qpos_slice] = q
+        mujoco.mj_kinematics(self.model, self.scratch_data)
+        mujoco.mj_comPos(self.model, self.scratch_data)
+        return goal - self.scratch_data.xpos[body_id]
 
-        while np.linalg.norm(error) >= self.tol:
+    def solve(self, goal, body_id, qpos=None):
+        """
+        Calculate the joint positions of the arm placing the body at the goal.
+
+        :param goal: numpy array of the goal position [x, y, z]
+        :param body_id: int, id of the body
+        :param qpos: numpy array of initial joint positions of the arm, default is the previous solution if warm
+            starting, else the current joint positions
+        :return: tuple of the joint positions of the arm and a dictionary of diagnostics: "iterations", "residual"
+            (distance between the body and the goal at the solution) and "success" (residual below the tolerance)
+        """
+        if qpos is None:
+            use_previous = self.warm_start and self.last_solution is not None
+            qpos = self.last_solution if use_previous else self.data.qpos[self.qpos_slice]
+        q = np.array(qpos, dtype=np.float64)
+        self.check_joint_limits(q)
+
+        # The other joints (e.g. the objects) are taken from the live simulation
+        self.scratch_data.qpos[:] = self.data.qpos
+        error = self._body_error(goal, body_id, q)
+        iterations = 0
+        while np.linalg.norm(error) >= self.tol and iterations < self.max_iter:
             # calculate jacobian
-            mujoco.mj_jac(self.model, self.data, self.jacp, self.jacr, goal, body_id)
+            mujoco.mj_jacBody(self.model, self.scratch_data, self.jacp, self.jacr, body_id)
+            jac = self.jacp[:, self.dof_slice]
 
             # calculate delta of joint q
-            n = self.jacp.shape[1]
-            product = self.jacp.T @ self.jacp + self.damping * np.identity(n)
-
-            if np.isclose(np.linalg.det(product), 0):
-                j_inv = np.linalg.pinv(product) @ self.jacp.T
-            else:
-                j_inv = np.linalg.inv(product) @ self.jacp.T
-
-            delta_q = j_inv @ error
+            product = jac.T @ jac + self.damping * self.eye
+            delta_q = np.linalg.solve(product, jac.T @ error)
 
-            # compute next step
-            self.data.qpos[:1] += self.step_size * delta_q
-
-            # check limits
-            # self.check_joint_limits(self.data.qpos)
-
-            # compute forward kinematics
-            mujoco.mj_forward(self.model, self.data)
-            viewer.sync()
+            # compute next step and check limits
+            q += self.step_size * delta_q
+            self.check_joint_limits(q)
 
             # calculate new error
-            error = np.subtract(goal, self.data.body(body_id).xpos)
-            print("Error: ", np.linalg.norm(error))
+            error = self._body_error(goal, body_id, q)
+            iterations += 1
+
+        residual = np.linalg.norm(error)
+        self.last_solution = q
+        return q.copy(), {"iterations": iterations, "residual": residual, "success": residual < self.tol}
+
+    def calculate(self, goal, body_id, viewer=None):
+        """Calculate the desire joints angles for goal and apply them to the live simulation"""
+        q, info = self.solve(goal, body_id)
+        self.data.qpos[self.qpos_slice] = q
+        mujoco.mj_forward(self.model, self.data)
+        if viewer is not None:
+            viewer.sync()
+        return info
 
 
 class SimulatedRobot:
@@ -64,6 +121,7 @@ class SimulatedRobot:
         """
         self.m = m
         self.d = d
+        self.jac = np.zeros((3, self.m.nv))
 
     def _pos2pwm(self, pos: np.ndarray) -> np.ndarray:
         """
@@ -136,7 +194,9 @@ class SimulatedRobot:
         q_target_pos = qpos + qdot * step
         return q_target_pos
 
-    def inverse_kinematics_reg(self, ee_target_pos, step=0.2, joint_name="end_effector", nb_dof=5, regularization=1e-6):
+    def inverse_kinematics_reg(
+        self, ee_target_pos, step=0.2, joint_name="end_effector", nb_dof=5, regularization=1e-6
+    ):
         """
         Computes the inverse kinematics for a robotic arm to reach the target end effector position.
 
@@ -159,18 +219,15 @@ class SimulatedRobot:
         ee_pos = self.d.geom_xpos[ee_id]
 
         # Compute the Jacobian
-        jac = np.zeros((3, self.m.nv))
-        mujoco.mj_jacBodyCom(self.m, self.d, jac, None, joint_id)
+        mujoco.mj_jacBodyCom(self.m, self.d, self.jac, None, joint_id)
+        jac = self.jac[:, :nb_dof]
 
         # Compute the difference between target and current end effector positions
         delta_pos = ee_target_pos - ee_pos
 
-        # Compute the pseudoinverse of the Jacobian with regularization
-        jac_reg = jac[:, :nb_dof].T @ jac[:, :nb_dof] + regularization * np.eye(nb_dof)
-        jac_pinv = np.linalg.inv(jac_reg) @ jac[:, :nb_dof].T
-
-        # Compute target joint velocities
-        qdot = jac_pinv @ delta_pos
+        # Compute target joint velocities, solving the regularized normal equations
+        jac_reg = jac.T @ jac + regularization * np.eye(nb_dof)
+        qdot = np.linalg.solve(jac_reg, jac.T @ delta_pos)
 
         # Normalize joint velocities to avoid excessive movements
         qdot_norm = np.linalg.norm(qdot)
@@ -0,0 +1,220 @@
+import numpy as np
+
+
+class RunningStats:
+    """
+    ## Description
+
+    Running mean, variance, minimum and maximum of a stream of values, updated by batches.
+
+    The batches are combined with the parallel form of Welford's algorithm (Chan et al.): the accumulator keeps the
+    number of values, the mean and the sum of the squared deviations to the mean, so the variance is numerically stable
+    even for long streams, and no value is kept in memory. Two accumulators, e.g. of parallel workers, are combined
+    the same way with `merge`.
+
+    The statistics are computed over the `reduce_axes` of the batches, e.g. a batch of shape (N, 6) gives statistics
+    of shape (6,) with the default `reduce_axes=(0,)`, and a batch of images of shape (N, H, W, 3) gives per-channel
+    statistics of shape (3,) with `reduce_axes=(0, 1, 2)`. The statistics of many uint8 values, e.g. the channels of
+    images, are computed from their histograms instead of their float64 conversion.
+
+    ## Arguments
+
+    - `reduce_axes (tuple)`: the axes of the batches the statistics are computed over, default is (0,).
+    - `scale (float)`: the factor applied to the values, e.g. 1 / 255 for the statistics of uint8 images in [0, 1],
+        default is 1.
+    """
+
+    def __init__(self, reduce_axes=(0,), scale=1.0):
+        self.reduce_axes = tuple(reduce_axes)
+        self.scale = scale
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+
+    def update(self, values):
+        """
+        Add a batch of values.
+
+        :param values: array of shape (N, *shape)
+        """
+        values = np.asarray(values)
+        if values.size == 0:
+            return
+        count = int(np.prod([values.shape[axis] for axis in self.reduce_axes]))
+        if values.dtype == np.uint8:
+            # Move the reduced axes first, to get a column of `count` values per statistic
+            moved = np.moveaxis(values, self.reduce_axes, range(len(self.reduce_axes)))
+            columns = moved.reshape(count, -1)
+            # The histograms are only cheaper than the values with many values per column
+            if columns.shape[1] * 256 < count:
+                self._update_histograms(columns, moved.shape[len(self.reduce_axes) :])
+                return
+        values = np.asarray(values, dtype=np.float64)
+        if self.scale != 1.0:
+            values = values * self.scale
+        mean = values.mean(axis=self.reduce_axes)
+        m2 = np.square(values - np.expand_dims(mean, self.reduce_axes)).sum(axis=self.reduce_axes)
+        self._combine(count, mean, m2, values.min(axis=self.reduce_axes), values.max(axis=self.reduce_axes))
+
+    def _update_histograms(self, columns, shape):
+        # The statistics of uint8 values, e.g. the channels of images, are computed from the histograms of the
+        # columns, which is exact and much cheaper than converting all the values to float64
+        histograms = np.stack([np.bincount(column, minlength=256) for column in columns.T])
+        levels = np.arange(256)
+        count = len(columns)
+        mean = histograms @ levels / count
+        m2 = np.sum(histograms * np.square(levels - mean[:, None]), axis=-1)
+        value_min = np.argmax(histograms > 0, axis=-1)
+        value_max = 255 - np.argmax(histograms[:, ::-1] > 0, axis=-1)
+        self._combine(
+            count,
+            (mean * self.scale).reshape(shape),
+            (m2 * self.scale**2).reshape(shape),
+            (value_min * self.scale).reshape(shape),
+            (value_max * self.scale).reshape(shape),
+        )
+
+    def merge(self, other):
+        """
+        Add the values of another accumulator, e.g. of another worker.
+
+        :param other: RunningStats
+        :return: self
+        """
+        if other.count > 0:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+        return self
+
+    def _combine(self, count, mean, m2, min, max):
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = count, mean, m2, min, max
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + np.square(delta) * (self.count * count / total)
+        self.min = np.minimum(self.min, min)
+        self.max = np.maximum(self.max, max)
+        self.count = total
+
+    @property
+    def var(self):
+        return self.m2 / self.count
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def to_dict(self):
+        """
+        :return: dict of the "mean", "std", "min" and "max" arrays
+        """
+        if self.count == 0:
+            raise ValueError("No value to compute statistics from")
+        return {"mean": self.mean, "std": self.std, "min": self.min, "max": self.max}
+
+
+def is_image(value):
+    """Whether a value is an RGB (or grayscale) uint8 image of shape (H, W, C)."""
+    value = np.asarray(value)
+    return value.dtype == np.uint8 and value.ndim == 3 and value.shape[-1] in (1, 3)
+
+
+class DictRunningStats:
+    """
+    ## Description
+
+    Running statistics of dicts of values, e.g. the observations of an environment, with a `RunningStats` per key.
+
+    The images (uint8 arrays of shape (H, W, C)) get per-channel statistics of the values scaled to [0, 1], as in the
+    LeRobot datasets, the other numeric values get per-element statistics. The non-numeric values are ignored.
+
+    The accumulators of parallel workers can be combined with `merge`, or saved with `save` and combined later.
+
+    ## Arguments
+
+    - `keys (list)`: the keys to compute statistics of, default is None for all the numeric keys.
+    """
+
+    def __init__(self, keys=None):
+        self.keys = None if keys is None else list(keys)
+        self.stats = {}
+
+    def _get_stats(self, key, value):
+        if key not in self.stats:
+            if is_image(value):
+                self.stats[key] = RunningStats(reduce_axes=(0, 1, 2), scale=1 / 255)
+            else:
+                self.stats[key] = RunningStats()
+        return self.stats[key]
+
+    def update(self, batch):
+        """
+        Add a batch of values per key.
+
+        :param batch: dict of arrays of shape (N, *shape)
+        """
+        for key, values in batch.items():
+            values = np.asarray(values)
+            if self.keys is not None and key not in self.keys:
+                continue
+            if not (np.issubdtype(values.dtype, np.number) or values.dtype == np.bool_):
+                continue
+            self._get_stats(key, values[0]).update(values)
+
+    def update_frame(self, frame):
+        """
+        Add a single value per key.
+
+        :param frame: dict of values, e.g. an observation
+        """
+        self.update({key: np.expand_dims(value, 0) for key, value in frame.items()})
+
+    def merge(self, other):
+        """
+        Add the values of another accumulator, e.g. of another worker.
+
+        :param other: DictRunningStats
+        :return: self
+        """
+        for key, stats in other.stats.items():
+            if key not in self.stats:
+                self.stats[key] = RunningStats(stats.reduce_axes, stats.scale)
+            self.stats[key].merge(stats)
+        return self
+
+    def to_dict(self):
+        """
+        :return: dict of the statistics of each key, see `RunningStats.to_dict`
+        """
+        return {key: stats.to_dict() for key, stats in self.stats.items() if stats.count > 0}
+
+    def save(self, path):
+        """Save the accumulators to a `.npz` file."""
+        arrays = {}
+        for index, (key, stats) in enumerate(self.stats.items()):
+            if stats.count == 0:
+                continue
+            arrays[f"key_{index}"] = np.array(key)
+            arrays[f"reduce_axes_{index}"] = np.array(stats.reduce_axes)
+            arrays[f"scale_{index}"] = np.array(stats.scale)
+            arrays[f"count_{index}"] = np.array(stats.count)
+            for name in ["mean", "m2", "min", "max"]:
+                arrays[f"{name}_{index}"] = getattr(stats, name)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path, keys=None):
+        """Load accumulators saved with `save`."""
+        dict_stats = cls(keys)
+        with np.load(path) as arrays:
+            indices = [name[len("key_") :] for name in arrays.files if name.startswith("key_")]
+            for index in indices:
+                stats = RunningStats(tuple(arrays[f"reduce_axes_{index}"]), float(arrays[f"scale_{index}"]))
+                stats.count = int(arrays[f"count_{index}"])
+                for name in ["mean", "m2", "min", "max"]:
+                    setattr(stats, name, arrays[f"{name}_{index}"])
+                dict_stats.stats[str(arrays[f"key_{index}"])] = stats
+        return dict_stats
@@ -0,0 +1,25 @@
+from .batched_env import (
+    BatchedVectorEnv,
+    LiftCubeVectorEnv,
+    PickPlaceCubeVectorEnv,
+    PushCubeLoopVectorEnv,
+    PushCubeVectorEnv,
+    ReachCubeVectorEnv,
+    StackTwoCubesVectorEnv,
+)
+from .shared_memory_env import SharedMemoryVectorEnv
+from .stepping import SerialStepper, ThreadedStepper, make_stepper
+
+__all__ = [
+    "BatchedVectorEnv",
+    "LiftCubeVectorEnv",
+    "PickPlaceCubeVectorEnv",
+    "PushCubeVectorEnv",
+    "PushCubeLoopVectorEnv",
+    "ReachCubeVectorEnv",
+    "StackTwoCubesVectorEnv",
+    "SharedMemoryVectorEnv",
+    "SerialStepper",
+    "ThreadedStepper",
+    "make_stepper",
+]
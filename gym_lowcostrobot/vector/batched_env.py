@@ -0,0 +1,470 @@
+import copy
+
+import mujoco
+import numpy as np
+from gymnasium import spaces
+from gymnasium.utils import seeding
+from gymnasium.vector import VectorEnv
+from gymnasium.vector.utils import batch_space
+
+try:
+    from gymnasium.vector import AutoresetMode
+except ImportError:  # gymnasium < 1.1 has no autoreset mode metadata
+    AutoresetMode = None
+
+from gym_lowcostrobot.envs import (
+    LiftCubeEnv,
+    PickPlaceCubeEnv,
+    PushCubeEnv,
+    PushCubeLoopEnv,
+    ReachCubeEnv,
+    StackTwoCubesEnv,
+)
+from gym_lowcostrobot.envs.base_env import JOINT_TARGET_HIGH, JOINT_TARGET_LOW
+from gym_lowcostrobot.envs.push_cube_loop_env import compute_push_cube_loop_reward
+from gym_lowcostrobot.inverse_kinematics import BatchedInverseKinematics
+from gym_lowcostrobot.rendering import DEFAULT_IMAGE_HEIGHT, DEFAULT_IMAGE_WIDTH
+from gym_lowcostrobot.vector.stepping import make_stepper
+
+
+class BatchedVectorEnv(VectorEnv):
+    """
+    ## Description
+
+    Vector environment simulating `num_envs` worlds of the same task. All the worlds share a single `MjModel` and each
+    one owns its own `MjData`. Actions are given as a single `(num_envs, 6)` array and observations are returned as a
+    dictionary of stacked arrays, e.g. `"arm_qpos"` has shape `(num_envs, 6)`. In the "ee" action mode, the actions
+    have shape `(num_envs, 4)` and the inverse kinematics of all the worlds is solved at once.
+
+    The model, the spaces and the index table are taken from a template instance of `env_class`, so the batched
+    environment behaves like `num_envs` copies of the single environment wrapped in a `TimeLimit`.
+
+    ## Autoreset
+
+    When a world is terminated or truncated, it is reset within the same call to `step`. The returned observation is
+    then the first observation of the new episode. As in the gymnasium vector environments, the last observation and
+    info of the finished episodes are available in `info["final_observation"]` and `info["final_info"]`, object
+    arrays holding a dictionary per world, `info["_final_observation"]` and `info["_final_info"]` being the masks of
+    the worlds that have been reset. The other infos are stacked for all the worlds, with masks `info["_{key}"]`.
+
+    ## Images
+
+    If `cameras` is given, the cameras of all the worlds are rendered at each step into a single uint8 array
+    `observation["images"]` of shape `(num_envs, len(cameras), height, width, channels)`, e.g. to feed a CNN encoder
+    without stacking the images of each world. The images are rendered in a single pass with the renderer shared by
+    the environments of the scene (see `gym_lowcostrobot.rendering`) at `image_size`, downsampled by
+    `image_downsample` and converted to grayscale (1 channel) if requested. To get small images, e.g. (84, 84),
+    prefer rendering them at this size directly with `image_size` over downsampling larger ones. After an autoreset,
+    only the worlds which have been reset are rendered again.
+
+    ## Arguments
+
+    - `num_envs (int)`: the number of worlds to simulate.
+    - `observation_mode (str)`: the observation mode, only "state" is supported.
+    - `action_mode (str)`: the action mode, can be "joint" or "ee", default is "joint".
+    - `max_episode_steps (int)`: the number of steps after which a world is truncated, default is 500.
+    - `copy (bool)`: whether to return a copy of the observation buffers, default is True. If False, the returned
+        arrays are overwritten by the next call to `step` or `reset`.
+    - `num_threads (int)`: the number of threads stepping the worlds, default is 1. If None, all the CPUs are used.
+        The results do not depend on the number of threads.
+    - `ik_cache (IKCache or str)`: cache of inverse kinematics solutions for the "ee" action mode, or the path of a
+        saved cache, default is None. See the single environments.
+    - `ik_iterations (int)`: the maximum number of iterations of the inverse kinematics of the "ee" action mode,
+        default is None. See the single environments.
+    - `ik_tol (float)`: the tolerance of the inverse kinematics of the "ee" action mode, default is None. See the
+        single environments.
+    - `reward_spec (RewardSpec)`: the reward and success criteria, default is None for the reward of the task.
+    - `terminate_on_success (bool)`: whether the worlds whose task is successful terminate, and are reset within the
+        same step, default is None for the value of the reward spec. The successes of each step are given in
+        `info["is_success"]`.
+    - `cameras (list)`: the cameras rendered in `observation["images"]`, e.g. `["camera_front", "camera_top"]`,
+        default is None for no image, see section "Images".
+    - `image_size (tuple)`: the (height, width) at which the cameras are rendered, default is None for (240, 320).
+    - `image_downsample (int)`: the factor by which the images are downsampled, averaging blocks of pixels, default
+        is 1.
+    - `grayscale (bool)`: whether to convert the images to grayscale, default is False.
+    - `render_backend (str)`: the OpenGL backend rendering the cameras, see the single environments.
+    """
+
+    env_class = None
+    metadata = {"render_modes": []}
+
+    def __init__(
+        self,
+        num_envs,
+        observation_mode="state",
+        action_mode="joint",
+        max_episode_steps=500,
+        copy=True,
+        num_threads=1,
+        ik_cache=None,
+        ik_iterations=None,
+        ik_tol=None,
+        reward_spec=None,
+        terminate_on_success=None,
+        cameras=None,
+        image_size=None,
+        image_downsample=1,
+        grayscale=False,
+        render_backend=None,
+    ):
+        if observation_mode != "state":
+            raise ValueError("Invalid observation mode, batched vector environments only support 'state'")
+        if action_mode not in ["joint", "ee"]:
+            raise ValueError("Invalid action mode, must be 'ee' or 'joint'")
+
+        # The template environment provides the model, the spaces and the index table
+        self.env = self.env_class(
+            observation_mode=observation_mode,
+            action_mode=action_mode,
+            ik_cache=ik_cache,
+            ik_iterations=ik_iterations,
+            ik_tol=ik_tol,
+            reward_spec=reward_spec,
+            terminate_on_success=terminate_on_success,
+            render_backend=render_backend,
+        )
+        self.model = self.env.model
+        self.datas = [mujoco.MjData(self.model) for _ in range(num_envs)]
+        self.stepper = make_stepper(self.model, self.datas, num_threads=num_threads)
+
+        # Set the vector environment attributes
+        self.num_envs = num_envs
+        self.is_vector_env = True
+        self.closed = False
+        self.viewer = None
+        self.render_mode = None
+        if AutoresetMode is not None:
+            self.metadata = {**self.metadata, "autoreset_mode": AutoresetMode.SAME_STEP}
+        self.single_observation_space = self.env.observation_space
+
+        # Cameras rendered into the stacked images
+        self.camera_ids = [self.model.camera(camera).id for camera in cameras or []]
+        # All the cameras are rendered at the same size, checked against the offscreen buffer of the model
+        self.env.get_image_sizes(cameras or [], image_size)
+        self.image_size = tuple(image_size or (DEFAULT_IMAGE_HEIGHT, DEFAULT_IMAGE_WIDTH))
+        self.image_downsample = image_downsample
+        self.grayscale = grayscale
+        if self.camera_ids:
+            image_shape = (
+                len(self.camera_ids),
+                self.image_size[0] // image_downsample,
+                self.image_size[1] // image_downsample,
+                1 if grayscale else 3,
+            )
+            self.single_observation_space = spaces.Dict(
+                {**self.single_observation_space.spaces, "images": spaces.Box(0, 255, image_shape, dtype=np.uint8)}
+            )
+        self.single_action_space = self.env.action_space
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+        self.action_space = batch_space(self.single_action_space, num_envs)
+
+        self.observation_mode = observation_mode
+        self.action_mode = action_mode
+        self.max_episode_steps = max_episode_steps
+        self.copy = copy
+        self.control_decimation = self.env.control_decimation
+        self.terminate_on_success = self.env.terminate_on_success
+
+        # Arm addresses in qpos and qvel
+        self.nb_dof = self.env.nb_dof
+        self.arm_qpos_slice = slice(self.env.arm_qpos_adr, self.env.arm_qpos_adr + self.nb_dof)
+        self.arm_qvel_slice = slice(self.env.arm_qvel_adr, self.env.arm_qvel_adr + self.nb_dof)
+        self.ee_id = self.env.ee_id
+        if action_mode == "ee":
+            self.ik_solver = BatchedInverseKinematics(
+                self.model, self.datas, self.ee_id, self.env.arm_qpos_adr, self.env.arm_qvel_adr, nb_dof=self.nb_dof
+            )
+        self.ik_cache = self.env.ik_cache
+
+        # Batched buffers, filled from the worlds after each step
+        self._ctrl = np.zeros((num_envs, self.model.nu))
+        self._qpos = np.zeros((num_envs, self.model.nq))
+        self._qvel = np.zeros((num_envs, self.model.nv))
+        self._xpos = np.zeros((num_envs, self.model.nbody, 3))
+        self._site_xpos = np.zeros((num_envs, self.model.nsite, 3))
+        self._observation = {
+            key: np.zeros((num_envs,) + space.shape, dtype=space.dtype)
+            for key, space in self.single_observation_space.items()
+        }
+        self._episode_steps = np.zeros(num_envs, dtype=np.int64)
+        self._np_randoms = [seeding.np_random()[0] for _ in range(num_envs)]
+
+    def object_qpos_slice(self, name, size=3):
+        """
+        Slice of an object in qpos, from the index table of the template environment.
+
+        :param name: str, name of the object body
+        :param size: int, 3 for the position only and 7 for the position and orientation
+        :return: the slice
+        """
+        adr = self.env.object_qpos_adr[name]
+        return slice(adr, adr + size)
+
+    def reset_world(self, index, rng):
+        """
+        Reset the robot of a world to its initial position. Tasks sample the objects positions on top of it.
+
+        :param index: int, index of the world to reset
+        :param rng: numpy random generator of the world
+        """
+        data = self.datas[index]
+        mujoco.mj_resetData(self.model, data)
+        data.qpos[self.arm_qpos_slice] = 0.0
+
+    def fill_task_observation(self, observation):
+        """Fill the task specific keys of the stacked observation from the batched buffers."""
+        raise NotImplementedError
+
+    def get_goals(self):
+        """Goals of the worlds the reward spec refers to, as a dict of stacked arrays by name."""
+        return {}
+
+    def evaluate_rewards(self):
+        """
+        Compute the rewards and successes of all the worlds from the batched buffers, with the compiled reward spec of
+        the template environment.
+
+        :return: the rewards, float array of shape (num_envs,), and the successes, bool array of shape (num_envs,)
+        """
+        return self.env.compiled_reward(self._qpos, self._xpos, self._site_xpos, self.get_goals())
+
+    def get_task_infos(self):
+        """Task specific infos of the step, stacked for all the worlds."""
+        return {}
+
+    def _reset_worlds(self, indices):
+        for index in indices:
+            self.reset_world(index, self._np_randoms[index])
+            mujoco.mj_forward(self.model, self.datas[index])
+            self._episode_steps[index] = 0
+        self._gather(indices)
+
+    def _gather(self, indices=None):
+        indices = range(self.num_envs) if indices is None else indices
+        for index in indices:
+            data = self.datas[index]
+            self._qpos[index] = data.qpos
+            self._qvel[index] = data.qvel
+            self._xpos[index] = data.xpos
+            self._site_xpos[index] = data.site_xpos
+
+    def prepare_render(self, index):
+        """
+        Prepare the rendering of a world, e.g. move the visual geoms of its goal, which are shared by the worlds in the
+        model. Called before rendering each world.
+
+        :param index: int, index of the world
+        """
+
+    def _render(self, indices=None):
+        indices = range(self.num_envs) if indices is None else indices
+        images = self._observation["images"]
+        self.env.get_renderer().render_batch(
+            self.model,
+            [self.datas[index] for index in indices],
+            self.camera_ids,
+            height=self.image_size[0],
+            width=self.image_size[1],
+            out=[images[index] for index in indices],
+            downsample=self.image_downsample,
+            grayscale=self.grayscale,
+            prepare_world=lambda world: self.prepare_render(indices[world]),
+        )
+
+    def _get_observation(self, indices=None):
+        observation = self._observation
+        observation["arm_qpos"][:] = self._qpos[:, self.arm_qpos_slice]
+        observation["arm_qvel"][:] = self._qvel[:, self.arm_qvel_slice]
+        self.fill_task_observation(observation)
+        if self.camera_ids:
+            self._render(indices)
+        return copy.deepcopy(observation) if self.copy else observation
+
+    def reset(self, seed=None, options=None):
+        if seed is not None:
+            seeds = [seed + index for index in range(self.num_envs)] if isinstance(seed, int) else seed
+            assert len(seeds) == self.num_envs, "The number of seeds must match the number of environments"
+            self._np_randoms = [seeding.np_random(world_seed)[0] for world_seed in seeds]
+
+        self._reset_worlds(range(self.num_envs))
+        return self._get_observation(), {}
+
+    def step(self, actions):
+        # Compute the target joint positions as in `BaseLowCostRobotEnv.apply_action` and step all the worlds forward
+        actions = np.asarray(actions).reshape(self.num_envs, -1)
+        if self.action_mode == "ee":
+            ee_target_pos = self._xpos[:, self.ee_id] + actions[:, :3]
+            self._ctrl[:] = self.ik_solver.solve(
+                ee_target_pos,
+                step=self.env.ik_step,
+                nullspace_weight=self.env.nullspace_weight,
+                num_iterations=self.env.ik_iterations,
+                tol=self.env.ik_tol,
+                ik_cache=self.ik_cache,
+            )
+            self._ctrl[:, -1] = actions[:, -1]
+        else:
+            np.clip(actions, JOINT_TARGET_LOW, JOINT_TARGET_HIGH, out=self._ctrl)
+        self.stepper.step(self._ctrl, self.control_decimation)
+        self._gather()
+
+        rewards, successes = self.evaluate_rewards()
+        self._episode_steps += 1
+        terminateds = successes & self.terminate_on_success
+        truncateds = self._episode_steps >= self.max_episode_steps
+        observation = self._get_observation()
+
+        # Reset the finished worlds within the same step
+        step_infos = {"is_success": successes, **self.get_task_infos()}
+        infos = dict(step_infos)
+        for key in step_infos:
+            infos[f"_{key}"] = np.ones(self.num_envs, dtype=np.bool_)
+        dones = terminateds | truncateds
+        if dones.any():
+            # Only the finished worlds are copied, their buffers being overwritten by the reset
+            reset_indices = np.flatnonzero(dones)
+            final_observations = np.full(self.num_envs, None, dtype=object)
+            final_infos = np.full(self.num_envs, None, dtype=object)
+            for index in reset_indices:
+                final_observations[index] = {key: value[index].copy() for key, value in observation.items()}
+                final_infos[index] = {key: value[index] for key, value in step_infos.items()}
+            infos["final_observation"] = final_observations
+            infos["_final_observation"] = dones
+            infos["final_info"] = final_infos
+            infos["_final_info"] = dones
+            self._reset_worlds(reset_indices)
+            observation = self._get_observation(reset_indices)
+
+        return observation, rewards, terminateds, truncateds, infos
+
+    def close_extras(self, **kwargs):
+        self.stepper.close()
+        self.env.close()
+
+
+class LiftCubeVectorEnv(BatchedVectorEnv):
+    """Batched version of `LiftCubeEnv`, see `BatchedVectorEnv`."""
+
+    env_class = LiftCubeEnv
+
+    def __init__(self, num_envs, **kwargs):
+        super().__init__(num_envs, **kwargs)
+        self.cube_qpos_slice = self.object_qpos_slice("cube")
+        self.cube_free_slice = self.object_qpos_slice("cube", size=7)
+
+    def reset_world(self, index, rng):
+        super().reset_world(index, rng)
+        cube_pos = rng.uniform(self.env.cube_low, self.env.cube_high)
+        cube_rot = np.array([1.0, 0.0, 0.0, 0.0])
+        self.datas[index].qpos[self.cube_free_slice] = np.concatenate([cube_pos, cube_rot])
+
+    def fill_task_observation(self, observation):
+        observation["cube_pos"][:] = self._qpos[:, self.cube_qpos_slice]
+
+
+class ReachCubeVectorEnv(LiftCubeVectorEnv):
+    """Batched version of `ReachCubeEnv`, see `BatchedVectorEnv`."""
+
+    env_class = ReachCubeEnv
+
+
+class PushCubeVectorEnv(LiftCubeVectorEnv):
+    """Batched version of `PushCubeEnv`, see `BatchedVectorEnv`."""
+
+    env_class = PushCubeEnv
+
+    def __init__(self, num_envs, **kwargs):
+        super().__init__(num_envs, **kwargs)
+        self.target_pos = np.zeros((num_envs, 3), dtype=np.float32)
+
+    def reset_world(self, index, rng):
+        super().reset_world(index, rng)
+        cube_pos = self.datas[index].qpos[self.cube_qpos_slice]
+        self.target_pos[index] = self.env.sample_target_pos(rng, cube_pos)
+
+    def fill_task_observation(self, observation):
+        super().fill_task_observation(observation)
+        observation["target_pos"][:] = self.target_pos
+
+    def get_goals(self):
+        return {"target": self.target_pos}
+
+    def prepare_render(self, index):
+        # The target region is a geom of the world body, shared by the worlds, move it to the target of the world
+        self.datas[index].geom_xpos[self.env.target_region_id] = self.target_pos[index]
+
+
+class PickPlaceCubeVectorEnv(PushCubeVectorEnv):
+    """Batched version of `PickPlaceCubeEnv`, see `BatchedVectorEnv`."""
+
+    env_class = PickPlaceCubeEnv
+
+
+class StackTwoCubesVectorEnv(BatchedVectorEnv):
+    """Batched version of `StackTwoCubesEnv`, see `BatchedVectorEnv`."""
+
+    env_class = StackTwoCubesEnv
+
+    def __init__(self, num_envs, **kwargs):
+        super().__init__(num_envs, **kwargs)
+        self.red_cube_qpos_slice = self.object_qpos_slice("cube_red")
+        self.blue_cube_qpos_slice = self.object_qpos_slice("cube_blue")
+
+    def reset_world(self, index, rng):
+        super().reset_world(index, rng)
+        cube_rot = np.array([1.0, 0.0, 0.0, 0.0])
+        cube_red_pos = rng.uniform(self.env.cube_low, self.env.cube_high)
+        cube_blue_pos = rng.uniform(self.env.cube_low, self.env.cube_high)
+        qpos = self.datas[index].qpos
+        qpos[self.object_qpos_slice("cube_red", size=7)] = np.concatenate([cube_red_pos, cube_rot])
+        qpos[self.object_qpos_slice("cube_blue", size=7)] = np.concatenate([cube_blue_pos, cube_rot])
+
+    def fill_task_observation(self, observation):
+        observation["cube_red_pos"][:] = self._qpos[:, self.red_cube_qpos_slice]
+        observation["cube_blue_pos"][:] = self._qpos[:, self.blue_cube_qpos_slice]
+
+
+class PushCubeLoopVectorEnv(BatchedVectorEnv):
+    """
+    Batched version of `PushCubeLoopEnv`, see `BatchedVectorEnv`. The rewards and goal switches of all the worlds are
+    computed at once by `compute_push_cube_loop_reward`, and `info["is_success"]` (or its alias `info["success"]`)
+    gives the goal switches of the step. The episodes never terminate.
+    """
+
+    env_class = PushCubeLoopEnv
+
+    def __init__(self, num_envs, **kwargs):
+        super().__init__(num_envs, **kwargs)
+        self.cube_qpos_slice = self.object_qpos_slice("cube")
+        self.cube_free_slice = self.object_qpos_slice("cube", size=7)
+        self.goal_centers = np.stack([self.env.goal_region_1_center, self.env.goal_region_2_center])
+        # As in the single environment, the current goal is kept when a world is reset
+        self.current_goal = np.zeros(num_envs, dtype=np.int64)
+        self.success = np.zeros(num_envs, dtype=np.bool_)
+
+    def reset_world(self, index, rng):
+        super().reset_world(index, rng)
+        # Sample the cube position in the current goal region
+        cube_pos = rng.uniform(self.env.goal_region_low, self.env.goal_region_high)
+        cube_pos[:2] += self.goal_centers[self.current_goal[index], :2]
+        cube_rot = np.array([1.0, 0.0, 0.0, 0.0])
+        self.datas[index].qpos[self.cube_free_slice] = np.concatenate([cube_pos, cube_rot])
+
+    def fill_task_observation(self, observation):
+        observation["cube_pos"][:] = self._qpos[:, self.cube_qpos_slice]
+
+    def evaluate_rewards(self):
+        rewards, self.success = compute_push_cube_loop_reward(
+            self._qpos[:, self.cube_qpos_slice],
+            self.current_goal,
+            self.goal_centers,
+            self.env.goal_region_high,
+            self.env.cube_size,
+        )
+        self.current_goal[self.success] = 1 - self.current_goal[self.success]
+        # The episodes do not terminate, the cube is pushed back to the other goal region
+        return rewards, np.zeros(self.num_envs, dtype=np.bool_)
+
+    def get_task_infos(self):
+        return {"is_success": self.success.copy(), "success": self.success.copy()}
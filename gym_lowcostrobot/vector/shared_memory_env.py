@@ -0,0 +1,220 @@
+import copy
+import multiprocessing as mp
+import sys
+import traceback
+
+import numpy as np
+from gymnasium import spaces
+from gymnasium.vector import VectorEnv
+from gymnasium.vector.utils import CloudpickleWrapper, batch_space
+
+
+def _create_ring_buffers(observation_space, num_envs, buffer_depth, ctx):
+    """Allocate one shared ring buffer of shape (buffer_depth, num_envs, *shape) per observation key."""
+    buffers = {}
+    for key, space in observation_space.items():
+        shape = (buffer_depth, num_envs) + space.shape
+        nbytes = int(np.prod(shape)) * np.dtype(space.dtype).itemsize
+        buffers[key] = (ctx.RawArray("B", nbytes), space.dtype, shape)
+    return buffers
+
+
+def _ring_buffer_views(buffers):
+    """Wrap the shared ring buffers into numpy arrays, without copy."""
+    return {
+        key: np.frombuffer(raw_array, dtype=np.uint8).view(dtype).reshape(shape)
+        for key, (raw_array, dtype, shape) in buffers.items()
+    }
+
+
+def _worker(index, env_fn, pipe, parent_pipe, buffers):
+    parent_pipe.close()
+    env = env_fn()
+    views = _ring_buffer_views(buffers)
+
+    def write_observation(observation, slot):
+        for key, value in observation.items():
+            views[key][slot, index] = value
+
+    try:
+        while True:
+            command, data = pipe.recv()
+            if command == "reset":
+                seed, options, slot = data
+                observation, info = env.reset(seed=seed, options=options)
+                write_observation(observation, slot)
+                pipe.send(((info,), True))
+            elif command == "step":
+                action, slot = data
+                observation, reward, terminated, truncated, info = env.step(action)
+                if terminated or truncated:
+                    # The final observation is the only one sent through the pipe, once per episode. It is copied
+                    # before the reset, which may fill the same arrays in place (`reuse_buffers`)
+                    old_observation, old_info = copy.deepcopy(observation), info
+                    observation, info = env.reset()
+                    info["final_observation"] = old_observation
+                    info["final_info"] = old_info
+                write_observation(observation, slot)
+                pipe.send(((reward, terminated, truncated, info), True))
+            elif command == "close":
+                pipe.send((None, True))
+                break
+            else:
+                raise RuntimeError(f"Received unknown command `{command}`, must be 'reset', 'step' or 'close'")
+    except (KeyboardInterrupt, Exception):
+        error_type, error_value, _ = sys.exc_info()
+        pipe.send(((error_type.__name__, str(error_value), traceback.format_exc()), False))
+    finally:
+        env.close()
+
+
+class SharedMemoryVectorEnv(VectorEnv):
+    """
+    ## Description
+
+    Vector environment running each environment in its own subprocess, like gymnasium's `AsyncVectorEnv`, but where the
+    workers write their observations (`"image_front"`, `"image_top"` and the state) directly into shared memory
+    instead of pickling them through pipes. Only the actions, rewards, flags and infos go through the pipes.
+
+    The shared memory is organized as one ring buffer of `buffer_depth` slots per observation key. Each call to
+    `reset` or `step` fills the next slot, and the returned observation is a dictionary of numpy views of shape
+    `(num_envs, *shape)` on that slot. A view therefore stays valid for the next `buffer_depth - 1` calls, after which
+    it is overwritten. Copy the observation if it must be kept for longer.
+
+    When an environment is terminated or truncated, its worker resets it within the same step. The last observation of
+    the episode is then available in `info["final_observation"]`, with `info["_final_observation"]` as mask.
+
+    ## Arguments
+
+    - `env_fns (list)`: functions creating the environments, e.g. `[lambda: gym.make("LiftCube-v0")] * 8`.
+    - `buffer_depth (int)`: the number of slots of the ring buffers, default is 2.
+    - `context (str)`: the multiprocessing start method, default is the platform default.
+    """
+
+    metadata = {"render_modes": []}
+
+    def __init__(self, env_fns, buffer_depth=2, context=None):
+        if buffer_depth < 1:
+            raise ValueError(f"Invalid buffer depth {buffer_depth}, must be at least 1")
+
+        # Create a dummy environment to get the spaces, as done by gymnasium's AsyncVectorEnv
+        dummy_env = env_fns[0]()
+        self.metadata = dummy_env.metadata
+        self.single_observation_space = dummy_env.observation_space
+        self.single_action_space = dummy_env.action_space
+        dummy_env.close()
+        del dummy_env
+        if not isinstance(self.single_observation_space, spaces.Dict) or not all(
+            isinstance(space, spaces.Box) for space in self.single_observation_space.values()
+        ):
+            raise ValueError("The observation space must be a dictionary of boxes")
+
+        # Set the vector environment attributes
+        self.num_envs = len(env_fns)
+        self.is_vector_env = True
+        self.closed = False
+        self.viewer = None
+        self.render_mode = None
+        self.observation_space = batch_space(self.single_observation_space, self.num_envs)
+        self.action_space = batch_space(self.single_action_space, self.num_envs)
+
+        # Allocate the shared ring buffers
+        ctx = mp.get_context(context)
+        self.buffer_depth = buffer_depth
+        self._buffers = _create_ring_buffers(self.single_observation_space, self.num_envs, buffer_depth, ctx)
+        self._views = _ring_buffer_views(self._buffers)
+        self._slot = 0
+
+        # Start the workers
+        self.parent_pipes, self.processes = [], []
+        for index, env_fn in enumerate(env_fns):
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                name=f"Worker<{type(self).__name__}>-{index}",
+                args=(index, CloudpickleWrapper(env_fn), child_pipe, parent_pipe, self._buffers),
+                daemon=True,
+            )
+            self.parent_pipes.append(parent_pipe)
+            self.processes.append(process)
+            process.start()
+            child_pipe.close()
+
+    def _next_slot(self):
+        self._slot = (self._slot + 1) % self.buffer_depth
+        return self._slot
+
+    def _receive(self):
+        results = []
+        errors = []
+        for index, pipe in enumerate(self.parent_pipes):
+            result, success = pipe.recv()
+            if success:
+                results.append(result)
+            else:
+                errors.append((index, result))
+        if errors:
+            index, (error_name, error_message, error_traceback) = errors[0]
+            self.close(terminate=True)
+            raise RuntimeError(
+                f"Worker {index} raised {error_name}: {error_message}\n{error_traceback}"
+                f"({len(errors)} worker(s) failed)"
+            )
+        return results
+
+    def _observation_views(self, slot):
+        return {key: view[slot] for key, view in self._views.items()}
+
+    def reset_async(self, seed=None, options=None):
+        if seed is None or isinstance(seed, int):
+            seeds = [None if seed is None else seed + index for index in range(self.num_envs)]
+        else:
+            seeds = seed
+        assert len(seeds) == self.num_envs, "The number of seeds must match the number of environments"
+        slot = self._next_slot()
+        for pipe, env_seed in zip(self.parent_pipes, seeds):
+            pipe.send(("reset", (env_seed, options, slot)))
+
+    def reset_wait(self, timeout=None, seed=None, options=None):
+        infos = {}
+        for index, (info,) in enumerate(self._receive()):
+            infos = self._add_info(infos, info, index)
+        return self._observation_views(self._slot), infos
+
+    def reset(self, seed=None, options=None):
+        self.reset_async(seed=seed, options=options)
+        return self.reset_wait()
+
+    def step_async(self, actions):
+        slot = self._next_slot()
+        for pipe, action in zip(self.parent_pipes, actions):
+            pipe.send(("step", (action, slot)))
+
+    def step_wait(self, timeout=None):
+        rewards = np.zeros(self.num_envs, dtype=np.float64)
+        terminateds = np.zeros(self.num_envs, dtype=np.bool_)
+        truncateds = np.zeros(self.num_envs, dtype=np.bool_)
+        infos = {}
+        for index, (reward, terminated, truncated, info) in enumerate(self._receive()):
+            rewards[index], terminateds[index], truncateds[index] = reward, terminated, truncated
+            infos = self._add_info(infos, info, index)
+        return self._observation_views(self._slot), rewards, terminateds, truncateds, infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close_extras(self, timeout=None, terminate=False):
+        if terminate:
+            for process in self.processes:
+                if process.is_alive():
+                    process.terminate()
+        else:
+            for pipe in self.parent_pipes:
+                pipe.send(("close", None))
+            for pipe in self.parent_pipes:
+                pipe.recv()
+        for pipe in self.parent_pipes:
+            pipe.close()
+        for process in self.processes:
+            process.join()
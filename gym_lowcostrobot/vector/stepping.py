@@ -0,0 +1,83 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import mujoco
+import numpy as np
+
+
+class SerialStepper:
+    """
+    Steps the worlds of a batched vector environment one after the other in the calling thread.
+
+    :param model: mujoco model shared by all the worlds
+    :param datas: list of mujoco data, one per world
+    """
+
+    def __init__(self, model, datas):
+        self.model = model
+        self.datas = datas
+
+    def _step_worlds(self, indices, ctrl, nstep):
+        for index in indices:
+            data = self.datas[index]
+            data.ctrl[:] = ctrl[index]
+            for _ in range(nstep):
+                mujoco.mj_step(self.model, data)
+
+    def step(self, ctrl, nstep):
+        """
+        Set the controls of all the worlds and step them forward.
+
+        :param ctrl: numpy array of controls of shape (num_worlds, nu)
+        :param nstep: int, number of simulation steps
+        """
+        self._step_worlds(range(len(self.datas)), ctrl, nstep)
+
+    def close(self):
+        pass
+
+
+class ThreadedStepper(SerialStepper):
+    """
+    Steps the worlds of a batched vector environment on a pool of threads. MuJoCo releases the GIL while stepping, so
+    the worlds are simulated in parallel.
+
+    The worlds are split into fixed contiguous chunks, one per thread, and each world is only stepped by the thread
+    owning its chunk. Since the worlds do not share any mutable state, the results are identical to `SerialStepper`
+    whatever the number of threads.
+
+    :param model: mujoco model shared by all the worlds
+    :param datas: list of mujoco data, one per world
+    :param num_threads: int, number of threads, default is the number of CPUs
+    """
+
+    def __init__(self, model, datas, num_threads=None):
+        super().__init__(model, datas)
+        self.num_threads = min(num_threads or os.cpu_count(), len(datas))
+        self._chunks = np.array_split(np.arange(len(datas)), self.num_threads)
+        self._executor = ThreadPoolExecutor(max_workers=self.num_threads, thread_name_prefix="mujoco_stepper")
+
+    def step(self, ctrl, nstep):
+        futures = [self._executor.submit(self._step_worlds, chunk, ctrl, nstep) for chunk in self._chunks]
+        for future in futures:
+            # Propagate the exceptions raised in the threads
+            future.result()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def make_stepper(model, datas, num_threads=1):
+    """
+    Create the stepping backend of a batched vector environment.
+
+    :param model: mujoco model shared by all the worlds
+    :param datas: list of mujoco data, one per world
+    :param num_threads: int, number of stepping threads, 1 steps in the calling thread and None uses all the CPUs
+    :return: the stepper
+    """
+    if num_threads == 1:
+        return SerialStepper(model, datas)
+    if num_threads is not None and num_threads < 1:
+        raise ValueError(f"Invalid number of threads {num_threads}, must be at least 1 or None")
+    return ThreadedStepper(model, datas, num_threads=num_threads)
@@ -0,0 +1,210 @@
+import os
+import subprocess
+import time
+
+import numpy as np
+
+# Encoding settings of the LeRobot datasets videos, see `lerobot.common.datasets.video_utils.encode_video_frames`
+DEFAULT_VCODEC = "libsvtav1"
+DEFAULT_PIX_FMT = "yuv420p"
+DEFAULT_GOP_SIZE = 2
+DEFAULT_CRF = 30
+
+
+def get_video_file_name(key, episode_index):
+    """Name of the video of a camera in an episode, as in the LeRobot datasets."""
+    return f"{key}_episode_{episode_index:06d}.mp4"
+
+
+def wait_for_frame(start_time, frame_index, fps):
+    """
+    Wait until the time of a frame of a recording at `fps`, so that a recording loop faster than the videos is slowed
+    down to their frame rate. A slower loop is not waited for, its frames being late.
+
+    :param start_time: float, `time.perf_counter()` at the start of the episode
+    :param frame_index: int, index of the frame in the episode
+    :param fps: float, the frame rate of the videos
+    :return: float, the measured time of the frame since `start_time`, to be recorded as its timestamp
+    """
+    delay = frame_index / fps - (time.perf_counter() - start_time)
+    if delay > 0:
+        time.sleep(delay)
+    return time.perf_counter() - start_time
+
+
+def get_measured_fps(timestamps):
+    """
+    Measure the frame rate of an episode from the timestamps of its frames.
+
+    :param timestamps: list of the measured timestamps of the frames, see `wait_for_frame`
+    :return: float, the measured frame rate, NaN with less than two frames
+    """
+    if len(timestamps) < 2 or timestamps[-1] <= timestamps[0]:
+        return float("nan")
+    return (len(timestamps) - 1) / (timestamps[-1] - timestamps[0])
+
+
+class VideoEncoder:
+    """
+    ## Description
+
+    Encodes a video incrementally, by piping the raw RGB frames to an ffmpeg subprocess as they are produced.
+
+    Compared to saving the frames as PNG images and encoding them at the end of the recording, the frames are never
+    written to the disk, and the encoding runs in parallel with the simulation. The frames are only buffered in the
+    pipe, `write` blocks when ffmpeg is behind.
+
+    The frames are timed at `fps`, so the timestamp of the i-th frame in the video is `i / fps`.
+
+    ## Arguments
+
+    - `path (str)`: the path of the video file, its extension giving the container, e.g. "episode_000000.mp4".
+    - `width (int)`: the width of the frames.
+    - `height (int)`: the height of the frames.
+    - `fps (float)`: the frame rate of the video.
+    - `vcodec (str)`: the ffmpeg video codec, default is "libsvtav1" as in the LeRobot datasets.
+    - `pix_fmt (str)`: the pixel format of the video, default is "yuv420p".
+    - `g (int)`: the group of pictures size, i.e. the maximum interval between two keyframes, default is 2 to decode
+        random frames quickly.
+    - `crf (int)`: the constant rate factor, lower values giving a better quality, default is 30.
+    - `ffmpeg_path (str)`: the ffmpeg executable, default is "ffmpeg".
+    """
+
+    def __init__(
+        self,
+        path,
+        width,
+        height,
+        fps,
+        vcodec=DEFAULT_VCODEC,
+        pix_fmt=DEFAULT_PIX_FMT,
+        g=DEFAULT_GOP_SIZE,
+        crf=DEFAULT_CRF,
+        ffmpeg_path="ffmpeg",
+    ):
+        self.path = os.fspath(path)
+        self.frame_shape = (height, width, 3)
+        self.num_frames = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        command = [ffmpeg_path, "-y", "-loglevel", "error"]
+        command += ["-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "pipe:0"]
+        command += ["-vcodec", vcodec, "-pix_fmt", pix_fmt]
+        if g is not None:
+            command += ["-g", str(g)]
+        if crf is not None:
+            command += ["-crf", str(crf)]
+        command.append(self.path)
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, frame):
+        """
+        Write a frame to the video.
+
+        :param frame: uint8 array of shape (height, width, 3), RGB
+        """
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Invalid frame shape {frame.shape}, expected {self.frame_shape}")
+        try:
+            self.process.stdin.write(frame.data)
+        except BrokenPipeError:
+            self.close()  # raises the error of ffmpeg
+            raise
+        self.num_frames += 1
+
+    def close(self):
+        """Wait until all the frames are encoded and the video is written."""
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        if not process.stdin.closed:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+        stderr = process.stderr.read().decode(errors="replace")
+        process.stderr.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to encode {self.path}: {stderr.strip()}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class VideoRecorder:
+    """
+    ## Description
+
+    Records one video per camera and per episode, with a `VideoEncoder` per camera.
+
+    The encoders are started at the first frame of each episode, when the size of the images is known. The videos are
+    named `{key}_episode_{episode_index:06d}.mp4`, as in the LeRobot datasets.
+
+    ## Arguments
+
+    - `video_dir (str)`: the directory of the videos.
+    - `keys (list)`: the observation keys of the images to record, e.g. `["image_front", "image_top"]`.
+    - `fps (float)`: the frame rate of the videos.
+    - `encoder_kwargs`: the other arguments of the `VideoEncoder`s, e.g. `vcodec`.
+    """
+
+    def __init__(self, video_dir, keys, fps, **encoder_kwargs):
+        self.video_dir = os.fspath(video_dir)
+        self.keys = list(keys)
+        self.fps = fps
+        self.encoder_kwargs = encoder_kwargs
+        self.episode_index = None
+        self.encoders = {}
+
+    def get_video_file_name(self, key, episode_index):
+        return get_video_file_name(key, episode_index)
+
+    def start_episode(self, episode_index):
+        """
+        Start the videos of a new episode, ending the current one if any.
+
+        :param episode_index: int, index of the episode
+        """
+        self.end_episode()
+        self.episode_index = episode_index
+
+    def add_frame(self, images):
+        """
+        Add the images of a frame to the videos.
+
+        :param images: dict of RGB images, e.g. the observations of the environment, only `keys` are recorded
+        """
+        if self.episode_index is None:
+            raise RuntimeError("Start an episode with `start_episode` before adding frames")
+        for key in self.keys:
+            image = np.asarray(images[key])
+            if key not in self.encoders:
+                path = os.path.join(self.video_dir, self.get_video_file_name(key, self.episode_index))
+                height, width = image.shape[:2]
+                self.encoders[key] = VideoEncoder(path, width, height, self.fps, **self.encoder_kwargs)
+            self.encoders[key].write(image)
+
+    def end_episode(self):
+        """
+        End the videos of the current episode and wait until they are written.
+
+        :return: dict of the paths of the videos, by key
+        """
+        encoders, self.encoders = self.encoders, {}
+        self.episode_index = None
+        errors = []
+        for encoder in encoders.values():
+            try:
+                encoder.close()
+            except RuntimeError as error:
+                errors.append(error)
+        if errors:
+            raise errors[0]
+        return {key: encoder.path for key, encoder in encoders.items()}
+
+    def close(self):
+        self.end_episode()
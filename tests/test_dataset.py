@@ -0,0 +1,59 @@
+import pickle
+
+import numpy as np
+import pytest
+
+h5py = pytest.importorskip("h5py")
+
+from gym_lowcostrobot.dataset import HDF5Dataset, consolidate_hdf5  # noqa: E402
+from gym_lowcostrobot.envs.wrappers.record_hdf5 import HDF5_Recorder  # noqa: E402
+
+EPISODE_LENGTHS = [5, 3, 7]
+
+
+@pytest.fixture
+def recorded_file(tmp_path):
+    path = str(tmp_path / "episodes.hdf5")
+    recorder = HDF5_Recorder(multi_episode=True, compression="gzip")
+    frame_id = 0
+    for length in EPISODE_LENGTHS:
+        recorder.start_hdf5_recorder(path)
+        for _ in range(length):
+            observations = {"arm_qpos": np.full(6, frame_id, dtype=np.float32)}
+            recorder.capture_frame(observations, np.full(6, -frame_id, dtype=np.float32), reward=float(frame_id))
+            frame_id += 1
+    recorder.close()
+    return path
+
+
+@pytest.mark.parametrize("consolidate", [False, True])
+def test_dataset_episodes_and_windows(tmp_path, recorded_file, consolidate):
+    path = recorded_file
+    if consolidate:
+        path = str(tmp_path / "consolidated.hdf5")
+        consolidate_hdf5(recorded_file, path, block_length=4)
+    dataset = HDF5Dataset(path, window_length=3)
+    assert dataset.num_episodes == 3
+    assert sorted(dataset.keys) == ["action", "observations/qpos", "reward"]
+    assert dataset.is_memory_mapped("observations/qpos") == consolidate
+
+    episode = dataset.get_episode(2)
+    np.testing.assert_array_equal(episode["reward"], np.arange(8, 15))
+    np.testing.assert_array_equal(episode["action"][:, 0], -np.arange(8, 15))
+
+    # The windows do not cross the episodes
+    assert len(dataset) == 3 + 1 + 5
+    np.testing.assert_array_equal(dataset[3]["reward"], [5, 6, 7])
+    np.testing.assert_array_equal(dataset[-1]["reward"], [12, 13, 14])
+    with pytest.raises(IndexError):
+        dataset.get_window(1, 1, 3)
+
+    batch = dataset.sample(4, rng=np.random.default_rng(0))
+    assert batch["observations/qpos"].shape == (4, 3, 6)
+    np.testing.assert_array_equal(np.diff(batch["reward"], axis=1), 1)
+
+    # The reader is opened again after unpickling, e.g. in the workers of a data loader
+    loaded_dataset = pickle.loads(pickle.dumps(dataset))
+    np.testing.assert_array_equal(loaded_dataset[3]["reward"], [5, 6, 7])
+    dataset.close()
+    loaded_dataset.close()
@@ -1,8 +1,11 @@
 import gymnasium as gym
+import numpy as np
 import pytest
 from gymnasium.utils.env_checker import check_env
 
 import gym_lowcostrobot  # noqa
+from gym_lowcostrobot.envs import PushCubeLoopEnv
+from gym_lowcostrobot.envs.push_cube_loop_env import compute_push_cube_loop_reward
 
 
 @pytest.mark.parametrize("env_id", ["LiftCube-v0", "PickPlaceCube-v0", "PushCube-v0", "ReachCube-v0", "StackTwoCubes-v0"])
@@ -11,3 +14,109 @@ def test_env_check(env_id, observation_mode):
     env = gym.make(env_id, observation_mode=observation_mode)
     check_env(env, skip_render_check=True)
     env.close()
+
+
+@pytest.mark.parametrize("env_id", ["LiftCube-v0", "PushCube-v0", "StackTwoCubes-v0"])
+def test_reuse_buffers(env_id):
+    env = gym.make(env_id, observation_mode="both")
+    buffered_env = gym.make(env_id, observation_mode="both", reuse_buffers=True)
+    observation, _ = env.reset(seed=0)
+    buffered_observation, _ = buffered_env.reset(seed=0)
+    action = env.action_space.sample()
+    for _ in range(3):
+        observation, _, _, _, _ = env.step(action)
+        next_buffered_observation, _, _, _, _ = buffered_env.step(action)
+        for key, value in observation.items():
+            assert next_buffered_observation[key] is buffered_observation[key]
+            np.testing.assert_array_equal(next_buffered_observation[key], value)
+    env.close()
+    buffered_env.close()
+
+
+def test_camera_and_observation_key_selection():
+    env = gym.make(
+        "LiftCube-v0", observation_mode="both", cameras=["camera_top"], observation_keys=["image_top", "cube_pos"]
+    )
+    assert set(env.observation_space.spaces) == {"image_top", "cube_pos"}
+    assert list(env.unwrapped.camera_keys) == ["camera_top"]
+    observation, _ = env.reset(seed=0)
+    assert set(observation) == {"image_top", "cube_pos"}
+    env.close()
+
+    with pytest.raises(ValueError):
+        gym.make("LiftCube-v0", observation_mode="state", observation_keys=["image_front"])
+
+
+def test_render_every():
+    env = gym.make("LiftCube-v0", observation_mode="image", cameras=["camera_front"], render_every=2)
+    observation, _ = env.reset(seed=0)
+    action = env.action_space.sample()
+    images = [observation["image_front"]]
+    for _ in range(3):
+        observation, _, _, _, _ = env.step(action)
+        images.append(observation["image_front"])
+    np.testing.assert_array_equal(images[0], images[1])
+    np.testing.assert_array_equal(images[2], images[3])
+    assert not np.array_equal(images[1], images[2])
+    env.close()
+
+
+@pytest.mark.parametrize(
+    "env_id", ["LiftCube-v0", "PushCube-v0", "PushCubeLoop-v0", "ReachCube-v0", "StackTwoCubes-v0"]
+)
+def test_get_set_state(env_id):
+    env = gym.make(env_id, observation_mode="state")
+    env.reset(seed=0)
+    env.action_space.seed(0)
+    for _ in range(5):
+        env.step(env.action_space.sample())
+    state = env.unwrapped.get_state()
+    actions = [env.action_space.sample() for _ in range(10)]
+
+    def rollout():
+        return [env.step(action)[:2] for action in actions]
+
+    expected = rollout()
+
+    # Restore the snapshot after a new episode, so that the task state differs
+    env.reset(seed=1)
+    env.unwrapped.set_state(state)
+    np.testing.assert_array_equal(env.unwrapped.get_state(), state)
+    for (observation, reward), (expected_observation, expected_reward) in zip(rollout(), expected):
+        assert reward == expected_reward
+        for key in observation:
+            np.testing.assert_array_equal(observation[key], expected_observation[key])
+    env.close()
+
+
+def test_push_cube_loop_reward_kernel():
+    env = PushCubeLoopEnv(observation_mode="state")
+    goal_centers = np.stack([env.goal_region_1_center, env.goal_region_2_center])
+    rng = np.random.default_rng(0)
+    current_goal = rng.integers(0, 2, size=200)
+    cube_pos = goal_centers[current_goal] + rng.uniform(-0.1, 0.1, size=(200, 3))
+    cube_pos[:10] = goal_centers[current_goal[:10]]  # inside the goal region
+    rewards, successes = compute_push_cube_loop_reward(
+        cube_pos, current_goal, goal_centers, env.goal_region_high, env.cube_size
+    )
+    assert successes[:10].all()
+
+    # Same results as the single environment, world by world
+    for index in range(len(cube_pos)):
+        env.current_goal = current_goal[index]
+        env.object_pos["cube"][:] = cube_pos[index]
+        reward, success = env.get_reward()
+        assert reward == pytest.approx(rewards[index]) and success == successes[index]
+        assert env.current_goal == (1 - current_goal[index] if success else current_goal[index])
+    env.close()
+
+
+def test_push_cube_loop_info():
+    env = PushCubeLoopEnv(observation_mode="state")
+    env.reset(seed=0)
+    _, _, terminated, _, info = env.step(np.zeros(6, dtype=np.float32))
+    assert set(info) == {"is_success", "success", "timestamp"}
+    assert isinstance(info["is_success"], bool) and info["timestamp"] == env.data.time
+    assert info["success"] == info["is_success"]
+    assert not terminated
+    env.close()
@@ -0,0 +1,130 @@
+import mujoco
+import numpy as np
+
+from gym_lowcostrobot.envs import LiftCubeEnv
+from gym_lowcostrobot.inverse_kinematics import BatchedInverseKinematics, IKCache
+from gym_lowcostrobot.simulated_robot import LevenbegMarquardtIK
+
+
+def make_solver(num_worlds):
+    env = LiftCubeEnv(observation_mode="state")
+    datas = [mujoco.MjData(env.model) for _ in range(num_worlds)]
+    rng = np.random.default_rng(0)
+    for data in datas:
+        data.qpos[env.arm_qpos_adr : env.arm_qpos_adr + 6] = rng.uniform(-0.5, 0.5, size=6)
+        mujoco.mj_forward(env.model, data)
+    solver = BatchedInverseKinematics(env.model, datas, env.ee_id, env.arm_qpos_adr, env.arm_qvel_adr)
+    return env, datas, solver
+
+
+def test_batched_solve_matches_single_world_solve():
+    env, datas, solver = make_solver(4)
+    targets = np.array([data.xpos[env.ee_id] for data in datas]) + np.array([0.02, -0.01, 0.03])
+    batched_qpos = solver.solve(targets, nullspace_weight=0.1).copy()
+    for index, data in enumerate(datas):
+        single_solver = BatchedInverseKinematics(env.model, [data], env.ee_id, env.arm_qpos_adr, env.arm_qvel_adr)
+        single_qpos = single_solver.solve(targets[index : index + 1], nullspace_weight=0.1)
+        np.testing.assert_allclose(batched_qpos[index], single_qpos[0])
+    env.close()
+
+
+def test_iterations_converge_without_modifying_the_worlds():
+    env, datas, solver = make_solver(3)
+    qpos_before = [data.qpos.copy() for data in datas]
+    targets = np.array([data.xpos[env.ee_id] for data in datas]) + np.array([0.0, 0.03, -0.02])
+    qpos = solver.solve(targets, step=1.0, num_iterations=20).copy()
+    for index, data in enumerate(datas):
+        np.testing.assert_array_equal(data.qpos, qpos_before[index])
+
+        # The end effector reaches the target at the solution
+        data.qpos[env.arm_qpos_adr : env.arm_qpos_adr + 6] = qpos[index]
+        mujoco.mj_kinematics(env.model, data)
+        assert np.linalg.norm(data.xpos[env.ee_id] - targets[index]) < 1e-4
+    env.close()
+
+
+def test_convergence_of_the_last_iteration():
+    env, datas, solver = make_solver(2)
+    targets = np.array([data.xpos[env.ee_id] for data in datas]) + np.array([0.0, 0.02, 0.0])
+    ik_cache = IKCache(targets.min(axis=0) - 0.1, (30, 30, 30))
+    # A single full step reaches the targets, the worlds are converged once it is applied
+    solver.solve(targets, step=1.0, num_iterations=1, tol=5e-3, ik_cache=ik_cache)
+    assert solver.converged.all()
+    assert ik_cache.filled.sum() == 2
+    env.close()
+
+
+def test_levenberg_marquardt_ik_is_headless_and_bounded():
+    env = LiftCubeEnv(observation_mode="state")
+    env.reset(seed=0)
+    qpos_before = env.data.qpos.copy()
+    ik = LevenbegMarquardtIK(env.model, env.data, tol=1e-3, step_size=0.5, max_iter=200)
+    goal = env.ee_pos + np.array([0.02, 0.02, 0.03])
+    q, info = ik.solve(goal, env.ee_id)
+    np.testing.assert_array_equal(env.data.qpos, qpos_before)
+    assert info["success"] and info["residual"] < 1e-3 and 0 < info["iterations"] <= 200
+    assert np.all(q >= ik.q_low) and np.all(q <= ik.q_high)
+
+    # Warm started from the previous solution, the same goal is already reached
+    _, info = ik.solve(goal, env.ee_id)
+    assert info["iterations"] == 0
+
+    # An unreachable goal stops at the iteration budget
+    _, info = ik.solve(np.array([0.0, 0.0, 2.0]), env.ee_id)
+    assert not info["success"] and info["iterations"] == 200
+    env.close()
+
+
+def test_ik_cache_build_save_load(tmp_path):
+    env = LiftCubeEnv(observation_mode="state")
+    cache = IKCache.from_env(env, num_samples=2000, voxel_size=0.02, seed=0)
+    assert cache.filled.any()
+
+    # The cached configurations place the end effector in their voxel
+    qpos, ee_pos, found = cache.lookup(cache.ee_pos[cache.filled])
+    assert found.all()
+    data = mujoco.MjData(env.model)
+    data.qpos[env.arm_qpos_adr : env.arm_qpos_adr + 6] = qpos[0]
+    mujoco.mj_kinematics(env.model, data)
+    np.testing.assert_allclose(data.xpos[env.ee_id], ee_pos[0])
+
+    path = tmp_path / "ik_cache.npz"
+    cache.save(path)
+    loaded_cache = IKCache.load(path)
+    np.testing.assert_array_equal(loaded_cache.filled, cache.filled)
+    np.testing.assert_array_equal(loaded_cache.qpos, cache.qpos)
+    env.close()
+
+
+def test_ee_mode_with_ik_cache_reaches_far_targets():
+    env = LiftCubeEnv(observation_mode="state")
+    cache = IKCache.from_env(env, num_samples=5000, voxel_size=0.02, seed=0)
+    env.close()
+
+    env = LiftCubeEnv(observation_mode="state", action_mode="ee", ik_cache=cache)
+    env.reset(seed=0)
+    target = cache.ee_pos[cache.filled][len(cache.ee_pos[cache.filled]) // 2]
+    target_qpos = env.inverse_kinematics(target, step=1.0, num_iterations=20, tol=1e-3)
+    assert env.ik_solver.converged[0]
+    data = mujoco.MjData(env.model)
+    data.qpos[env.arm_qpos_adr : env.arm_qpos_adr + 6] = target_qpos
+    mujoco.mj_kinematics(env.model, data)
+    assert np.linalg.norm(data.xpos[env.ee_id] - target) < 1e-3
+
+    # Actions are solved with the cache
+    env.step(np.array([0.0, 0.05, 0.05, 0.0], dtype=np.float32))
+    env.close()
+
+
+def test_ee_mode_solved_to_convergence_without_cache():
+    env = LiftCubeEnv(observation_mode="state", action_mode="ee", ik_iterations=50, ik_tol=1e-4)
+    env.reset(seed=0)
+    assert env.ik_cache is None and env.ik_step == 1.0
+    env.step(np.array([0.02, -0.01, 0.01, 0.0], dtype=np.float32))
+    assert env.ik_solver.converged[0]
+    env.close()
+
+    # The default is a single damped step
+    env = LiftCubeEnv(observation_mode="state", action_mode="ee")
+    assert (env.ik_step, env.ik_iterations, env.ik_tol) == (0.2, 1, None)
+    env.close()
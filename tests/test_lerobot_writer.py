@@ -0,0 +1,75 @@
+import json
+
+import numpy as np
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+from gym_lowcostrobot.lerobot_writer import LeRobotDatasetWriter  # noqa: E402
+
+
+def test_writer_saves_episodes_incrementally(tmp_path):
+    rng = np.random.default_rng(0)
+    writer = LeRobotDatasetWriter(tmp_path, fps=30, video_keys=["image_top"])
+    states = []
+    for num_frames in [5, 8]:
+        for _ in range(num_frames):
+            frame = {"observation.state": rng.standard_normal(4).astype(np.float32), "action": rng.standard_normal(2)}
+            states.append(frame["observation.state"])
+            writer.add_frame(frame, images={"image_top": np.full((4, 4, 3), 255, dtype=np.uint8)})
+        writer.save_episode()
+        # The episode is written and forgotten
+        assert writer.episode_buffer is None
+
+    assert writer.episode_data_index == {"from": [0, 5], "to": [5, 13]}
+    table = pq.read_table(writer.episode_paths[1]).to_pydict()
+    assert table["index"] == list(range(5, 13))
+    assert table["frame_index"] == list(range(8))
+    assert table["next.done"] == [False] * 7 + [True]
+    np.testing.assert_allclose(table["timestamp"], np.arange(8) / 30, rtol=1e-6)
+    assert table["observation.images.image_top"][0] == {
+        "path": "videos/image_top_episode_000001.mp4",
+        "timestamp": 0.0,
+    }
+    np.testing.assert_array_equal(table["observation.state"], states[5:])
+
+    with open(tmp_path / "meta_data" / "stats.json") as f:
+        stats = json.load(f)
+    np.testing.assert_allclose(stats["observation.state"]["mean"], np.mean(states, axis=0), rtol=1e-6)
+    np.testing.assert_allclose(stats["observation.state"]["max"], np.max(states, axis=0))
+    assert stats["observation.images.image_top"]["mean"] == [[[1.0]], [[1.0]], [[1.0]]]
+    with open(tmp_path / "meta_data" / "info.json") as f:
+        assert json.load(f)["total_frames"] == 13
+
+
+def test_writer_resumes_existing_dataset(tmp_path):
+    rng = np.random.default_rng(0)
+    states = rng.standard_normal((9, 4)).astype(np.float32)
+    writer = LeRobotDatasetWriter(tmp_path, fps=30)
+    for state in states[:4]:
+        writer.add_frame({"observation.state": state})
+    writer.save_episode()
+
+    # The episodes already saved are kept, and the statistics cover all the episodes
+    writer = LeRobotDatasetWriter(tmp_path, fps=30)
+    assert writer.num_episodes == 1
+    for state in states[4:]:
+        writer.add_frame({"observation.state": state})
+    assert writer.save_episode() == 1
+
+    assert writer.episode_data_index == {"from": [0, 4], "to": [4, 9]}
+    assert pq.read_table(writer.episode_paths[0]).to_pydict()["index"] == list(range(4))
+    assert pq.read_table(writer.episode_paths[1]).to_pydict()["index"] == list(range(4, 9))
+    np.testing.assert_allclose(writer.get_stats()["observation.state"]["mean"], states.mean(axis=0), rtol=1e-5)
+    with pytest.raises(ValueError):
+        LeRobotDatasetWriter(tmp_path, fps=10)
+
+
+def test_writer_refuses_episodes_without_meta_data(tmp_path):
+    writer = LeRobotDatasetWriter(tmp_path, fps=30)
+    writer.add_frame({"observation.state": np.zeros(4, dtype=np.float32)})
+    writer.save_episode()
+    (tmp_path / "meta_data" / "info.json").unlink()
+
+    with pytest.raises(ValueError):
+        LeRobotDatasetWriter(tmp_path, fps=30)
@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+
+from gym_lowcostrobot import ASSETS_PATH
+from gym_lowcostrobot.model_cache import clear_cache, load_model, scene_dependencies
+
+SCENE_PATH = os.path.join(ASSETS_PATH, "push_cube.xml")
+
+
+def test_scene_dependencies():
+    dependencies = scene_dependencies(SCENE_PATH)
+    assert dependencies[0] == SCENE_PATH
+    assert os.path.join(ASSETS_PATH, "follower.xml") in dependencies
+    assert os.path.join(ASSETS_PATH, "follower_meshes", "link_6.stl") in dependencies
+    assert all(os.path.isfile(file) for file in dependencies)
+
+
+def test_load_model_saves_and_reuses_mjb(tmp_path):
+    clear_cache()
+    model = load_model(SCENE_PATH, cache_dir=str(tmp_path))
+    mjb_files = os.listdir(tmp_path)
+    assert len(mjb_files) == 1 and mjb_files[0].endswith(".mjb")
+
+    # A new process would load the MJB file instead of compiling the scene
+    clear_cache()
+    mjb_path = os.path.join(tmp_path, mjb_files[0])
+    mtime = os.stat(mjb_path).st_mtime_ns
+    loaded_model = load_model(SCENE_PATH, cache_dir=str(tmp_path))
+    assert os.stat(mjb_path).st_mtime_ns == mtime
+    assert loaded_model.nq == model.nq and loaded_model.ngeom == model.ngeom
+    np.testing.assert_array_equal(loaded_model.geom_pos, model.geom_pos)
+    clear_cache()
+
+
+def test_load_model_returns_copies(tmp_path):
+    model_1 = load_model(SCENE_PATH, cache_dir=str(tmp_path))
+    model_2 = load_model(SCENE_PATH, cache_dir=str(tmp_path))
+    assert model_1 is not model_2
+    geom_pos = model_2.geom_pos[0].copy()
+    model_1.geom_pos[0] += 1.0
+    np.testing.assert_array_equal(model_2.geom_pos[0], geom_pos)
+    clear_cache()
@@ -0,0 +1,196 @@
+import os
+import threading
+
+import gymnasium as gym
+import numpy as np
+import pytest
+
+h5py = pytest.importorskip("h5py")
+
+from gym_lowcostrobot.envs import PushCubeEnv, ReachCubeEnv  # noqa: E402
+from gym_lowcostrobot.envs.wrappers.record_hdf5 import (  # noqa: E402
+    HDF5_Recorder,
+    RecordHDF5Wrapper,
+    ThreadedHDF5Recorder,
+)
+
+
+def random_frames(num_frames):
+    rng = np.random.default_rng(0)
+    observations = [
+        {
+            "image_front": rng.integers(0, 255, size=(24, 32, 3), dtype=np.uint8),
+            "arm_qpos": rng.standard_normal(6).astype(np.float32),
+            "arm_qvel": rng.standard_normal(6).astype(np.float32),
+        }
+        for _ in range(num_frames)
+    ]
+    actions = [rng.standard_normal(6).astype(np.float32) for _ in range(num_frames)]
+    return observations, actions
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+@pytest.mark.parametrize("compression", [None, "gzip", "lzf"])
+def test_recorder_writes_all_frames(tmp_path, streaming, compression):
+    path = str(tmp_path / "episode.hdf5")
+    observations, actions = random_frames(37)
+    recorder = HDF5_Recorder(streaming=streaming, compression=compression)
+    recorder.start_hdf5_recorder(path)
+    for observation, action in zip(observations, actions):
+        recorder.capture_frame(observation, action)
+    if streaming:
+        # The frames are written by whole chunks while recording, only the last partial chunk is kept in memory
+        assert recorder.columns_length < len(recorder.columns["action"])
+    recorder.close()
+
+    with h5py.File(path, "r") as file:
+        for key, name in [
+            ("image_front", "observations/images/front"),
+            ("arm_qpos", "observations/qpos"),
+            ("arm_qvel", "observations/qvel"),
+        ]:
+            np.testing.assert_array_equal(file[name], np.stack([observation[key] for observation in observations]))
+        np.testing.assert_array_equal(file["action"], np.stack(actions))
+        if streaming:
+            assert file["observations/images/front"].chunks is not None
+            assert file["observations/images/front"].compression == compression
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_recorder_column_dtypes(tmp_path, streaming):
+    path = str(tmp_path / "episode.hdf5")
+    observations, actions = random_frames(10)
+    # Buffered mode preallocates 4 frames and grows the columns when the episode is longer
+    recorder = HDF5_Recorder(streaming=streaming, length=4)
+    recorder.start_hdf5_recorder(path)
+    for t, (observation, action) in enumerate(zip(observations, actions)):
+        state = {"cube_pos": np.full(3, t, dtype=np.float32)}
+        recorder.capture_frame(
+            observation, action.astype(np.float64), 1, False, t == 9, info={"timestamp": 0.1 * t}, state=state
+        )
+    recorder.close()
+
+    with h5py.File(path, "r") as file:
+        assert file["observations/images/front"].dtype == np.uint8
+        assert file["observations/qpos"].dtype == np.float32
+        assert file["action"].dtype == np.float32
+        assert file["reward"].dtype == np.float64
+        assert file["terminated"].dtype == np.bool_
+        assert file["truncated"].dtype == np.bool_
+        assert file["timestamp"].dtype == np.float64
+        assert file["state/cube_pos"].dtype == np.float64
+        np.testing.assert_array_equal(file["action"], np.stack(actions))
+        np.testing.assert_array_equal(file["truncated"], np.arange(10) == 9)
+        np.testing.assert_array_equal(file["state/cube_pos"][:, 0], np.arange(10))
+        np.testing.assert_array_equal(file["episode_index"], [[0, 10]])
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_recorder_rejects_frames_with_other_keys(tmp_path, streaming):
+    observations, actions = random_frames(3)
+    recorder = HDF5_Recorder(streaming=streaming)
+    recorder.start_hdf5_recorder(str(tmp_path / "episode.hdf5"))
+    recorder.capture_frame(observations[0], actions[0], info={"timestamp": 0.0})
+    with pytest.raises(ValueError, match="missing \\['timestamp'\\]"):
+        recorder.capture_frame(observations[1], actions[1])
+    with pytest.raises(ValueError, match="unexpected \\['reward'\\]"):
+        recorder.capture_frame(observations[1], actions[1], reward=1.0, info={"timestamp": 0.1})
+    recorder.close()
+
+
+def test_record_hdf5_wrapper(tmp_path):
+    hdf5_folder = tmp_path / "records"
+    env = RecordHDF5Wrapper(ReachCubeEnv(observation_mode="both"), hdf5_folder=str(hdf5_folder), compression="gzip")
+    env.reset(seed=0)
+    for _ in range(5):
+        env.step(env.action_space.sample())
+    env.close()
+
+    with h5py.File(hdf5_folder / "hdf5_record-episode-0.hdf5", "r") as file:
+        assert file["observations/images/top"].shape == (5, 240, 320, 3)
+        assert file["observations/cube_pos"].shape == (5, 3)
+        assert file["action"].shape == (5, 6)
+
+
+def test_threaded_recorder_writes_all_frames(tmp_path):
+    recorder = ThreadedHDF5Recorder(HDF5_Recorder(compression="lzf"), queue_size=4)
+    for episode in range(2):
+        observations, actions = random_frames(20)
+        recorder.start_hdf5_recorder(str(tmp_path / f"episode-{episode}.hdf5"))
+        for observation, action in zip(observations, actions):
+            recorder.capture_frame(observation, action)
+            # The frames are copied, the buffers can be reused by the environment
+            observation["arm_qpos"][:] = 0.0
+        recorder.close()
+    recorder.join()
+    assert not recorder.thread.is_alive()
+
+    for episode in range(2):
+        with h5py.File(tmp_path / f"episode-{episode}.hdf5", "r") as file:
+            assert file["observations/qpos"].shape == (20, 6)
+            assert np.all(file["observations/qpos"][:] != 0.0)
+            np.testing.assert_array_equal(file["action"], np.stack(actions))
+
+
+def test_threaded_recorder_drops_frames_when_full(tmp_path):
+    class SlowRecorder(HDF5_Recorder):
+        def __init__(self):
+            super().__init__()
+            self.unblocked = threading.Event()
+
+        def capture_frame(self, *args, **kwargs):
+            self.unblocked.wait()
+            super().capture_frame(*args, **kwargs)
+
+    observations, actions = random_frames(10)
+    slow_recorder = SlowRecorder()
+    recorder = ThreadedHDF5Recorder(slow_recorder, queue_size=2, on_full="drop")
+    recorder.start_hdf5_recorder(str(tmp_path / "episode.hdf5"))
+    for observation, action in zip(observations, actions):
+        recorder.capture_frame(observation, action)
+    assert recorder.dropped_frames > 0
+    slow_recorder.unblocked.set()
+    recorder.close()
+    recorder.join()
+
+    with h5py.File(tmp_path / "episode.hdf5", "r") as file:
+        assert len(file["action"]) == len(actions) - recorder.dropped_frames
+
+
+def test_threaded_recorder_raises_writer_errors(tmp_path):
+    recorder = ThreadedHDF5Recorder(HDF5_Recorder())
+    recorder.start_hdf5_recorder(str(tmp_path / "missing_folder" / "episode.hdf5"))
+    observations, actions = random_frames(1)
+    recorder.capture_frame(observations[0], actions[0])
+    with pytest.raises(RuntimeError, match="writer thread failed"):
+        recorder.join()
+
+
+@pytest.mark.parametrize("background_writer", [False, True])
+def test_record_hdf5_wrapper_multi_episode(tmp_path, background_writer):
+    hdf5_folder = tmp_path / "records"
+    env = RecordHDF5Wrapper(
+        gym.wrappers.TimeLimit(PushCubeEnv(observation_mode="image"), max_episode_steps=4),
+        hdf5_folder=str(hdf5_folder),
+        episodes_per_file=2,
+        background_writer=background_writer,
+    )
+    target_positions = []
+    for episode in range(3):
+        env.reset(seed=episode)
+        target_positions.append(env.unwrapped.target_pos.copy())
+        truncated = False
+        while not truncated:
+            _, _, _, truncated, _ = env.step(env.action_space.sample())
+    env.close()
+
+    assert sorted(os.listdir(hdf5_folder)) == ["hdf5_record-shard-0.hdf5", "hdf5_record-shard-1.hdf5"]
+    with h5py.File(hdf5_folder / "hdf5_record-shard-0.hdf5", "r") as file:
+        np.testing.assert_array_equal(file["episode_index"], [[0, 4], [4, 8]])
+        assert file["observations/images/front"].shape == (8, 240, 320, 3)
+        assert file["reward"].dtype == np.float64 and file["reward"].shape == (8,)
+        np.testing.assert_array_equal(file["truncated"], [False, False, False, True] * 2)
+        np.testing.assert_allclose(file["state/target_pos"][4], target_positions[1])
+        assert file["state/cube_pos"].shape == (8, 3)
+    with h5py.File(hdf5_folder / "hdf5_record-shard-1.hdf5", "r") as file:
+        np.testing.assert_array_equal(file["episode_index"], [[0, 4]])
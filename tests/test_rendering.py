@@ -0,0 +1,127 @@
+import threading
+
+import gymnasium as gym
+import numpy as np
+import pytest
+
+from gym_lowcostrobot import rendering
+from gym_lowcostrobot.envs import PushCubeEnv
+from gym_lowcostrobot.vector import PushCubeVectorEnv
+
+
+def test_select_backend(monkeypatch):
+    monkeypatch.setenv("MUJOCO_GL", "osmesa")
+    assert rendering.select_backend() == "osmesa"
+    assert rendering.select_backend("egl") == "egl"
+
+    monkeypatch.delenv("MUJOCO_GL")
+    monkeypatch.delenv("DISPLAY", raising=False)
+    monkeypatch.delenv("WAYLAND_DISPLAY", raising=False)
+    monkeypatch.setattr(rendering.sys, "platform", "linux")
+    assert rendering.select_backend() == "egl"
+
+    with pytest.raises(ValueError):
+        rendering.select_backend("directx")
+
+
+def test_shared_renderer():
+    env_1 = gym.make("LiftCube-v0", observation_mode="image", cameras=["camera_front"]).unwrapped
+    env_2 = gym.make("LiftCube-v0", observation_mode="image", render_mode="rgb_array").unwrapped
+    observation_1, _ = env_1.reset(seed=0)
+    observation_2, _ = env_2.reset(seed=0)
+    assert env_1.renderer is env_2.renderer
+    assert observation_1["image_front"].shape == observation_2["image_front"].shape == (240, 320, 3)
+    assert np.any(observation_1["image_front"] != observation_1["image_front"][0, 0])
+    assert env_2.render().shape == (640, 640, 3)
+
+    timings = rendering.get_render_timings()[env_1.scene_path]
+    assert timings["num_frames"] >= 4 and timings["last_time"] > 0.0
+    with pytest.raises(ValueError):
+        env_1.renderer.render(env_1.model, env_1.data, 0, height=1000, width=1000)
+    env_1.close()
+    env_2.close()
+
+
+def test_reduce_image():
+    image = np.zeros((4, 6, 3), dtype=np.uint8)
+    image[:2, :2] = [255, 0, 0]
+    reduced = rendering.reduce_image(image, downsample=2)
+    assert reduced.shape == (2, 3, 3)
+    assert reduced[0, 0].tolist() == [255, 0, 0] and reduced[1].max() == 0
+    gray = rendering.reduce_image(image, downsample=2, grayscale=True)
+    assert gray.shape == (2, 3, 1) and gray[0, 0, 0] == round(0.299 * 255)
+
+
+def test_vector_env_images():
+    vector_env = PushCubeVectorEnv(2, cameras=["camera_front", "camera_top"])
+    observations, _ = vector_env.reset(seed=0)
+    assert observations["images"].shape == (2, 2, 240, 320, 3)
+    assert vector_env.observation_space["images"].shape == (2, 2, 240, 320, 3)
+
+    # Same images as the single environments, with the target of each world
+    env = PushCubeEnv(observation_mode="image")
+    for index in range(2):
+        observation, _ = env.reset(seed=index)
+        np.testing.assert_array_equal(observations["images"][index, 0], observation["image_front"])
+        np.testing.assert_array_equal(observations["images"][index, 1], observation["image_top"])
+    env.close()
+    vector_env.close()
+
+    vector_env = PushCubeVectorEnv(2, cameras=["camera_top"], image_downsample=2, grayscale=True)
+    vector_env.reset(seed=0)
+    observations, *_ = vector_env.step(np.zeros((2, 6), dtype=np.float32))
+    assert observations["images"].shape == (2, 1, 120, 160, 1)
+    vector_env.close()
+
+
+def test_image_size():
+    env = gym.make("LiftCube-v0", observation_mode="image", image_size={"camera_front": (84, 84)}, reuse_buffers=True)
+    assert env.observation_space["image_front"].shape == (84, 84, 3)
+    assert env.observation_space["image_top"].shape == (240, 320, 3)
+    observation, _ = env.reset(seed=0)
+    assert observation["image_front"].shape == (84, 84, 3) and observation["image_top"].shape == (240, 320, 3)
+    assert np.any(observation["image_front"] != observation["image_front"][0, 0])
+    env.close()
+
+    with pytest.raises(ValueError):
+        gym.make("LiftCube-v0", observation_mode="image", image_size=(1000, 1000))
+    with pytest.raises(ValueError):
+        gym.make("LiftCube-v0", observation_mode="image", image_size={"camera_side": (84, 84)})
+
+    vector_env = PushCubeVectorEnv(2, cameras=["camera_front"], image_size=(84, 84))
+    observations, _ = vector_env.reset(seed=0)
+    assert observations["images"].shape == vector_env.observation_space["images"].shape == (2, 1, 84, 84, 3)
+    env = PushCubeEnv(observation_mode="image", cameras=["camera_front"], image_size=(84, 84))
+    observation, _ = env.reset(seed=0)
+    np.testing.assert_array_equal(observations["images"][0, 0], observation["image_front"])
+    env.close()
+    vector_env.close()
+
+
+def test_renderers_are_released_on_close():
+    env_1 = PushCubeEnv(observation_mode="image", cameras=["camera_front"])
+    env_2 = PushCubeEnv(observation_mode="image", cameras=["camera_front"])
+    env_1.reset(seed=0)
+    env_2.reset(seed=0)
+    assert env_1.scene_path in rendering.get_render_timings()
+
+    # The renderer is kept until the last environment using it is closed
+    env_1.close()
+    assert env_1.scene_path in rendering.get_render_timings()
+    env_2.close()
+    assert env_1.scene_path not in rendering.get_render_timings()
+
+
+def test_render_from_several_threads():
+    env = PushCubeEnv(observation_mode="image", cameras=["camera_front"])
+    observation, _ = env.reset(seed=0)
+    images = []
+    # The GL context is released after each render, for another thread to make it current
+    for _ in range(2):
+        thread = threading.Thread(target=lambda: images.append(env.get_observation()["image_front"]))
+        thread.start()
+        thread.join()
+    assert len(images) == 2
+    for image in images:
+        np.testing.assert_array_equal(image, observation["image_front"])
+    env.close()
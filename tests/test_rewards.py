@@ -0,0 +1,137 @@
+import mujoco
+import numpy as np
+import pytest
+
+from gym_lowcostrobot.envs import LiftCubeEnv, PushCubeEnv, ReachCubeEnv
+from gym_lowcostrobot.rewards import Distance, Height, InRegion, RewardSpec
+from gym_lowcostrobot.vector import LiftCubeVectorEnv, PushCubeVectorEnv
+
+
+def test_compiled_spec_matches_numpy():
+    env = PushCubeEnv(observation_mode="state")
+    env.reset(seed=0)
+    spec = RewardSpec(
+        [Distance("cube", "target", weight=-2.0), Height("end_effector", threshold=0.1), Distance("link_6", "cube")],
+        success=[InRegion("cube", "target", half_size=(0.5, 0.5))],
+    )
+    compiled = spec.compile(env.model, env.object_qpos_adr, goal_names=["target"])
+    rewards, successes = compiled(env.data.qpos[None], env.data.xpos[None], env.data.site_xpos[None], env.get_goals())
+
+    cube_pos = env.object_pos["cube"]
+    expected = -2.0 * np.linalg.norm(cube_pos - env.target_pos)
+    expected += env.data.site("end_effector").xpos[2] - 0.1
+    expected -= np.linalg.norm(env.ee_pos - cube_pos)
+    np.testing.assert_allclose(rewards, [expected])
+    assert successes.tolist() == [True]
+    env.close()
+
+
+def test_unknown_point():
+    env = LiftCubeEnv(observation_mode="state")
+    with pytest.raises(ValueError):
+        RewardSpec([Distance("cube", "unknown")]).compile(env.model, env.object_qpos_adr)
+    env.close()
+
+
+def test_terminate_on_success():
+    # The cube lies above the ground, so the task is successful at the first step
+    spec = RewardSpec([Height("cube")], success=[Height("cube", threshold=0.0)], terminate_on_success=True)
+    env = LiftCubeEnv(observation_mode="state", reward_spec=spec)
+    env.reset(seed=0)
+    _, reward, terminated, _, _ = env.step(np.zeros(6, dtype=np.float32))
+    assert terminated and reward == pytest.approx(env.object_pos["cube"][2])
+    env.close()
+
+    vector_env = LiftCubeVectorEnv(2, reward_spec=spec)
+    vector_env.reset(seed=0)
+    _, _, terminateds, truncateds, infos = vector_env.step(np.zeros((2, 6), dtype=np.float32))
+    assert terminateds.all() and not truncateds.any()
+    assert infos["_final_observation"].all()
+    vector_env.close()
+
+
+@pytest.mark.parametrize("terminate_on_success", [None, False])
+def test_push_cube_success(terminate_on_success):
+    env = PushCubeEnv(observation_mode="state", terminate_on_success=terminate_on_success)
+    env.reset(seed=0)
+    # Move the cube to the center of the target region, within the cylinder of radius 0.035
+    env.object_qpos["cube"][:2] = env.target_pos[:2] + 0.02
+    _, _, terminated, _, info = env.step(np.zeros(6, dtype=np.float32))
+    assert info["is_success"]
+    assert terminated == (terminate_on_success is None)
+    env.close()
+
+
+def test_vector_env_is_success():
+    vector_env = LiftCubeVectorEnv(3)
+    vector_env.reset(seed=0)
+    _, _, terminateds, _, infos = vector_env.step(np.zeros((3, 6), dtype=np.float32))
+    assert infos["is_success"].shape == (3,)
+    assert not infos["is_success"].any() and not terminateds.any()
+    vector_env.close()
+
+
+def test_round_region():
+    env = PushCubeEnv(observation_mode="state", terminate_on_success=False)
+    env.reset(seed=0)
+    # Within the bounding square of the cylinder of radius 0.035, but outside of the cylinder
+    env.object_qpos["cube"][:2] = env.target_pos[:2] + 0.03
+    _, _, _, _, info = env.step(np.zeros(6, dtype=np.float32))
+    assert not info["is_success"]
+
+    # Rectangular region of the same half size
+    spec = RewardSpec([], success=[InRegion("cube", "target", half_size=(0.035, 0.035))])
+    compiled = spec.compile(env.model, env.object_qpos_adr, goal_names=["target"])
+    _, successes = compiled(env.data.qpos[None], env.data.xpos[None], goals=env.get_goals())
+    assert successes.tolist() == [True]
+    env.close()
+
+
+def test_rotated_box_region():
+    xml = """
+    <mujoco>
+      <worldbody>
+        <geom name="region" type="box" size="0.1 0.02 0.01" euler="0 0 90"/>
+        <site name="center"/>
+        <site name="point" pos="0 0.05 0"/>
+      </worldbody>
+    </mujoco>
+    """
+    model = mujoco.MjModel.from_xml_string(xml)
+    data = mujoco.MjData(model)
+    mujoco.mj_kinematics(model, data)
+    args = (data.qpos[None], data.xpos[None], data.site_xpos[None])
+
+    # The box is rotated by 90 degrees, its long side being along y
+    spec = RewardSpec([], success=[InRegion("point", "center", half_size="region")])
+    _, successes = spec.compile(model)(*args)
+    assert successes.tolist() == [True]
+    spec = RewardSpec([], success=[InRegion("point", "center", half_size=(0.1, 0.02))])
+    _, successes = spec.compile(model)(*args)
+    assert successes.tolist() == [False]
+
+
+def test_not_successful_at_reset():
+    env = PushCubeEnv(observation_mode="state")
+    for seed in range(100):
+        env.reset(seed=seed)
+        _, _, terminated, _, info = env.step(np.zeros(6, dtype=np.float32))
+        assert not info["is_success"] and not terminated
+    env.close()
+
+    vector_env = PushCubeVectorEnv(100)
+    vector_env.reset(seed=0)
+    _, _, _, _, infos = vector_env.step(np.zeros((100, 6), dtype=np.float32))
+    assert not infos["is_success"].any()
+    vector_env.close()
+
+
+def test_reach_cube_success():
+    # The optimum of the reward, the end effector on the cube, is successful
+    env = ReachCubeEnv(observation_mode="state", terminate_on_success=False)
+    env.reset(seed=0)
+    qpos = env.data.qpos.copy()
+    qpos[env.object_qpos_adr["cube"] : env.object_qpos_adr["cube"] + 3] = env.ee_pos
+    rewards, successes = env.compiled_reward(qpos[None], env.data.xpos[None], env.data.site_xpos[None])
+    assert rewards[0] == pytest.approx(0.0) and successes.tolist() == [True]
+    env.close()
@@ -0,0 +1,71 @@
+import numpy as np
+
+from gym_lowcostrobot.envs import ReachCubeEnv
+from gym_lowcostrobot.envs.wrappers.running_stats import RunningStatsWrapper
+from gym_lowcostrobot.stats import DictRunningStats, RunningStats
+
+
+def test_running_stats_matches_numpy():
+    rng = np.random.default_rng(0)
+    values = 1e6 + rng.standard_normal((1000, 3))
+    stats = RunningStats()
+    for batch in np.array_split(values, 7):
+        stats.update(batch)
+    assert stats.count == 1000
+    np.testing.assert_allclose(stats.mean, values.mean(axis=0))
+    np.testing.assert_allclose(stats.std, values.std(axis=0))
+    np.testing.assert_array_equal(stats.min, values.min(axis=0))
+    np.testing.assert_array_equal(stats.max, values.max(axis=0))
+
+
+def test_image_stats_from_histograms():
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 200, size=(3, 48, 64, 3), dtype=np.uint8)
+    stats = RunningStats(reduce_axes=(0, 1, 2), scale=1 / 255)
+    for image in images:
+        stats.update(image[None])
+    values = images / 255
+    np.testing.assert_allclose(stats.mean, values.mean(axis=(0, 1, 2)))
+    np.testing.assert_allclose(stats.std, values.std(axis=(0, 1, 2)))
+    np.testing.assert_allclose(stats.min, values.min(axis=(0, 1, 2)))
+    np.testing.assert_allclose(stats.max, values.max(axis=(0, 1, 2)))
+
+
+def test_merged_stats_match_single_stream(tmp_path):
+    rng = np.random.default_rng(0)
+    frames = [
+        {
+            "image_front": rng.integers(0, 255, size=(6, 8, 3), dtype=np.uint8),
+            "arm_qpos": rng.standard_normal(6),
+            "name": "not numeric",
+        }
+        for _ in range(20)
+    ]
+    single = DictRunningStats()
+    workers = [DictRunningStats(), DictRunningStats()]
+    for t, frame in enumerate(frames):
+        single.update_frame(frame)
+        workers[t % 2].update_frame(frame)
+    workers[1].save(tmp_path / "stats.npz")
+    merged = workers[0].merge(DictRunningStats.load(tmp_path / "stats.npz"))
+
+    assert sorted(merged.stats) == ["arm_qpos", "image_front"]
+    images = np.stack([frame["image_front"] for frame in frames]) / 255
+    for stats in [single.to_dict(), merged.to_dict()]:
+        assert stats["image_front"]["mean"].shape == (3,)
+        np.testing.assert_allclose(stats["image_front"]["mean"], images.mean(axis=(0, 1, 2)))
+        np.testing.assert_allclose(stats["image_front"]["std"], images.std(axis=(0, 1, 2)))
+        np.testing.assert_allclose(stats["image_front"]["max"], images.max(axis=(0, 1, 2)))
+        np.testing.assert_allclose(stats["arm_qpos"]["std"], np.std([frame["arm_qpos"] for frame in frames], axis=0))
+
+
+def test_running_stats_wrapper():
+    env = RunningStatsWrapper(ReachCubeEnv(observation_mode="state"))
+    observation, _ = env.reset(seed=0)
+    qpos = [observation["arm_qpos"]]
+    for _ in range(5):
+        observation, *_ = env.step(env.action_space.sample())
+        qpos.append(observation["arm_qpos"])
+    stats = env.get_stats()
+    assert env.stats.stats["arm_qpos"].count == 6 and env.stats.stats["action"].count == 5
+    np.testing.assert_allclose(stats["arm_qpos"]["mean"], np.mean(qpos, axis=0, dtype=np.float64))
@@ -0,0 +1,126 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+
+import gym_lowcostrobot  # noqa
+from gym_lowcostrobot.vector import (
+    LiftCubeVectorEnv,
+    PushCubeLoopVectorEnv,
+    PushCubeVectorEnv,
+    ReachCubeVectorEnv,
+    SharedMemoryVectorEnv,
+)
+
+
+@pytest.mark.parametrize("action_mode", ["joint", "ee"])
+@pytest.mark.parametrize(
+    "vector_env_class", [LiftCubeVectorEnv, PushCubeVectorEnv, ReachCubeVectorEnv, PushCubeLoopVectorEnv]
+)
+def test_batched_env_matches_single_env(vector_env_class, action_mode):
+    num_envs = 3
+    vector_env = vector_env_class(num_envs, action_mode=action_mode)
+    envs = [vector_env_class.env_class(observation_mode="state", action_mode=action_mode) for _ in range(num_envs)]
+
+    observations, _ = vector_env.reset(seed=0)
+    for index, env in enumerate(envs):
+        observation, _ = env.reset(seed=index)
+        for key, value in observation.items():
+            np.testing.assert_allclose(observations[key][index], value)
+
+    actions = vector_env.action_space.sample()
+    for _ in range(5):
+        observations, rewards, _, _, _ = vector_env.step(actions)
+        for index, env in enumerate(envs):
+            observation, reward, _, _, _ = env.step(actions[index])
+            for key, value in observation.items():
+                np.testing.assert_allclose(observations[key][index], value, rtol=1e-5, atol=1e-6)
+            np.testing.assert_allclose(rewards[index], reward, rtol=1e-5, atol=1e-6)
+
+    vector_env.close()
+    for env in envs:
+        env.close()
+
+
+@pytest.mark.parametrize("copy", [True, False])
+def test_batched_env_autoreset(copy):
+    vector_env = LiftCubeVectorEnv(2, max_episode_steps=3, copy=copy)
+    assert vector_env.observation_space["arm_qpos"].shape == (2, 6)
+    vector_env.reset(seed=0)
+    actions = np.zeros((2, 6), dtype=np.float32)
+    for _ in range(2):
+        _, _, _, truncateds, infos = vector_env.step(actions)
+        assert not truncateds.any() and "final_observation" not in infos
+    observations, _, _, truncateds, infos = vector_env.step(actions)
+    assert truncateds.all()
+    assert infos["_final_observation"].all()
+    assert infos["_is_success"].all() and infos["_final_info"].all()
+    # The final observation is kept apart from the observation of the new episodes, as a dict per world
+    for index, final_observation in enumerate(infos["final_observation"]):
+        assert "is_success" in infos["final_info"][index]
+        for key, value in final_observation.items():
+            assert not np.shares_memory(value, observations[key])
+        assert not np.array_equal(final_observation["arm_qvel"], observations["arm_qvel"][index])
+    vector_env.close()
+
+
+def test_threaded_stepping_is_deterministic():
+    actions = np.random.default_rng(0).uniform(-1.0, 1.0, size=(5, 6))
+    results = []
+    for num_threads in [1, 2, 3]:
+        vector_env = LiftCubeVectorEnv(5, num_threads=num_threads)
+        vector_env.reset(seed=0)
+        for _ in range(3):
+            observations, rewards, _, _, _ = vector_env.step(actions)
+        results.append((observations, rewards))
+        vector_env.close()
+    for observations, rewards in results[1:]:
+        np.testing.assert_array_equal(rewards, results[0][1])
+        for key, value in observations.items():
+            np.testing.assert_array_equal(value, results[0][0][key])
+
+
+def test_shared_memory_env_returns_ring_buffer_views():
+    env_fns = [lambda: gym.make("LiftCube-v0", observation_mode="state", max_episode_steps=2)] * 2
+    vector_env = SharedMemoryVectorEnv(env_fns, buffer_depth=2)
+    observations, _ = vector_env.reset(seed=0)
+    assert observations["arm_qpos"].shape == (2, 6)
+    assert observations["arm_qpos"].base is not None
+
+    single_env = gym.make("LiftCube-v0", observation_mode="state")
+    observation, _ = single_env.reset(seed=1)
+    np.testing.assert_allclose(observations["cube_pos"][1], observation["cube_pos"])
+
+    actions = np.zeros((2, 6), dtype=np.float32)
+    next_observations, _, _, truncateds, _ = vector_env.step(actions)
+    assert not truncateds.any()
+    assert not np.shares_memory(observations["arm_qpos"], next_observations["arm_qpos"])
+    _, _, _, truncateds, infos = vector_env.step(actions)
+    assert truncateds.all() and infos["_final_observation"].all()
+
+    single_env.close()
+    vector_env.close()
+
+
+def test_shared_memory_env_images():
+    def make_env():
+        return gym.make("LiftCube-v0", observation_mode="image", reuse_buffers=True, max_episode_steps=2)
+
+    vector_env = SharedMemoryVectorEnv([make_env] * 2)
+    reference_envs = [make_env() for _ in range(2)]
+    observations, _ = vector_env.reset(seed=0)
+    for index, env in enumerate(reference_envs):
+        observation, _ = env.reset(seed=index)
+        for key in ["image_front", "image_top"]:
+            np.testing.assert_array_equal(observations[key][index], observation[key])
+
+    actions = np.zeros((2, 6), dtype=np.float32)
+    vector_env.step(actions)
+    _, _, _, truncateds, infos = vector_env.step(actions)
+    assert truncateds.all()
+    for index, env in enumerate(reference_envs):
+        env.step(actions[index])
+        final_observation, *_ = env.step(actions[index])
+        for key in ["image_front", "image_top", "arm_qpos"]:
+            np.testing.assert_array_equal(infos["final_observation"][index][key], final_observation[key])
+        env.close()
+    vector_env.close()
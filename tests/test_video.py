@@ -0,0 +1,50 @@
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from gym_lowcostrobot.video import VideoEncoder, VideoRecorder, get_measured_fps, wait_for_frame
+
+
+def test_wait_for_frame_paces_the_recording():
+    start_time = time.perf_counter()
+    timestamps = [wait_for_frame(start_time, frame_index, fps=100) for frame_index in range(6)]
+
+    assert all(timestamp >= frame_index / 100 for frame_index, timestamp in enumerate(timestamps))
+    assert get_measured_fps(timestamps) <= 100
+    assert np.isnan(get_measured_fps(timestamps[:1]))
+
+
+def test_video_recorder_requires_episode(tmp_path):
+    recorder = VideoRecorder(tmp_path, ["image_front"], fps=30)
+    with pytest.raises(RuntimeError):
+        recorder.add_frame({"image_front": np.zeros((8, 8, 3), dtype=np.uint8)})
+
+
+def test_video_encoder_reports_ffmpeg_errors(tmp_path):
+    # Any executable rejecting the ffmpeg arguments makes the encoder fail
+    encoder = VideoEncoder(str(tmp_path / "video.mp4"), 8, 8, 30, ffmpeg_path=sys.executable)
+    with pytest.raises(RuntimeError):
+        for _ in range(10):
+            encoder.write(np.zeros((8, 8, 3), dtype=np.uint8))
+        encoder.close()
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_video_recorder_writes_videos(tmp_path):
+    rng = np.random.default_rng(0)
+    recorder = VideoRecorder(tmp_path, ["image_front", "image_top"], fps=30, vcodec="libx264")
+    recorder.start_episode(0)
+    for _ in range(12):
+        recorder.add_frame({key: rng.integers(0, 255, size=(48, 64, 3), dtype=np.uint8) for key in recorder.keys})
+    paths = recorder.end_episode()
+
+    assert sorted(paths) == ["image_front", "image_top"]
+    for path in paths.values():
+        command = ["ffprobe", "-v", "error", "-count_frames", "-of", "csv=p=0"]
+        command += ["-show_entries", "stream=width,nb_read_frames", path]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        assert output.strip() == "64,12"